@@ -0,0 +1,116 @@
+"""Проверка доступа к календарям без загрузки calendar.members.
+
+Роль пользователя (owner / member) для набора календарей определяется
+одним запросом и запоминается в flask.g до конца запроса, так что
+повторные проверки в маршруте и шаблоне бесплатны.
+"""
+from flask import g
+from flask_login import current_user
+from sqlalchemy import and_, exists, select
+
+from models import db, Calendar, User, calendar_members
+
+ROLE_OWNER = 'owner'
+ROLE_MEMBER = 'member'
+
+
+def _roles_cache():
+    if 'calendar_roles' not in g:
+        g.calendar_roles = {}
+    return g.calendar_roles
+
+
+def _normalize_ids(calendar_ids):
+    ids = []
+    for calendar_id in calendar_ids:
+        try:
+            ids.append(int(calendar_id))
+        except (TypeError, ValueError):
+            continue
+    return list(dict.fromkeys(ids))
+
+
+def resolve_calendar_roles(calendar_ids, user_id=None):
+    """Роли пользователя в календарях: {calendar_id: 'owner' | 'member'}.
+
+    Недоступные и несуществующие календари в результат не попадают.
+    Календари, которых ещё нет в кэше запроса, проверяются одним запросом.
+    """
+    user_id = current_user.id if user_id is None else user_id
+    ids = _normalize_ids(calendar_ids)
+    cache = _roles_cache()
+
+    missing = [calendar_id for calendar_id in ids if (user_id, calendar_id) not in cache]
+    if missing:
+        rows = db.session.execute(
+            select(Calendar.id, Calendar.owner_id, calendar_members.c.user_id)
+            .outerjoin(calendar_members, and_(
+                calendar_members.c.calendar_id == Calendar.id,
+                calendar_members.c.user_id == user_id
+            ))
+            .where(Calendar.id.in_(missing))
+        )
+        for calendar_id, owner_id, member_id in rows:
+            if owner_id == user_id:
+                cache[(user_id, calendar_id)] = ROLE_OWNER
+            elif member_id is not None:
+                cache[(user_id, calendar_id)] = ROLE_MEMBER
+        for calendar_id in missing:
+            cache.setdefault((user_id, calendar_id), None)
+
+    return {
+        calendar_id: cache[(user_id, calendar_id)]
+        for calendar_id in ids
+        if cache[(user_id, calendar_id)] is not None
+    }
+
+
+def calendar_role(calendar_id, user_id=None):
+    """Роль пользователя в календаре или None, если доступа нет."""
+    return resolve_calendar_roles([calendar_id], user_id).get(int(calendar_id))
+
+
+def can_access_calendar(calendar, user_id=None):
+    """Владелец или участник календаря. Владельца определяем без запроса."""
+    user_id = current_user.id if user_id is None else user_id
+    if calendar.owner_id == user_id:
+        # Запоминаем роль, чтобы calendar_role() в шаблоне тоже обошёлся без запроса
+        _roles_cache()[(user_id, calendar.id)] = ROLE_OWNER
+        return True
+    return calendar_role(calendar.id, user_id) is not None
+
+
+def is_calendar_member(calendar_id, user_id):
+    """Состоит ли другой пользователь в календаре — один EXISTS без кэша."""
+    return db.session.query(exists().where(
+        calendar_members.c.calendar_id == calendar_id,
+        calendar_members.c.user_id == user_id
+    )).scalar()
+
+
+def calendar_member_ids(calendar_id):
+    """Множество id участников календаря (без владельца) — для проверки списков."""
+    return set(db.session.execute(
+        select(calendar_members.c.user_id).where(calendar_members.c.calendar_id == calendar_id)
+    ).scalars())
+
+
+def users_by_ids(user_ids):
+    """{id из запроса: User} одним запросом вместо User.query.get в цикле.
+
+    Ненайденных и некорректных id в словаре нет.
+    """
+    user_ids = list(user_ids)
+    ids = _normalize_ids(user_ids)
+    if not ids:
+        return {}
+    found = {user.id: user for user in User.query.filter(User.id.in_(ids))}
+    result = {}
+    for user_id in user_ids:
+        try:
+            user = found.get(int(user_id))
+        except (TypeError, ValueError):
+            continue
+        if user is not None:
+            result[user_id] = user
+    return result
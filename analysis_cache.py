@@ -0,0 +1,107 @@
+"""Кэш результатов /api/analysis-data.
+
+Ключ — календари, период, месяц, фильтры, сравнение и область видимости
+(все смены или только свои). Вместе с результатом хранятся версии
+календарей (Calendar.version): любая запись смен увеличивает версию через
+record_shift_changes, и запись с устаревшими версиями при следующем
+чтении считается промахом и выбрасывается. Так инвалидация работает
+и между процессами, хотя сам кэш у каждого процесса свой.
+
+Размер ограничен (LRU), у записей есть TTL — он же ограничивает
+устаревание того, что версиями не отслеживается (имена пользователей,
+названия шаблонов). Хранится готовое JSON-тело ответа.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from models import db, Calendar
+
+
+def calendar_versions(calendar_ids):
+    """{calendar_id: version} одним запросом."""
+    return dict(db.session.execute(
+        select(Calendar.id, Calendar.version).where(Calendar.id.in_(calendar_ids))
+    ).all())
+
+
+def analysis_cache_key(calendar_ids, period, month, filters, comparison, only_user_id):
+    """Ключ без версий: одинаковые запросы разных владельцев делят запись."""
+    return (
+        tuple(sorted(calendar_ids)), period, month,
+        json.dumps(filters or {}, sort_keys=True, default=str),
+        json.dumps(comparison or None, sort_keys=True, default=str),
+        only_user_id
+    )
+
+
+class AnalysisCache:
+    """LRU с TTL; значения сверяются с версиями календарей."""
+
+    def __init__(self, max_size=128, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (versions, expires_at, body)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def configure(self, max_size, ttl):
+        with self._lock:
+            self.max_size = max_size
+            self.ttl = ttl
+            self._evict()
+
+    def get(self, key, versions):
+        """Тело ответа или None (нет, истёк TTL, изменились версии)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_versions, expires_at, body = entry
+                if entry_versions == versions and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return body
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, versions, body):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (versions, time.monotonic() + self.ttl, body)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > max(self.max_size, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0
+            }
+
+
+analysis_cache = AnalysisCache()
@@ -0,0 +1,659 @@
+"""Аналитика смен для /api/analysis-data.
+
+Все разделы ответа (shift_stats, team_analysis, time_slots,
+work_time_distribution, weekday_activity, coverage_heatmap) основного периода и, если
+запрошено, периода сравнения считаются из одного набора строк: смены этих
+периодов выбираются одним запросом в виде кортежей, без ORM-объектов,
+и складываются в колоночный ShiftFrame (shift_frame.py): агрегаты —
+свёртки по колонкам дня недели, пользователя, даты, шаблона. Длительность
+берётся из Shift.duration_minutes, фильтр длительности — условие в SQL.
+
+Тренды (12 периодов до выбранного) строятся одним запросом по всему их
+диапазону: строки (день, пользователь) из дневной сводки shift_daily_rollup
+(rollup.py), а с фильтром длительности — из смен, сгруппированных в SQL;
+дни раскладываются по периодам поиском по началам периодов. Отдельные запросы —
+данные пользователей для рейтинга и нормы численности (StaffingTarget)
+для покрытия: люди на смене в день против нормы на этот день недели.
+"""
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, case, func, or_, select
+
+from heatmap import coverage_heatmap
+from models import db, Shift, ShiftDailyRollup, ShiftTemplate, StaffingTarget, User
+from rollup import NO_USER as ROLLUP_NO_USER
+from shift_frame import NO_CATEGORY, NO_USER, ShiftFrame, distinct_count, group_sum, period_index
+
+RUSSIAN_MONTHS = {
+    1: 'Январь', 2: 'Февраль', 3: 'Март', 4: 'Апрель',
+    5: 'Май', 6: 'Июнь', 7: 'Июль', 8: 'Август',
+    9: 'Сентябрь', 10: 'Октябрь', 11: 'Ноябрь', 12: 'Декабрь'
+}
+RUSSIAN_MONTHS_SHORT = {
+    1: 'Янв', 2: 'Фев', 3: 'Мар', 4: 'Апр',
+    5: 'Май', 6: 'Июн', 7: 'Июл', 8: 'Авг',
+    9: 'Сен', 10: 'Окт', 11: 'Ноя', 12: 'Дек'
+}
+
+TREND_PERIODS = 12
+
+# Фильтр длительности: короткие < 4 ч, средние 4–8 ч, длинные > 8 ч
+DURATION_FILTERS = {
+    'short': lambda: Shift.duration_minutes < 4 * 60,
+    'medium': lambda: Shift.duration_minutes.between(4 * 60, 8 * 60),
+    'long': lambda: Shift.duration_minutes > 8 * 60,
+}
+
+
+def duration_condition(duration):
+    """SQL-условие фильтра длительности или None, если фильтра нет."""
+    condition = DURATION_FILTERS.get(duration)
+    return condition() if condition else None
+
+
+def _empty_sections():
+    """Ответ раздела, если его не удалось посчитать."""
+    return {
+        'shift_stats': {'total_hours': 0, 'total_shifts': 0, 'avg_duration': 0, 'top_template': None},
+        'team_analysis': {'activity_ranking': [], 'coverage_data': [], 'workload_balance': {'labels': [], 'values': []}},
+        'time_slots': {'morning': {'percentage': 0}, 'day': {'percentage': 0}, 'evening': {'percentage': 0}, 'night': {'percentage': 0}},
+        'work_time_distribution': {'labels': [], 'values': []},
+        'weekday_activity': {'hours': [0] * 7},
+        'coverage_heatmap': {'slot_minutes': 60, 'labels': [], 'weekday': {'labels': [], 'average': [], 'peak': []}, 'dates': []},
+        'trends_data': {'hours': {'labels': [], 'values': []}, 'shifts': {'labels': [], 'values': []}, 'people': {'labels': [], 'values': []}},
+    }
+
+
+# Диапазоны периодов
+
+def get_week_range(month_str):
+    """Неделя: '2025-W35' или (старый формат) неделя первого дня месяца '2025-08'."""
+    try:
+        if 'W' in month_str:
+            year, week = month_str.split('-W')
+            day = datetime.strptime(f'{year}-W{week.zfill(2)}-1', '%Y-W%W-%w').date()
+        else:
+            day = datetime.strptime(month_str, '%Y-%m').date()
+    except ValueError:
+        day = datetime.utcnow().date()
+    start_date = day - timedelta(days=day.weekday())
+    return start_date, start_date + timedelta(days=6)
+
+
+def _month_bounds(year, month):
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def get_month_range(month_str):
+    """Месяц '2025-08'."""
+    try:
+        day = datetime.strptime(month_str, '%Y-%m').date()
+    except ValueError:
+        day = datetime.utcnow().date()
+    return _month_bounds(day.year, day.month)
+
+
+def _quarter_bounds(year, quarter):
+    start_month = (quarter - 1) * 3 + 1
+    return date(year, start_month, 1), _month_bounds(year, start_month + 2)[1]
+
+
+def get_quarter_range(month_str):
+    """Квартал '2025-Q3' или квартал месяца '2025-08'."""
+    try:
+        if 'Q' in month_str:
+            year, quarter = month_str.split('-Q')
+            return _quarter_bounds(int(year), int(quarter))
+        day = datetime.strptime(month_str, '%Y-%m').date()
+    except ValueError:
+        day = datetime.utcnow().date()
+    return _quarter_bounds(day.year, (day.month - 1) // 3 + 1)
+
+
+def get_year_range(month_str):
+    """Год '2025' или год месяца '2025-08'."""
+    try:
+        if len(month_str) == 4 and month_str.isdigit():
+            year = int(month_str)
+        else:
+            year = datetime.strptime(month_str, '%Y-%m').date().year
+    except (ValueError, TypeError):
+        year = datetime.utcnow().year
+    return date(year, 1, 1), date(year, 12, 31)
+
+
+def period_range(period, month):
+    """(start_date, end_date) периода week / month / quarter / year."""
+    if period == 'week':
+        return get_week_range(month)
+    if period == 'quarter':
+        return get_quarter_range(month)
+    if period == 'year':
+        return get_year_range(month)
+    return get_month_range(month)
+
+
+def _trend_base_date(period, month):
+    try:
+        if period == 'week' and 'W' in month:
+            year, week = month.split('-W')
+            return datetime.strptime(f'{year}-W{week.zfill(2)}-1', '%Y-W%W-%w').date()
+        if period == 'quarter' and 'Q' in month:
+            year, quarter = month.split('-Q')
+            return date(int(year), (int(quarter) - 1) * 3 + 1, 1)
+        if period == 'year' and len(month) == 4:
+            return date(int(month), 1, 1)
+        return datetime.strptime(month, '%Y-%m').date()
+    except ValueError as e:
+        current_app.logger.warning(f'Trends: не удалось разобрать период {month!r}: {e}')
+        return datetime.utcnow().date()
+
+
+def trend_periods(period, month, count=TREND_PERIODS):
+    """[(label, start_date, end_date)] — count периодов до выбранного включительно, по возрастанию."""
+    base_date = _trend_base_date(period, month)
+    periods = []
+    for back in range(count - 1, -1, -1):
+        if period == 'week':
+            target = base_date - timedelta(weeks=back)
+            start_date = target - timedelta(days=target.weekday())
+            end_date = start_date + timedelta(days=6)
+            label = f"Неделя {start_date.strftime('%d.%m')} - {end_date.strftime('%d.%m.%Y')}"
+        elif period == 'month':
+            index = base_date.year * 12 + base_date.month - 1 - back
+            year, month_num = divmod(index, 12)
+            start_date, end_date = _month_bounds(year, month_num + 1)
+            label = f'{RUSSIAN_MONTHS_SHORT[month_num + 1]} {year}'
+        elif period == 'quarter':
+            index = base_date.year * 4 + (base_date.month - 1) // 3 - back
+            year, quarter = divmod(index, 4)
+            start_date, end_date = _quarter_bounds(year, quarter + 1)
+            label = f'Q{quarter + 1} {year}'
+        elif period == 'year':
+            year = base_date.year - back
+            start_date, end_date = date(year, 1, 1), date(year, 12, 31)
+            label = str(year)
+        else:
+            return []
+        periods.append((label, start_date, end_date))
+    return periods
+
+
+# Загрузка смен
+
+def _merge_ranges(ranges):
+    merged = []
+    for start_date, end_date in sorted(ranges):
+        if merged and start_date <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end_date)
+        else:
+            merged.append([start_date, end_date])
+    return merged
+
+
+def _shift_types(filters):
+    shift_types = filters.get('shiftType')
+    if isinstance(shift_types, str):
+        shift_types = [shift_types]
+    return [shift_type for shift_type in shift_types or [] if shift_type]
+
+
+def shift_rows_statement(calendar_ids, ranges, filters=None, only_user_id=None):
+    """SELECT строк смен для аналитики: кортежи вместо ORM-объектов.
+
+    ranges — список (start_date, end_date); пересекающиеся склеиваются,
+    между несмежными данные не читаются. Фильтры users и shiftType
+    (по color_class смены) и длительности применяются в SQL.
+    """
+    statement = (
+        select(Shift.id, Shift.user_id, Shift.date, Shift.start_time, Shift.end_time,
+               Shift.show_time, Shift.title, Shift.color_class, Shift.duration_minutes,
+               ShiftTemplate.title.label('template_title'))
+        .outerjoin(ShiftTemplate, ShiftTemplate.id == Shift.template_id)
+        .where(Shift.calendar_id.in_(calendar_ids))
+        .where(or_(*(and_(Shift.date >= start_date, Shift.date <= end_date)
+                     for start_date, end_date in _merge_ranges(ranges))))
+        .order_by(Shift.date, Shift.id)
+    )
+    if only_user_id is not None:
+        statement = statement.where(Shift.user_id == only_user_id)
+
+    filters = filters or {}
+    if filters.get('users'):
+        statement = statement.where(Shift.user_id.in_(filters['users']))
+    shift_types = _shift_types(filters)
+    if shift_types:
+        statement = statement.where(Shift.color_class.in_(shift_types))
+    condition = duration_condition(filters.get('duration'))
+    if condition is not None:
+        statement = statement.where(condition)
+    return statement
+
+
+def trend_rows_statement(calendar_ids, ranges, filters=None, only_user_id=None):
+    """SELECT (date, user_id, смены со временем, минуты) по дням для трендов.
+
+    Без фильтра длительности читается дневная сводка, с ним — смены,
+    сгруппированные в SQL так же: сводка не знает длительность отдельных смен.
+    Смены без пользователя входят в часы и смены, как в shift_stats, но не в
+    число людей; их user_id — None у смен и rollup.NO_USER у сводки.
+    Строк не больше, чем дней × пользователей, при любом числе смен.
+    """
+    filters = filters or {}
+    condition = duration_condition(filters.get('duration'))
+    if condition is None:
+        source = ShiftDailyRollup
+        timed_shifts = func.sum(source.timed_shift_count)
+        minutes = func.sum(source.minutes)
+    else:
+        source = Shift
+        timed_shifts = func.sum(case((Shift.show_time.is_(True), 1), else_=0))
+        minutes = func.sum(case((Shift.show_time.is_(True), Shift.duration_minutes), else_=0))
+    statement = (
+        select(source.date, source.user_id, timed_shifts, minutes)
+        .where(source.calendar_id.in_(calendar_ids))
+        .where(or_(*(and_(source.date >= start_date, source.date <= end_date)
+                     for start_date, end_date in _merge_ranges(ranges))))
+        .group_by(source.date, source.user_id)
+    )
+    if condition is not None:
+        statement = statement.where(condition)
+    if only_user_id is not None:
+        statement = statement.where(source.user_id == only_user_id)
+    if filters.get('users'):
+        statement = statement.where(source.user_id.in_(filters['users']))
+    shift_types = _shift_types(filters)
+    if shift_types:
+        statement = statement.where(source.color_class.in_(shift_types))
+    return statement
+
+
+# Агрегаты
+
+class _RangeStats:
+    """Накопители разделов за один диапазон дат."""
+
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.total_shifts = 0
+        self.timed_shifts = 0
+        self.total_minutes = 0
+        self.template_usage = {}
+        self.user_minutes = {}       # user_id -> минуты, в порядке первой смены
+        self.user_timed_shifts = {}
+        self.day_shifts = {}         # порядковый номер даты -> число смен
+        self.day_headcount = {}      # порядковый номер даты -> людей на смене
+        self.staffing = {}           # день недели -> норма численности по выбранным календарям
+        self.weekday_minutes = [0] * 7
+        self.slots = {}
+        # Интервалы смен со временем для тепловой карты: день от начала периода, минута начала, длительность
+        self.duty_days = []
+        self.duty_starts = []
+        self.duty_minutes = []
+
+    def load(self, frame, duty_frame=None):
+        """Агрегаты из ShiftFrame смен этого диапазона — свёртками по колонкам.
+
+        duty_frame — смены с накануне периода по его конец: ночные смены
+        предыдущего дня добавляют свой хвост в тепловую карту первого дня.
+        """
+        timed = frame.timed()
+        assigned = frame.with_user()
+        timed_assigned = timed.with_user()
+
+        self.total_shifts = len(frame)
+        self.timed_shifts = len(timed)
+        self.total_minutes = timed.total('durations')
+        self.template_usage = {
+            frame.templates[code]: count
+            for code, count in group_sum(timed.template_codes).items() if code != NO_CATEGORY
+        }
+        weekday_minutes = group_sum(timed.weekdays(), timed.durations)
+        self.weekday_minutes = [weekday_minutes.get(weekday, 0) for weekday in range(7)]
+
+        # Пользователи — в порядке первой смены, в том числе без времени
+        self.user_minutes = dict.fromkeys(group_sum(assigned.user_ids), 0)
+        self.user_timed_shifts = dict.fromkeys(self.user_minutes, 0)
+        self.user_minutes.update(group_sum(timed_assigned.user_ids, timed_assigned.durations))
+        self.user_timed_shifts.update(group_sum(timed_assigned.user_ids))
+        self.day_shifts = group_sum(assigned.ordinals)
+        self.day_headcount = distinct_count(assigned.ordinals, assigned.user_ids)
+
+        duties = timed_assigned if duty_frame is None else duty_frame.timed().with_user()
+        duties = duties.ending_after(self.start_date)
+        self.duty_days = duties.day_offsets(self.start_date)
+        self.duty_starts = duties.start_minutes
+        self.duty_minutes = duties.durations
+
+        self._load_slots(frame)
+
+    def _load_slots(self, frame):
+        # Раздел отдаёт каждую смену, поэтому здесь проход по строкам
+        dates = {}
+        rows = zip(
+            frame.tolist('ids'), frame.tolist('user_ids'), frame.tolist('ordinals'), frame.tolist('show_time'),
+            frame.tolist('title_codes'), frame.tolist('color_codes'), frame.start_times, frame.end_times
+        )
+        for shift_id, user_id, ordinal, show_time, title_code, color_code, start_time, end_time in rows:
+            title = frame.titles[title_code]
+            if show_time:
+                time_range = f"{start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}"
+            else:
+                time_range = 'Без времени'
+            slot_key = f'{title}|{time_range}'
+            slot = self.slots.get(slot_key)
+            if slot is None:
+                slot = self.slots[slot_key] = {'title': title, 'color_class': frame.colors[color_code], 'shifts': []}
+            day = dates.get(ordinal)
+            if day is None:
+                day = dates[ordinal] = date.fromordinal(ordinal).strftime('%Y-%m-%d')
+            slot['shifts'].append({
+                'id': shift_id,
+                'title': title,
+                'date': day,
+                'user_id': None if user_id == NO_USER else user_id
+            })
+
+    def shift_stats(self, users):
+        top_template = max(self.template_usage.items(), key=lambda item: item[1])[0] if self.template_usage else None
+        return {
+            'total_hours': round(self.total_minutes / 60, 1),
+            'total_shifts': self.timed_shifts,
+            'avg_duration': round(self.total_minutes / self.timed_shifts) if self.timed_shifts else 0,
+            'top_template': top_template
+        }
+
+    def _ranking(self, users):
+        ranking = []
+        for user_id, minutes in self.user_minutes.items():
+            user = users.get(user_id)
+            if user is None:
+                continue
+            ranking.append({
+                'id': user.id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'avatar': user.avatar,
+                'total_hours': round(minutes / 60, 1),
+                'total_shifts': self.user_timed_shifts[user_id]
+            })
+        ranking.sort(key=lambda item: item['total_hours'], reverse=True)
+        return ranking
+
+    def team_analysis(self, users):
+        activity_ranking = self._ranking(users)
+        coverage_data = []
+        current_date = self.start_date
+        while current_date <= self.end_date:
+            shifts_count = self.day_shifts.get(current_date.toordinal(), 0)
+            headcount = self.day_headcount.get(current_date.toordinal(), 0)
+            required = self.staffing.get(current_date.weekday())
+            if required:
+                coverage_percent = min(100, round(headcount / required * 100))
+            else:
+                coverage_percent = min(100, shifts_count * 20)  # Нормы нет — упрощённо: 5 смен в день — 100%
+            coverage_data.append({
+                'day': current_date.day,
+                'month': current_date.month,
+                'month_name': RUSSIAN_MONTHS[current_date.month],
+                'full_date': current_date.strftime('%Y-%m-%d'),
+                'coverage_percent': coverage_percent,
+                'shifts_count': shifts_count,
+                'headcount': headcount,
+                'required': required or None
+            })
+            current_date += timedelta(days=1)
+        return {
+            'activity_ranking': activity_ranking,
+            'coverage_data': coverage_data,
+            'workload_balance': {
+                'labels': [f"{u['first_name']} {u['last_name']}" for u in activity_ranking[:10]],
+                'values': [u['total_hours'] for u in activity_ranking[:10]]
+            }
+        }
+
+    def time_slots(self, users):
+        if not self.total_shifts:
+            return {'templates': []}
+        templates = [{
+            'title': slot['title'],
+            'time_range': slot_key,
+            'percentage': len(slot['shifts']) / self.total_shifts * 100,
+            'count': len(slot['shifts']),
+            'color_class': slot['color_class'],
+            'shifts': slot['shifts']
+        } for slot_key, slot in self.slots.items()]
+        templates.sort(key=lambda item: (-item['count'], item['title']))
+        return {'templates': templates}
+
+    def work_time_distribution(self, users):
+        top = sorted(
+            ((users[user_id], minutes) for user_id, minutes in self.user_minutes.items() if user_id in users),
+            key=lambda item: item[1], reverse=True
+        )[:6]
+        return {
+            'labels': [f'{user.first_name} {user.last_name}' for user, _ in top],
+            'values': [round(minutes / 60, 1) for _, minutes in top]
+        }
+
+    def weekday_activity(self, users):
+        return {'hours': [round(minutes / 60, 1) for minutes in self.weekday_minutes]}
+
+    def coverage_heatmap(self, users):
+        """Люди на смене по слотам суток: по датам периода и по дням недели.
+
+        Ночная смена накануне периода учитывается утром первого дня,
+        хвост ночной смены последнего дня за концом периода отбрасывается.
+        """
+        return coverage_heatmap(
+            self.start_date, (self.end_date - self.start_date).days + 1,
+            self.duty_days, self.duty_starts, self.duty_minutes,
+            current_app.config.get('ANALYSIS_HEATMAP_SLOT_MINUTES', 60)
+        )
+
+    def sections(self, users):
+        """Разделы ответа; ошибка в одном разделе не ломает остальные."""
+        fallback = _empty_sections()
+        result = {}
+        for name in ('shift_stats', 'team_analysis', 'time_slots', 'work_time_distribution', 'weekday_activity',
+                     'coverage_heatmap'):
+            try:
+                result[name] = getattr(self, name)(users)
+            except Exception as e:
+                current_app.logger.error(f'Error in {name}: {e}')
+                result[name] = fallback[name]
+        return result
+
+
+class _TrendBuckets:
+    """Часы, смены и люди по периодам трендов."""
+
+    def __init__(self, periods):
+        self.labels = [label for label, _, _ in periods]
+        self.starts = [start_date for _, start_date, _ in periods]
+        self.ends = [end_date for _, _, end_date in periods]
+        self.minutes = [0] * len(periods)
+        self.timed_shifts = [0] * len(periods)
+        self.people = [0] * len(periods)
+
+    def add_columns(self, ordinals, user_ids, timed_shifts, minutes):
+        """Дневные строки трендов по колонкам: период каждой даты — searchsorted/bisect.
+
+        Строки смен без пользователя (NO_USER) входят в часы и смены, но не в людей.
+        """
+        index = period_index(
+            ordinals, [day.toordinal() for day in self.starts], [day.toordinal() for day in self.ends]
+        )
+        people_index = [-1 if user_id == NO_USER else period for period, user_id in zip(index, user_ids)]
+        for totals, sums in ((self.minutes, group_sum(index, minutes)),
+                             (self.timed_shifts, group_sum(index, timed_shifts)),
+                             (self.people, distinct_count(people_index, user_ids))):
+            for period, value in sums.items():
+                if period >= 0:
+                    totals[period] += value
+
+    def result(self):
+        return {
+            'hours': {'labels': list(self.labels), 'values': [round(minutes / 60, 1) for minutes in self.minutes]},
+            'shifts': {'labels': list(self.labels), 'values': list(self.timed_shifts)},
+            'people': {'labels': list(self.labels), 'values': list(self.people)}
+        }
+
+
+def _load_users(user_ids):
+    if not user_ids:
+        return {}
+    rows = db.session.execute(
+        select(User.id, User.username, User.first_name, User.last_name, User.avatar)
+        .where(User.id.in_(user_ids))
+    )
+    return {row.id: row for row in rows}
+
+
+def staffing_by_weekday(calendar_ids):
+    """{день недели: норма численности} — сумма норм выбранных календарей."""
+    return dict(db.session.execute(
+        select(StaffingTarget.weekday, func.sum(StaffingTarget.required))
+        .where(StaffingTarget.calendar_id.in_(calendar_ids))
+        .group_by(StaffingTarget.weekday)
+    ).all())
+
+
+def profile_shift_totals(user_id):
+    """(число смен со временем, часы) пользователя для профиля — один SUM в SQL."""
+    count, minutes = db.session.execute(
+        select(func.count(Shift.id), func.coalesce(func.sum(Shift.duration_minutes), 0))
+        .where(Shift.user_id == user_id, Shift.show_time.is_(True))
+    ).one()
+    return count, minutes / 60
+
+
+def run_analysis_tasks(tasks):
+    """Выполняет независимые задачи {имя: функция} по очереди; возвращает множество имён упавших.
+
+    Ошибка задачи пишется в лог и не прерывает остальные: разделы упавшей
+    задачи отдаются пустыми.
+    """
+    failed = set()
+    for name, task in tasks.items():
+        try:
+            task()
+        except Exception as e:
+            current_app.logger.error(f'Error in analysis {name}: {e}')
+            failed.add(name)
+    return failed
+
+
+def analysis_scope(user_id, user_calendar_roles):
+    """id пользователя, если он видит только свои смены (не владелец ни одного календаря), иначе None."""
+    if user_id and user_calendar_roles and not any(role == 'creator' for role in user_calendar_roles.values()):
+        return user_id
+    return None
+
+
+def build_analysis(calendar_ids, period, month, filters=None, user_id=None, user_calendar_roles=None,
+                   comparison=None, comparisons=None):
+    """Данные /api/analysis-data: разделы периода и, если заданы, периодов сравнения.
+
+    comparison — один период {period, month} (ключ 'comparison' ответа),
+    comparisons — список таких периодов (ключ 'comparisons': для каждого
+    period, month, start_date, end_date и те же разделы; None — период
+    не разобран). Участник без календарей-владельцев видит только свои смены.
+
+    Смены всех периодов читаются одним запросом по объединению их
+    диапазонов, тренды — одним сгруппированным по дням запросом; всего
+    запросов четыре независимо от числа периодов: смены, тренды,
+    пользователи и нормы численности.
+    Если чтение смен или трендов упало, соответствующие разделы отдаются
+    пустыми, остальные — как обычно.
+    """
+    filters = filters or {}
+    only_user_id = analysis_scope(user_id, user_calendar_roles)
+
+    views = [('main', period, month)]
+    if comparison:
+        views.append(('comparison', comparison.get('period', 'month'), comparison.get('month')))
+    for index, item in enumerate(comparisons or []):
+        views.append((('comparisons', index), item.get('period', 'month'), item.get('month')))
+
+    range_stats = {}
+    trend_buckets = {}
+    for name, view_period, view_month in views:
+        try:
+            stats = _RangeStats(*period_range(view_period, view_month))
+            buckets = _TrendBuckets(trend_periods(view_period, view_month))
+        except Exception as e:
+            current_app.logger.error(f'Error in {name} period {view_period} {view_month!r}: {e}')
+            continue
+        range_stats[name] = stats
+        trend_buckets[name] = buckets
+
+    def load_shifts():
+        # С днём накануне — ради ночных смен, заходящих в первый день периода
+        ranges = [(stats.start_date - timedelta(days=1), stats.end_date) for stats in range_stats.values()]
+        rows = db.session.execute(
+            shift_rows_statement(calendar_ids, ranges, filters, only_user_id)
+        ).all() if ranges else []
+        frame = ShiftFrame.from_rows(rows)
+        for stats in range_stats.values():
+            stats.load(
+                frame.between(stats.start_date, stats.end_date),
+                frame.between(stats.start_date - timedelta(days=1), stats.end_date)
+            )
+
+    def load_trends():
+        trend_ranges = [(buckets.starts[0], buckets.ends[-1]) for buckets in trend_buckets.values() if buckets.starts]
+        if not trend_ranges:
+            return
+        trend_rows = db.session.execute(
+            trend_rows_statement(calendar_ids, trend_ranges, filters, only_user_id)
+        ).all()
+        ordinals = [day.toordinal() for day, _, _, _ in trend_rows]
+        user_ids = [NO_USER if row_user_id in (None, ROLLUP_NO_USER) else row_user_id
+                    for _, row_user_id, _, _ in trend_rows]
+        timed_shifts = [timed or 0 for _, _, timed, _ in trend_rows]
+        minutes = [row_minutes or 0 for _, _, _, row_minutes in trend_rows]
+        for buckets in trend_buckets.values():
+            buckets.add_columns(ordinals, user_ids, timed_shifts, minutes)
+        current_app.logger.debug(
+            f'Trends {period} {month!r}: {len(trend_rows)} day rows for {trend_ranges}'
+        )
+
+    # Смены периодов и тренды независимы: ошибка одного чтения не мешает другому
+    failed = run_analysis_tasks({'shifts': load_shifts, 'trends': load_trends})
+    if 'shifts' in failed:
+        range_stats = {name: _RangeStats(stats.start_date, stats.end_date) for name, stats in range_stats.items()}
+    if 'trends' in failed:
+        trend_buckets = {name: _TrendBuckets([]) for name in trend_buckets}
+
+    users = _load_users(set().union(*(stats.user_minutes for stats in range_stats.values())))
+    staffing = staffing_by_weekday(calendar_ids) if range_stats else {}
+    for stats in range_stats.values():
+        stats.staffing = staffing
+
+    analysis_data = {}
+    if comparisons is not None:
+        analysis_data['comparisons'] = []
+    for name, view_period, view_month in views:
+        if name in range_stats:
+            sections = range_stats[name].sections(users)
+            sections['trends_data'] = trend_buckets[name].result()
+        else:
+            sections = None if name != 'main' else _empty_sections()
+        if name == 'main':
+            analysis_data.update(sections)
+        elif name == 'comparison':
+            analysis_data[name] = sections
+        else:
+            if sections is not None:
+                stats = range_stats[name]
+                sections = dict(
+                    sections, period=view_period, month=view_month,
+                    start_date=stats.start_date.isoformat(), end_date=stats.end_date.isoformat()
+                )
+            analysis_data['comparisons'].append(sections)
+    return analysis_data
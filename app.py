@@ -1,6 +1,7 @@
 from flask import Flask
 from flask_login import LoginManager
-from models import db, ensure_user_columns
+from models import db
+from migrations import ensure_schema
 
 from config import Config
 import os
@@ -19,6 +20,9 @@ def create_app():
     # Инициализация базы данных
     db.init_app(app)
 
+    # Схема базы: одна проверка schema_version, миграции — только при отставании
+    ensure_schema(app)
+
     # Настройка Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -33,6 +37,9 @@ def create_app():
     from routes import register_routes
     register_routes(app)
     add_jinja2_filters(app)
+
+    from commands import register_commands
+    register_commands(app)
     return app
 
 
@@ -40,7 +47,4 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        ensure_user_columns()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""Копирование смен и клонирование календаря set-based запросами.
+
+Всё делается через INSERT ... SELECT внутри базы: строки не поднимаются
+в Python и не проходят через ORM, поэтому копия месяца на десятки тысяч
+смен занимает миллисекунды. Commit делает вызывающий.
+"""
+from sqlalchemy import and_, exists, func, insert, literal, select
+
+from models import db, Calendar, Shift, ShiftTemplate, StaffingTarget, Group, calendar_members, group_members, get_shift_ids
+
+SHIFT_COPY_COLUMNS = (
+    'title', 'start_time', 'end_time', 'calendar_id', 'user_id',
+    'date', 'template_id', 'show_time', 'color_class',
+    'duration_minutes', 'crosses_midnight'
+)
+
+
+def copy_shift_range(calendar_id, source_start, source_end, day_offset, user_ids=None, replace=False):
+    """Копирует смены календаря из [source_start, source_end] со сдвигом на day_offset дней.
+
+    replace=False — занятые дни в целевом диапазоне пропускаются,
+    replace=True — смены в целевом диапазоне предварительно удаляются.
+    Диапазоны не должны пересекаться (это проверяет маршрут).
+    Возвращает (created_ids, deleted_ids).
+    """
+    shift_table = Shift.__table__
+    source = shift_table.alias('source')
+    target = shift_table.alias('target')
+    # В SQLite даты хранятся строками 'YYYY-MM-DD' — сдвигаем встроенной date()
+    target_date = func.date(source.c.date, f'{day_offset:+d} days')
+
+    source_filter = [
+        source.c.calendar_id == calendar_id,
+        source.c.date >= source_start,
+        source.c.date <= source_end,
+    ]
+    if user_ids is not None:
+        source_filter.append(source.c.user_id.in_(user_ids))
+
+    deleted_ids = []
+    if replace:
+        target_filter = [
+            Shift.calendar_id == calendar_id,
+            Shift.date >= func.date(literal(source_start.isoformat()), f'{day_offset:+d} days'),
+            Shift.date <= func.date(literal(source_end.isoformat()), f'{day_offset:+d} days'),
+        ]
+        if user_ids is not None:
+            target_filter.append(Shift.user_id.in_(user_ids))
+        deleted_ids = get_shift_ids(*target_filter)
+        if deleted_ids:
+            db.session.execute(shift_table.delete().where(shift_table.c.id.in_(deleted_ids)))
+
+    # Новые id больше текущего максимума — по ним потом находим вставленные смены
+    max_id_before = db.session.execute(select(func.max(shift_table.c.id))).scalar() or 0
+
+    occupied = exists().where(and_(
+        target.c.calendar_id == source.c.calendar_id,
+        target.c.user_id == source.c.user_id,
+        target.c.date == target_date,
+    ))
+    columns = [target_date if name == 'date' else source.c[name] for name in SHIFT_COPY_COLUMNS]
+    db.session.execute(
+        insert(shift_table).from_select(
+            list(SHIFT_COPY_COLUMNS),
+            select(*columns).where(*source_filter, ~occupied)
+        )
+    )
+
+    created_ids = get_shift_ids(Shift.calendar_id == calendar_id, Shift.id > max_id_before)
+    return created_ids, deleted_ids
+
+
+def clone_calendar(source, new_calendar_id, name, owner_id):
+    """Клонирует календарь: шаблоны смен, нормы численности, участников с позициями, группы и их состав.
+
+    Смены не копируются. Группам нужны новые id для group_members, поэтому
+    они вставляются со сдвигом id на (max(group.id) - min(id групп источника) + 1):
+    связи переносятся тем же сдвигом одним INSERT ... SELECT.
+    Возвращает новый Calendar.
+    """
+    calendar = Calendar(id=new_calendar_id, name=name, owner_id=owner_id, is_team=source.is_team)
+    db.session.add(calendar)
+    db.session.flush()
+
+    template_table = ShiftTemplate.__table__
+    db.session.execute(insert(template_table).from_select(
+        ['title', 'start_time', 'end_time', 'calendar_id', 'owner_id', 'show_time', 'color_class',
+         'duration_minutes', 'crosses_midnight'],
+        select(
+            template_table.c.title, template_table.c.start_time, template_table.c.end_time,
+            literal(calendar.id), literal(owner_id), template_table.c.show_time, template_table.c.color_class,
+            template_table.c.duration_minutes, template_table.c.crosses_midnight
+        ).where(template_table.c.calendar_id == source.id)
+    ))
+
+    target_table = StaffingTarget.__table__
+    db.session.execute(insert(target_table).from_select(
+        ['calendar_id', 'weekday', 'required'],
+        select(literal(calendar.id), target_table.c.weekday, target_table.c.required)
+        .where(target_table.c.calendar_id == source.id)
+    ))
+
+    db.session.execute(insert(calendar_members).from_select(
+        ['calendar_id', 'user_id', 'position', 'sort_key'],
+        select(literal(calendar.id), calendar_members.c.user_id, calendar_members.c.position, calendar_members.c.sort_key)
+        .where(calendar_members.c.calendar_id == source.id, calendar_members.c.user_id != owner_id)
+    ))
+
+    group_table = Group.__table__
+    min_source_id = db.session.execute(
+        select(func.min(group_table.c.id)).where(group_table.c.calendar_id == source.id)
+    ).scalar()
+    if min_source_id is not None:
+        max_id = db.session.execute(select(func.max(group_table.c.id))).scalar()
+        id_offset = max_id - min_source_id + 1
+        db.session.execute(insert(group_table).from_select(
+            ['id', 'name', 'color', 'calendar_id', 'owner_id', 'position', 'sort_key', 'created_at'],
+            select(
+                group_table.c.id + id_offset, group_table.c.name, group_table.c.color,
+                literal(calendar.id), literal(owner_id), group_table.c.position, group_table.c.sort_key,
+                func.current_timestamp()
+            ).where(group_table.c.calendar_id == source.id)
+        ))
+        source_groups = select(group_table.c.id).where(group_table.c.calendar_id == source.id)
+        db.session.execute(insert(group_members).from_select(
+            ['group_id', 'user_id'],
+            select(group_members.c.group_id + id_offset, group_members.c.user_id)
+            .where(group_members.c.group_id.in_(source_groups), group_members.c.user_id != owner_id)
+        ))
+
+    return calendar
@@ -0,0 +1,89 @@
+import click
+from datetime import date
+from sqlalchemy import select
+
+from models import db, Shift, calendar_members, group_members, friends
+from analytics import shift_rows_statement
+from migrations import migrate, get_schema_version, LATEST_VERSION
+from ordering import RANK_MAX_LENGTH, calendars_needing_rebalance, rebalance_calendar_order
+from rollup import create_rollup_triggers, rebuild_shift_rollup
+
+
+def hot_queries():
+    """Типовые запросы к сменам и связям, на которые рассчитаны индексы."""
+    month_start, month_end = date(2024, 1, 1), date(2024, 1, 31)
+    return [
+        ('Смены месяца календаря (view_calendar, get_calendar_shifts)',
+         select(Shift).where(Shift.calendar_id == 1, Shift.date >= month_start, Shift.date <= month_end)),
+        ('Проверка дубля смены (add_shift_from_template)',
+         select(Shift).where(Shift.calendar_id == 1, Shift.user_id == 1, Shift.date == month_start)),
+        ('Смены пользователя (profile)',
+         select(Shift).where(Shift.user_id == 1)),
+        ('Аналитика по календарям за период (analytics.build_analysis)',
+         shift_rows_statement([1, 2], [(month_start, month_end)])),
+        ('Смены шаблона (delete_shift_template)',
+         select(Shift.id).where(Shift.template_id == 1)),
+        ('Календари участника (shared_calendars)',
+         select(calendar_members.c.calendar_id).where(calendar_members.c.user_id == 1)),
+        ('Группы участника (User.groups)',
+         select(group_members.c.group_id).where(group_members.c.user_id == 1)),
+        ('Входящие дружбы (friend_of)',
+         select(friends.c.user_id).where(friends.c.friend_id == 1)),
+    ]
+
+
+def explain_query_plans():
+    """EXPLAIN QUERY PLAN для hot_queries: список (название, [строки плана])."""
+    report = []
+    with db.engine.connect() as conn:
+        for title, stmt in hot_queries():
+            compiled = stmt.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+            params = tuple(str(compiled.params[name]) for name in compiled.positiontup)
+            rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).fetchall()
+            report.append((title, [row[-1] for row in rows]))
+    return report
+
+
+def register_commands(app):
+    @app.cli.command('migrate')
+    @click.option('--status', is_flag=True, help='Только показать текущую версию схемы.')
+    def migrate_command(status):
+        """Применить миграции схемы базы данных."""
+        if status:
+            click.echo(f'Версия схемы: {get_schema_version()} (актуальная: {LATEST_VERSION})')
+            return
+        start_version, version = migrate()
+        if start_version == version:
+            click.echo(f'Схема актуальна (версия {version})')
+        else:
+            click.echo(f'Схема обновлена: {start_version} -> {version}')
+
+    @app.cli.command('explain-queries')
+    def explain_queries():
+        """Показать планы выполнения основных запросов к сменам."""
+        for title, plan in explain_query_plans():
+            click.echo(title)
+            for line in plan:
+                click.echo(f'    {line}')
+
+    @app.cli.command('rebalance-order')
+    @click.option('--calendar-id', type=int, default=None, help='Только этот календарь.')
+    @click.option('--max-length', type=int, default=RANK_MAX_LENGTH, show_default=True,
+                  help='Перенумеровать календари, где ключ порядка длиннее.')
+    def rebalance_order(calendar_id, max_length):
+        """Перенумеровать ключи порядка участников и групп (для периодического запуска)."""
+        calendar_ids = [calendar_id] if calendar_id else calendars_needing_rebalance(max_length)
+        rows = 0
+        for cid in calendar_ids:
+            rows += rebalance_calendar_order(cid)
+        db.session.commit()
+        click.echo(f'Календарей: {len(calendar_ids)}, строк: {rows}')
+
+    @app.cli.command('rebuild-rollup')
+    @click.option('--calendar-id', type=int, default=None, help='Только этот календарь.')
+    def rebuild_rollup(calendar_id):
+        """Пересобрать дневную сводку смен (shift_daily_rollup) и проверить её триггеры."""
+        create_rollup_triggers(db.session.connection())
+        rows = rebuild_shift_rollup(calendar_id)
+        db.session.commit()
+        click.echo(f'Строк сводки: {rows}')
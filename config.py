@@ -19,4 +19,37 @@ class Config:
     
     # Additional production settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
-    PERMANENT_SESSION_LIFETIME = 86400  # 24 hours session timeout
\ No newline at end of file
+    PERMANENT_SESSION_LIFETIME = 86400  # 24 hours session timeout
+
+    # Max operations per /api/shifts/batch request
+    SHIFT_BATCH_MAX_OPERATIONS = 2000
+
+    # Longest date range for the rotation generator
+    ROTATION_MAX_DAYS = 366
+
+    # Live updates (SSE)
+    SSE_HEARTBEAT_SECONDS = 15
+    SSE_MAX_DURATION_SECONDS = 300  # client reconnects automatically
+    SSE_RETRY_MS = 3000
+
+    # Query budgets of hot routes (query_budget.py): strict mode fails the
+    # request instead of logging a warning — enable it when testing
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT') == '1'
+
+    # /api/analysis-data result cache (analysis_cache.py): entries per worker
+    # process, seconds to live; size 0 disables caching
+    ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 128))
+    ANALYSIS_CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', 300))
+    # Serve hit/miss counters at /api/analysis-cache/stats; off by default
+    # (404) because any logged-in user could read them, on in debug mode
+    ANALYSIS_CACHE_STATS = os.environ.get('ANALYSIS_CACHE_STATS') == '1'
+
+    # Max periods in the 'comparisons' list of /api/analysis-data
+    ANALYSIS_MAX_COMPARISONS = 12
+
+    # Slot width in minutes of the on-duty heatmap (heatmap.py): 60 or 15,
+    # must divide a day
+    ANALYSIS_HEATMAP_SLOT_MINUTES = int(os.environ.get('ANALYSIS_HEATMAP_SLOT_MINUTES', 60))
+
+    # Longest date range, in days, of a calendar shift export (export.py)
+    EXPORT_MAX_DAYS = int(os.environ.get('EXPORT_MAX_DAYS', 366))
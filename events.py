@@ -0,0 +1,90 @@
+"""Внутрипроцессная шина событий календарей для SSE-потока.
+
+Маршруты ставят события в очередь сессии (queue_event), а публикуются они
+только после успешного commit — подписчики не увидят откатившихся изменений.
+Внешний брокер не нужен: подписчики живут в памяти текущего процесса.
+"""
+import json
+import queue
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+PENDING_EVENTS_KEY = 'calendar_events'
+
+
+def format_sse(event_type, data):
+    """Сообщение в формате text/event-stream."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'event: {event_type}\ndata: {payload}\n\n'
+
+
+class CalendarEventBroker:
+    """Подписчики по календарям: у каждого открытого потока своя очередь."""
+
+    def __init__(self, max_queue_size=256):
+        self.max_queue_size = max_queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, calendar_id):
+        subscriber = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers[calendar_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, calendar_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(calendar_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[calendar_id]
+
+    def subscriber_count(self, calendar_id):
+        with self._lock:
+            return len(self._subscribers.get(calendar_id, ()))
+
+    def publish(self, calendar_id, event_type, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(calendar_id, ()))
+        if not subscribers:
+            return
+        message = format_sse(event_type, data)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Клиент не успевает читать — сбрасываем очередь и просим перезагрузку
+                _drain(subscriber)
+                subscriber.put_nowait(format_sse('reset', {}))
+
+
+def _drain(subscriber):
+    while True:
+        try:
+            subscriber.get_nowait()
+        except queue.Empty:
+            return
+
+
+broker = CalendarEventBroker()
+
+
+def queue_event(session, calendar_id, event_type, data=None):
+    """Ставит событие в очередь; оно уйдёт подписчикам после commit сессии."""
+    session.info.setdefault(PENDING_EVENTS_KEY, []).append((calendar_id, event_type, data or {}))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending_events(session):
+    for calendar_id, event_type, data in session.info.pop(PENDING_EVENTS_KEY, []):
+        broker.publish(calendar_id, event_type, data)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_events(session):
+    session.info.pop(PENDING_EVENTS_KEY, None)
@@ -0,0 +1,148 @@
+"""Выгрузка смен календаря и разделов аналитики в CSV и XLSX.
+
+Смены читаются потоково (yield_per): курсор отдаёт строки пачками по
+EXPORT_BATCH_SIZE, CSV пишется в ответ по мере чтения, поэтому память не
+растёт с размером календаря и первые байты уходят клиенту сразу.
+XLSX собирается openpyxl в режиме write_only во временный файл и
+отдаётся из него; без openpyxl XLSX недоступен.
+
+Разделы аналитики берутся из готового ответа /api/analysis-data
+(build_analysis или кэш) и раскладываются в таблицы analysis_tables.
+"""
+import csv
+import io
+import tempfile
+
+from sqlalchemy import select
+
+from models import db, Shift, User
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # XLSX необязателен: без openpyxl доступен только CSV
+    Workbook = None
+
+EXPORT_BATCH_SIZE = 500
+
+CSV_MIMETYPE = 'text/csv'
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+SHIFT_EXPORT_HEADER = ['Дата', 'Пользователь', 'Имя', 'Фамилия', 'Смена', 'Начало', 'Конец', 'Часы', 'Цвет']
+
+# Раздел выгрузки аналитики -> название листа XLSX
+ANALYSIS_SECTIONS = {
+    'shift_stats': 'Сводка',
+    'activity_ranking': 'Рейтинг',
+    'coverage': 'Покрытие',
+    'time_slots': 'Смены',
+    'work_time_distribution': 'Рабочее время',
+    'weekday_activity': 'Дни недели',
+    'coverage_heatmap': 'Люди по часам',
+    'trends': 'Тренды',
+}
+
+WEEKDAY_NAMES = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
+
+
+def xlsx_available():
+    return Workbook is not None
+
+
+def shift_export_rows(calendar_id, start_date, end_date):
+    """Строки выгрузки смен календаря за [start_date, end_date] — генератор по курсору."""
+    statement = (
+        select(Shift.date, User.username, User.first_name, User.last_name, Shift.title,
+               Shift.start_time, Shift.end_time, Shift.show_time, Shift.duration_minutes, Shift.color_class)
+        .outerjoin(User, User.id == Shift.user_id)
+        .where(Shift.calendar_id == calendar_id, Shift.date >= start_date, Shift.date <= end_date)
+        .order_by(Shift.date, Shift.user_id, Shift.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for day, username, first_name, last_name, title, start_time, end_time, show_time, minutes, color_class in (
+        db.session.execute(statement)
+    ):
+        yield [
+            day.strftime('%Y-%m-%d'), username or '', first_name or '', last_name or '', title,
+            start_time.strftime('%H:%M') if show_time and start_time else '',
+            end_time.strftime('%H:%M') if show_time and end_time else '',
+            round(minutes / 60, 2) if show_time else 0,
+            color_class or ''
+        ]
+
+
+def csv_stream(header, rows, batch_size=EXPORT_BATCH_SIZE):
+    """CSV по частям: BOM (для Excel), заголовок и строки пачками по batch_size."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def xlsx_file(sheets):
+    """Временный файл XLSX с листами [(название, заголовок, строки)], указатель в начале."""
+    if Workbook is None:
+        raise RuntimeError('openpyxl не установлен')
+    workbook = Workbook(write_only=True)
+    for title, header, rows in sheets:
+        sheet = workbook.create_sheet(title[:31])  # Excel ограничивает имя листа 31 символом
+        sheet.append(header)
+        for row in rows:
+            sheet.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def analysis_tables(data, section):
+    """(заголовок, строки) раздела ответа аналитики; section — из ANALYSIS_SECTIONS."""
+    if section == 'shift_stats':
+        stats = data['shift_stats']
+        return ['Показатель', 'Значение'], [
+            ['Всего часов', stats['total_hours']],
+            ['Смен со временем', stats['total_shifts']],
+            ['Средняя длительность, мин', stats['avg_duration']],
+            ['Популярный шаблон', stats['top_template'] or ''],
+        ]
+    if section == 'activity_ranking':
+        return ['Место', 'Пользователь', 'Имя', 'Фамилия', 'Часы', 'Смены'], [
+            [place, user['username'], user['first_name'], user['last_name'], user['total_hours'], user['total_shifts']]
+            for place, user in enumerate(data['team_analysis']['activity_ranking'], start=1)
+        ]
+    if section == 'coverage':
+        return ['Дата', 'Смены', 'Людей на смене', 'Норма', 'Покрытие, %'], [
+            [day['full_date'], day['shifts_count'], day.get('headcount', ''),
+             day.get('required') or '', day['coverage_percent']]
+            for day in data['team_analysis']['coverage_data']
+        ]
+    if section == 'time_slots':
+        return ['Смена', 'Время', 'Количество', 'Доля, %', 'Цвет'], [
+            [slot['title'], slot['time_range'].rsplit('|', 1)[-1], slot['count'],
+             round(slot['percentage'], 1), slot['color_class'] or '']
+            for slot in data['time_slots'].get('templates', [])
+        ]
+    if section == 'work_time_distribution':
+        distribution = data['work_time_distribution']
+        return ['Пользователь', 'Часы'], [list(item) for item in zip(distribution['labels'], distribution['values'])]
+    if section == 'weekday_activity':
+        return ['День недели', 'Часы'], [list(item) for item in zip(WEEKDAY_NAMES, data['weekday_activity']['hours'])]
+    if section == 'coverage_heatmap':
+        heatmap = data['coverage_heatmap']
+        return ['Дата'] + heatmap['labels'], [[day['date']] + day['values'] for day in heatmap['dates']]
+    if section == 'trends':
+        trends = data['trends_data']
+        return ['Период', 'Часы', 'Смены', 'Люди'], [
+            [label, hours, shifts, people]
+            for label, hours, shifts, people in zip(
+                trends['hours']['labels'], trends['hours']['values'],
+                trends['shifts']['values'], trends['people']['values']
+            )
+        ]
+    raise ValueError(f'Неизвестный раздел: {section}')
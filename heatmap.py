@@ -0,0 +1,141 @@
+"""Тепловая карта «сколько людей на смене» по слотам суток.
+
+Смены раскладываются на общую шкалу слотов от начала периода
+(день × слотов в сутках + слот) и считаются разностным массивом:
++1 в слоте начала, −1 в слоте после конца, затем префиксная сумма.
+Смена через полночь просто продолжается на следующий день шкалы,
+поэтому её хвост попадает в утро следующей даты; смена накануне
+периода идёт с днём −1, и в сетку попадает только её хвост. Человек
+считается на смене в слоте, если его смена задевает слот хотя бы частично.
+
+С NumPy разностный массив и суммы считаются векторно (год по 15-минутным
+слотам — около 35 тыс. ячеек), без NumPy — тем же алгоритмом в цикле.
+"""
+from datetime import timedelta
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: есть чистый Python
+    np = None
+
+MINUTES_PER_DAY = 24 * 60
+WEEKDAY_LABELS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+
+def slot_labels(slot_minutes):
+    """Подписи слотов суток: '00:00', '01:00', ..."""
+    return [f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(0, MINUTES_PER_DAY, slot_minutes)]
+
+
+def _interval_slots(day_offsets, start_minutes, durations, slot_minutes):
+    """Границы [первый, после последнего) слотов смен на общей шкале."""
+    starts, ends = [], []
+    for day_offset, start_minute, duration in zip(day_offsets, start_minutes, durations):
+        if duration <= 0:
+            continue
+        begin = day_offset * MINUTES_PER_DAY + start_minute
+        starts.append(begin // slot_minutes)
+        ends.append(-(-(begin + duration) // slot_minutes))  # округление вверх
+    return starts, ends
+
+
+def _on_duty_numpy(day_offsets, start_minutes, durations, days, slot_minutes):
+    slots_per_day = MINUTES_PER_DAY // slot_minutes
+    offsets = np.asarray(day_offsets, dtype=np.int64)
+    durations = np.asarray(durations, dtype=np.int64)
+    begins = offsets * MINUTES_PER_DAY + np.asarray(start_minutes, dtype=np.int64)
+    timed = durations > 0
+    starts = begins[timed] // slot_minutes
+    ends = -(-(begins[timed] + durations[timed]) // slot_minutes)
+    # Начала до периода прижимаются к нулю, хвосты за концом — к лишней ячейке
+    length = days * slots_per_day
+    diff = np.zeros(length + 1, dtype=np.int64)
+    np.add.at(diff, np.clip(starts, 0, length), 1)
+    np.add.at(diff, np.clip(ends, 0, length), -1)
+    return np.cumsum(diff[:length]).reshape(days, slots_per_day)
+
+
+def _on_duty_python(day_offsets, start_minutes, durations, days, slot_minutes):
+    slots_per_day = MINUTES_PER_DAY // slot_minutes
+    length = days * slots_per_day
+    diff = [0] * (length + 1)
+    for start, end in zip(*_interval_slots(day_offsets, start_minutes, durations, slot_minutes)):
+        diff[min(max(start, 0), length)] += 1
+        diff[min(max(end, 0), length)] -= 1
+    grid, running = [], 0
+    for day in range(days):
+        row = []
+        for index in range(day * slots_per_day, (day + 1) * slots_per_day):
+            running += diff[index]
+            row.append(running)
+        grid.append(row)
+    return grid
+
+
+def _on_duty(day_offsets, start_minutes, durations, days, slot_minutes):
+    if MINUTES_PER_DAY % slot_minutes:
+        raise ValueError('slot_minutes должен делить сутки')
+    if np is not None:
+        return _on_duty_numpy(day_offsets, start_minutes, durations, days, slot_minutes)
+    return _on_duty_python(day_offsets, start_minutes, durations, days, slot_minutes)
+
+
+def on_duty_grid(day_offsets, start_minutes, durations, days, slot_minutes=60):
+    """Число людей на смене: список days строк по слотам суток.
+
+    day_offsets — день смены от начала периода (−1 — накануне: в сетку
+    попадает только хвост ночной смены), start_minutes — минута начала
+    в сутках, durations — длительность в минутах (через полночь — больше,
+    чем осталось до конца суток). slot_minutes должен делить сутки.
+    """
+    grid = _on_duty(day_offsets, start_minutes, durations, max(days, 0), slot_minutes)
+    return grid.tolist() if np is not None else grid
+
+
+def _weekday_stats(grid, first_weekday, slots_per_day):
+    """(суммы, пики, число дней) по дням недели."""
+    if np is not None:
+        weekdays = (np.arange(len(grid)) + first_weekday) % 7
+        totals = np.zeros((7, slots_per_day), dtype=np.int64)
+        peaks = np.zeros((7, slots_per_day), dtype=np.int64)
+        np.add.at(totals, weekdays, grid)
+        np.maximum.at(peaks, weekdays, grid)
+        return totals.tolist(), peaks.tolist(), np.bincount(weekdays, minlength=7).tolist()
+
+    totals = [[0] * slots_per_day for _ in range(7)]
+    peaks = [[0] * slots_per_day for _ in range(7)]
+    counts = [0] * 7
+    for day, row in enumerate(grid):
+        weekday = (first_weekday + day) % 7
+        counts[weekday] += 1
+        weekday_totals, weekday_peaks = totals[weekday], peaks[weekday]
+        for index, value in enumerate(row):
+            weekday_totals[index] += value
+            if value > weekday_peaks[index]:
+                weekday_peaks[index] = value
+    return totals, peaks, counts
+
+
+def coverage_heatmap(start_date, days, day_offsets, start_minutes, durations, slot_minutes=60):
+    """Раздел coverage_heatmap: по датам и средний/пиковый по дням недели."""
+    days = max(days, 0)
+    slots_per_day = MINUTES_PER_DAY // slot_minutes
+    grid = _on_duty(day_offsets, start_minutes, durations, days, slot_minutes)
+    totals, peaks, counts = _weekday_stats(grid, start_date.weekday(), slots_per_day)
+    rows = grid.tolist() if np is not None else grid
+    return {
+        'slot_minutes': slot_minutes,
+        'labels': slot_labels(slot_minutes),
+        'weekday': {
+            'labels': list(WEEKDAY_LABELS),
+            'average': [
+                [round(total / counts[weekday], 2) if counts[weekday] else 0 for total in weekday_totals]
+                for weekday, weekday_totals in enumerate(totals)
+            ],
+            'peak': peaks
+        },
+        'dates': [
+            {'date': (start_date + timedelta(days=day)).strftime('%Y-%m-%d'), 'values': row}
+            for day, row in enumerate(rows)
+        ]
+    }
@@ -0,0 +1,307 @@
+"""Версионированные миграции схемы SQLite.
+
+Номер схемы хранится в одной строке таблицы schema_version. При старте
+приложение читает только её и запускает миграции, если база отстаёт.
+Каждая миграция идемпотентна (проверяет, что уже сделано) и выполняется
+в своей транзакции вместе с записью нового номера.
+"""
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from ordering import RANK_BASE, rank_keys_between
+from rollup import create_rollup_triggers, rebuild_shift_rollup
+
+logger = logging.getLogger(__name__)
+
+
+def _table_columns(conn, table):
+    return {row[1]: row for row in conn.execute(text(f"PRAGMA table_info('{table}')")).fetchall()}
+
+
+def _create_trigger_if_missing(conn, name, sql):
+    exists = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type='trigger' AND name=:name"
+    ), {'name': name}).fetchone()
+    if not exists:
+        conn.execute(text(sql))
+
+
+def _create_indexes(conn, indexes):
+    """CREATE INDEX IF NOT EXISTS по замороженному списку (имя, таблица, колонки).
+
+    Списки индексов записаны в самих миграциях, а не берутся из моделей:
+    миграция должна создавать то же, что и в момент, когда её написали.
+    """
+    for name, table, columns in indexes:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'))
+
+
+def _unique_shift_day(conn):
+    """Уникальный индекс uq_shift_calendar_user_date: одна смена на человека в день в календаре.
+
+    Дубли старых баз (кроме самой ранней смены дня) переносятся в таблицу
+    shift_duplicate, затронутые календари получают запись 'reset' в журнале,
+    после чего индекс создаётся с UNIQUE. Смены без пользователя не ограничены.
+    """
+    unique = {row[1]: row[2] for row in conn.execute(text("PRAGMA index_list('shift')")).fetchall()}
+    if unique.get('uq_shift_calendar_user_date'):
+        return
+    columns = 'id, title, start_time, end_time, calendar_id, user_id, date, template_id, show_time, color_class'
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS shift_duplicate ({columns}, moved_at DATETIME)'
+    ))
+    duplicates = (
+        'user_id IS NOT NULL AND id NOT IN ('
+        'SELECT MIN(id) FROM shift WHERE user_id IS NOT NULL GROUP BY calendar_id, user_id, date)'
+    )
+    calendar_ids = [row[0] for row in conn.execute(text(
+        f'SELECT DISTINCT calendar_id FROM shift WHERE {duplicates}'
+    )).fetchall()]
+    if calendar_ids:
+        moved = conn.execute(text(
+            f'INSERT INTO shift_duplicate ({columns}, moved_at) '
+            f'SELECT {columns}, CURRENT_TIMESTAMP FROM shift WHERE {duplicates}'
+        )).rowcount
+        conn.execute(text(f'DELETE FROM shift WHERE {duplicates}'))
+        for calendar_id in calendar_ids:
+            conn.execute(text('UPDATE calendar SET version = version + 1 WHERE id = :id'), {'id': calendar_id})
+            conn.execute(text(
+                "INSERT INTO shift_change (calendar_id, version, shift_id, action, created_at) "
+                "SELECT id, version, NULL, 'reset', CURRENT_TIMESTAMP FROM calendar WHERE id = :id"
+            ), {'id': calendar_id})
+        logger.warning('Дубли смен (%s шт.) перенесены в shift_duplicate, календари: %s', moved, calendar_ids)
+    conn.execute(text('DROP INDEX IF EXISTS uq_shift_calendar_user_date'))
+    conn.execute(text('CREATE UNIQUE INDEX uq_shift_calendar_user_date ON shift (calendar_id, user_id, date)'))
+
+
+def _user_profile_columns(conn):
+    """Колонки first_name/last_name/age/phone и защитные триггеры для старых баз."""
+    columns = _table_columns(conn, 'user')
+
+    # Добавляем колонки при отсутствии: NOT NULL + DEFAULT ''
+    if 'first_name' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN first_name VARCHAR(50) NOT NULL DEFAULT ""'))
+    if 'last_name' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN last_name VARCHAR(50) NOT NULL DEFAULT ""'))
+    if 'age' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN age INTEGER'))
+    if 'phone' not in columns:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN phone VARCHAR(20)'))
+
+    # Если колонки есть, но допускают NULL — создаём триггеры, запрещающие пустые значения
+    # PRAGMA table_info: (cid, name, type, notnull, dflt_value, pk)
+    for column in ('first_name', 'last_name'):
+        info = columns.get(column)
+        if not info or info[3] != 0:
+            continue
+        for operation, event in (('insert', 'INSERT'), ('update', f'UPDATE OF {column}')):
+            name = f'user_{column}_not_empty_{operation}'
+            _create_trigger_if_missing(conn, name, (
+                f'CREATE TRIGGER {name} BEFORE {event} ON "user" '
+                f'FOR EACH ROW WHEN NEW.{column} IS NULL OR length(trim(NEW.{column}))=0 '
+                f"BEGIN SELECT RAISE(ABORT, '{column} required'); END;"
+            ))
+
+
+def _calendar_version(conn):
+    """Счётчик изменений смен календаря (синхронизация и кэши)."""
+    if 'version' not in _table_columns(conn, 'calendar'):
+        conn.execute(text('ALTER TABLE calendar ADD COLUMN version INTEGER NOT NULL DEFAULT 0'))
+
+
+def _shift_indexes(conn):
+    """Индексы на горячих запросах смен и на ассоциативных таблицах.
+
+    Индекс calendar_members по sort_key создаёт миграция 4 после ALTER TABLE:
+    здесь колонки ещё нет, и SQLite построил бы индекс по строке 'sort_key'.
+    """
+    _create_indexes(conn, [
+        ('ix_friends_user_id', 'friends', ['user_id']),
+        ('ix_friends_friend_id', 'friends', ['friend_id']),
+        ('ix_group_members_user_id', 'group_members', ['user_id']),
+        ('ix_calendar_members_user_id', 'calendar_members', ['user_id']),
+        ('ix_shift_calendar_date', 'shift', ['calendar_id', 'date']),
+        ('ix_shift_user_date', 'shift', ['user_id', 'date']),
+        ('ix_shift_template_id', 'shift', ['template_id']),
+    ])
+    _unique_shift_day(conn)
+
+
+def _order_sort_keys(conn):
+    """sort_key участников и групп из прежнего порядка по position."""
+    # Прежняя миграция 3 создавала этот индекс до колонки — по строке 'sort_key';
+    # после ALTER TABLE он не совпадает с данными, поэтому пересоздаётся в конце
+    conn.execute(text('DROP INDEX IF EXISTS ix_calendar_members_sort'))
+    if 'sort_key' not in _table_columns(conn, 'calendar_members'):
+        conn.execute(text('ALTER TABLE calendar_members ADD COLUMN sort_key VARCHAR(64)'))
+    if 'sort_key' not in _table_columns(conn, 'group'):
+        conn.execute(text('ALTER TABLE "group" ADD COLUMN sort_key VARCHAR(64)'))
+
+    # Участники — по возрастанию position, группы — по убыванию (верхняя группа первая)
+    orders = (
+        ('calendar_members', 'user_id', 'position ASC, user_id ASC'),
+        ('"group"', 'id', 'position DESC, id DESC'),
+    )
+    for table, id_column, order_by in orders:
+        rows = conn.execute(text(
+            f'SELECT calendar_id, {id_column} FROM {table} WHERE sort_key IS NULL '
+            f'ORDER BY calendar_id, {order_by}'
+        )).fetchall()
+        by_calendar = {}
+        for calendar_id, item_id in rows:
+            by_calendar.setdefault(calendar_id, []).append(item_id)
+        params = []
+        for calendar_id, item_ids in by_calendar.items():
+            keys = rank_keys_between(None, None, len(item_ids), min_gap=RANK_BASE)
+            params.extend(
+                {'calendar_id': calendar_id, 'item_id': item_id, 'sort_key': key}
+                for item_id, key in zip(item_ids, keys)
+            )
+        if params:
+            conn.execute(text(
+                f'UPDATE {table} SET sort_key = :sort_key '
+                f'WHERE calendar_id = :calendar_id AND {id_column} = :item_id'
+            ), params)
+
+    _create_indexes(conn, [
+        ('ix_calendar_members_sort', 'calendar_members', ['calendar_id', 'sort_key']),
+        ('ix_group_calendar_sort', 'group', ['calendar_id', 'sort_key']),
+    ])
+
+
+def _shift_durations(conn):
+    """duration_minutes и crosses_midnight смен и шаблонов из start_time/end_time."""
+    # Время в SQLite хранится строкой 'HH:MM:SS.ffffff'
+    start = '(CAST(substr(start_time, 1, 2) AS INTEGER) * 60 + CAST(substr(start_time, 4, 2) AS INTEGER))'
+    end = '(CAST(substr(end_time, 1, 2) AS INTEGER) * 60 + CAST(substr(end_time, 4, 2) AS INTEGER))'
+    for table in ('shift', 'shift_template'):
+        columns = _table_columns(conn, table)
+        if 'duration_minutes' not in columns:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN duration_minutes INTEGER NOT NULL DEFAULT 0'))
+        if 'crosses_midnight' not in columns:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN crosses_midnight BOOLEAN NOT NULL DEFAULT 0'))
+        conn.execute(text(
+            f'UPDATE {table} SET '
+            f'crosses_midnight = ({end} < {start}), '
+            f'duration_minutes = {end} - {start} + CASE WHEN {end} < {start} THEN 1440 ELSE 0 END'
+        ))
+
+
+def _shift_rollup(conn):
+    """Таблица shift_daily_rollup, её триггеры и первичное заполнение."""
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS shift_daily_rollup ('
+        'calendar_id INTEGER NOT NULL, user_id INTEGER NOT NULL, date DATE NOT NULL, '
+        'color_class VARCHAR(20) NOT NULL, shift_count INTEGER NOT NULL, '
+        'timed_shift_count INTEGER NOT NULL, minutes INTEGER NOT NULL, '
+        'PRIMARY KEY (calendar_id, user_id, date, color_class), '
+        'FOREIGN KEY(calendar_id) REFERENCES calendar (id), FOREIGN KEY(user_id) REFERENCES user (id))'
+    ))
+    _create_indexes(conn, [('ix_shift_rollup_calendar_date', 'shift_daily_rollup', ['calendar_id', 'date'])])
+    create_rollup_triggers(conn)
+    rebuild_shift_rollup(conn=conn)
+
+
+def _batch_shift_durations(conn):
+    """Пересчёт длительности: смены из /api/shifts/batch сохранялись с duration_minutes = 0."""
+    _shift_durations(conn)
+    rebuild_shift_rollup(conn=conn)
+
+
+def _staffing_targets(conn):
+    """Таблица staffing_target (обычно её уже создал create_all)."""
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS staffing_target ('
+        'calendar_id INTEGER NOT NULL, weekday INTEGER NOT NULL, required INTEGER NOT NULL, '
+        'PRIMARY KEY (calendar_id, weekday), '
+        'CONSTRAINT ck_staffing_target_weekday CHECK (weekday BETWEEN 0 AND 6), '
+        'FOREIGN KEY(calendar_id) REFERENCES calendar (id))'
+    ))
+
+
+def _rollup_unassigned_shifts(conn):
+    """Смены без пользователя в сводке (user_id = rollup.NO_USER): таблица без внешнего ключа на user."""
+    conn.execute(text('DROP TABLE IF EXISTS shift_daily_rollup'))
+    conn.execute(text(
+        'CREATE TABLE shift_daily_rollup ('
+        'calendar_id INTEGER NOT NULL, user_id INTEGER NOT NULL, date DATE NOT NULL, '
+        'color_class VARCHAR(20) NOT NULL, shift_count INTEGER NOT NULL, '
+        'timed_shift_count INTEGER NOT NULL, minutes INTEGER NOT NULL, '
+        'PRIMARY KEY (calendar_id, user_id, date, color_class), '
+        'FOREIGN KEY(calendar_id) REFERENCES calendar (id))'
+    ))
+    _create_indexes(conn, [('ix_shift_rollup_calendar_date', 'shift_daily_rollup', ['calendar_id', 'date'])])
+    create_rollup_triggers(conn, replace=True)
+    rebuild_shift_rollup(conn=conn)
+
+
+# (номер, описание, функция) — только добавлять в конец, номера не менять
+MIGRATIONS = [
+    (1, 'user: first_name/last_name/age/phone и триггеры', _user_profile_columns),
+    (2, 'calendar.version', _calendar_version),
+    (3, 'индексы смен и ассоциативных таблиц', _shift_indexes),
+    (4, 'sort_key участников и групп', _order_sort_keys),
+    (5, 'длительность смен и шаблонов', _shift_durations),
+    (6, 'дневная сводка смен и её триггеры', _shift_rollup),
+    (7, 'нормы численности по дням недели', _staffing_targets),
+    (8, 'длительность смен, созданных пакетом', _batch_shift_durations),
+    (9, 'одна смена на человека в день', _unique_shift_day),
+    (10, 'смены без пользователя в дневной сводке', _rollup_unassigned_shifts),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version():
+    """Текущий номер схемы; None, если таблицы schema_version ещё нет."""
+    try:
+        with db.engine.connect() as conn:
+            return conn.execute(text('SELECT version FROM schema_version WHERE id = 1')).scalar() or 0
+    except OperationalError:
+        return None
+
+
+def migrate():
+    """Доводит схему базы до LATEST_VERSION. Возвращает (было, стало)."""
+    # Недостающие таблицы создаются по моделям сразу в актуальном виде
+    db.create_all()
+    with db.engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_version ('
+            'id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)'
+        ))
+        conn.execute(text('INSERT OR IGNORE INTO schema_version (id, version) VALUES (1, 0)'))
+
+    start_version = current = get_schema_version()
+    for number, description, apply in MIGRATIONS:
+        if number <= current:
+            continue
+        with db.engine.begin() as conn:
+            # pysqlite сам открывает транзакцию только перед DML, а ALTER/CREATE до неё
+            # фиксирует сразу; явный BEGIN делает миграцию атомарной вместе с DDL
+            conn.exec_driver_sql('BEGIN')
+            apply(conn)
+            conn.execute(text('UPDATE schema_version SET version = :version WHERE id = 1'), {'version': number})
+        logger.info('Миграция %s применена: %s', number, description)
+        current = number
+    return start_version, current
+
+
+def ensure_schema(app):
+    """Проверка при старте: одна строка schema_version; миграции — только если база отстаёт.
+
+    Ошибка миграции пробрасывается и останавливает запуск приложения.
+    """
+    with app.app_context():
+        if (get_schema_version() or 0) >= LATEST_VERSION:
+            return
+        try:
+            migrate()
+        except Exception:
+            # На недомигрированной схеме приложение не запускается; после исправления
+            # старт или `flask migrate` продолжат с последней успешной миграции
+            app.logger.exception('Не удалось применить миграции схемы')
+            raise
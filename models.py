@@ -2,22 +2,38 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 import random
-from sqlalchemy import text
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import column_property
+from events import queue_event
 
 db = SQLAlchemy()
 
 # Ассоциативная таблица для друзей
 friends = db.Table('friends',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('friend_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('friend_id', db.Integer, db.ForeignKey('user.id')),
+    db.Index('ix_friends_user_id', 'user_id'),
+    db.Index('ix_friends_friend_id', 'friend_id')
 )
 
 # Ассоциативная таблица для участников групп
 group_members = db.Table('group_members',
     db.Column('group_id', db.Integer, db.ForeignKey('group.id'), primary_key=True),
-    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Index('ix_group_members_user_id', 'user_id')  # PK покрывает только поиск по group_id
+)
+
+# Ассоциативная таблица для участников календаря
+calendar_members = db.Table('calendar_members',
+    db.Column('calendar_id', db.Integer, db.ForeignKey('calendar.id'), primary_key=True),
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('position', db.Integer),  # Старый числовой порядок, не обновляется (см. ordering.py)
+    db.Column('sort_key', db.String(64)),  # Лексикографический ключ порядка (ordering.py)
+    db.Index('ix_calendar_members_user_id', 'user_id'),  # PK покрывает только поиск по calendar_id
+    db.Index('ix_calendar_members_sort', 'calendar_id', 'sort_key')
 )
 
+
 class FriendRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -64,29 +80,61 @@ class Calendar(db.Model):
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_team = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, nullable=False, default=0)  # Растёт при каждом изменении смен
+
+    # Число участников (без владельца) подзапросом; отложено — в списках календарей
+    # включается через undefer(Calendar.member_count) вместо calendar.members|length
+    member_count = column_property(
+        select(func.count(calendar_members.c.user_id))
+        .where(calendar_members.c.calendar_id == id)
+        .correlate_except(calendar_members)
+        .scalar_subquery(),
+        deferred=True
+    )
 
     owner = db.relationship('User', backref='calendars')
     members = db.relationship('User', secondary='calendar_members', backref='shared_calendars')
-    shift_templates = db.relationship('ShiftTemplate', back_populates='calendar', lazy='dynamic', cascade='all, delete-orphan')
-    shifts = db.relationship('Shift', back_populates='calendar', lazy='dynamic', cascade='all, delete-orphan')
+    # Шаблоны и смены никогда не читаются коллекцией целиком: только запросы и запись.
+    # delete_calendar удаляет их массово, поэтому при удалении календаря ORM их не загружает
+    shift_templates = db.relationship('ShiftTemplate', back_populates='calendar', lazy='write_only',
+                                      cascade='all, delete-orphan', passive_deletes=True)
+    shifts = db.relationship('Shift', back_populates='calendar', lazy='write_only',
+                             cascade='all, delete-orphan', passive_deletes=True)
     groups = db.relationship('Group', back_populates='calendar', lazy='dynamic', cascade='all, delete-orphan')
 
 
 class Group(db.Model):
+    __table_args__ = (
+        db.Index('ix_group_calendar_sort', 'calendar_id', 'sort_key'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     color = db.Column(db.String(20), default='badge-color-1', nullable=False)
     calendar_id = db.Column(db.Integer, db.ForeignKey('calendar.id'), nullable=False)
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    position = db.Column(db.Integer, nullable=False, default=0)  # Позиция группы в календаре
+    position = db.Column(db.Integer, nullable=False, default=0)  # Старый числовой порядок, не обновляется
+    sort_key = db.Column(db.String(64))  # Лексикографический ключ порядка, первая группа — верхняя
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     calendar = db.relationship('Calendar', back_populates='groups')
     owner = db.relationship('User', backref='created_groups')
-    members = db.relationship('User', secondary=group_members, backref='groups')
+    # Состав группы нужен почти везде, где загружаются группы, — одним запросом на все группы
+    members = db.relationship('User', secondary=group_members, backref='groups', lazy='selectin')
 
 
 class Shift(db.Model):
+    __table_args__ = (
+        # Месяц календаря и аналитика: calendar_id + диапазон дат
+        db.Index('ix_shift_calendar_date', 'calendar_id', 'date'),
+        # Одна смена на человека в день в календаре: все пути записи проверяют занятый день заранее,
+        # дубли старых баз миграция переносит в shift_duplicate (migrations._unique_shift_day)
+        db.Index('uq_shift_calendar_user_date', 'calendar_id', 'user_id', 'date', unique=True),
+        # Профиль пользователя
+        db.Index('ix_shift_user_date', 'user_id', 'date'),
+        db.Index('ix_shift_template_id', 'template_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     start_time = db.Column(db.Time, nullable=False)
@@ -97,19 +145,178 @@ class Shift(db.Model):
     template_id = db.Column(db.Integer, db.ForeignKey('shift_template.id'))
     show_time = db.Column(db.Boolean, default=True)
     color_class = db.Column(db.String(20), default='badge-color-1', nullable=False)
+    # Вычисляются из start_time/end_time при записи (set_shift_duration, bulk_insert_shifts, apply_shift_batch)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=0)
+    crosses_midnight = db.Column(db.Boolean, nullable=False, default=False)
 
-    user = db.relationship('User', backref='shifts')
+    user = db.relationship('User', backref=db.backref('shifts', lazy='write_only'))
     calendar = db.relationship('Calendar', back_populates='shifts')
-    template = db.relationship('ShiftTemplate', backref='shifts')
+    # Смены шаблона отвязываются в delete_shift_template до удаления шаблона
+    template = db.relationship('ShiftTemplate', backref=db.backref('shifts', lazy='write_only', passive_deletes=True))
 
-# Ассоциативная таблица для участников календаря
-calendar_members = db.Table('calendar_members',
-    db.Column('calendar_id', db.Integer, db.ForeignKey('calendar.id'), primary_key=True),
-    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('position', db.Integer)  # Новое поле для порядка
+class ShiftChange(db.Model):
+    """Журнал изменений смен календаря для инкрементальной синхронизации."""
+    id = db.Column(db.Integer, primary_key=True)
+    calendar_id = db.Column(db.Integer, db.ForeignKey('calendar.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    shift_id = db.Column(db.Integer, nullable=True)  # NULL для action='reset'
+    action = db.Column(db.String(10), nullable=False)  # upsert / delete / reset
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ShiftDailyRollup(db.Model):
+    """Сводка смен за день по пользователю и цвету для аналитики (поддерживается триггерами, см. rollup.py)."""
+    __tablename__ = 'shift_daily_rollup'
+    __table_args__ = (
+        db.Index('ix_shift_rollup_calendar_date', 'calendar_id', 'date'),
+    )
+
+    calendar_id = db.Column(db.Integer, db.ForeignKey('calendar.id'), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)  # rollup.NO_USER (0) — смены без пользователя
+    date = db.Column(db.Date, primary_key=True)
+    color_class = db.Column(db.String(20), primary_key=True)
+    shift_count = db.Column(db.Integer, nullable=False, default=0)
+    timed_shift_count = db.Column(db.Integer, nullable=False, default=0)  # Смены с show_time
+    minutes = db.Column(db.Integer, nullable=False, default=0)  # Минуты смен с show_time
+
+
+class StaffingTarget(db.Model):
+    """Сколько человек нужно в календаре в день недели (0 — понедельник); покрытие в аналитике."""
+    __tablename__ = 'staffing_target'
+    __table_args__ = (
+        db.CheckConstraint('weekday BETWEEN 0 AND 6', name='ck_staffing_target_weekday'),
+    )
+
+    calendar_id = db.Column(db.Integer, db.ForeignKey('calendar.id'), primary_key=True)
+    weekday = db.Column(db.Integer, primary_key=True)
+    required = db.Column(db.Integer, nullable=False)
+
+
+# Сколько id смен пишем в журнал за одну операцию; при большем объёме
+# клиенты получают 'reset' и перезагружают месяц целиком
+SHIFT_CHANGE_LOG_LIMIT = 500
+
+
+def serialize_shift(shift):
+    """Смена в формате API календаря (get_calendar_shifts, changes, события)."""
+    shift_data = {
+        'id': shift.id,
+        'user_id': shift.user_id,
+        'date': shift.date.strftime('%Y-%m-%d'),
+        'title': shift.title,
+        'color_class': shift.color_class,
+        'show_time': shift.show_time
+    }
+    if shift.show_time and shift.start_time and shift.end_time:
+        shift_data['start_time'] = shift.start_time.strftime('%H:%M')
+        shift_data['end_time'] = shift.end_time.strftime('%H:%M')
+    return shift_data
+
+
+def record_shift_changes(calendar_id, upserted=(), deleted=(), reset=False):
+    """Увеличивает версию календаря и записывает изменённые смены в журнал.
+
+    Вызывается в той же транзакции, что и само изменение (до commit).
+    Заодно ставит событие 'shifts' для SSE-подписчиков календаря.
+    reset=True — для массовых операций без списка id (клиенты перезагружают месяц).
+    Возвращает новую версию календаря.
+    """
+    calendar_table = Calendar.__table__
+    version = db.session.execute(
+        calendar_table.update()
+        .where(calendar_table.c.id == calendar_id)
+        .values(version=calendar_table.c.version + 1)
+        .returning(calendar_table.c.version)
+    ).scalar()
+
+    upserted = list(upserted)
+    deleted = list(deleted)
+    if reset or len(upserted) + len(deleted) > SHIFT_CHANGE_LOG_LIMIT:
+        rows = [{'calendar_id': calendar_id, 'version': version, 'shift_id': None, 'action': 'reset'}]
+        queue_event(db.session, calendar_id, 'shifts', {'version': version, 'reset': True})
+    else:
+        rows = (
+            [{'calendar_id': calendar_id, 'version': version, 'shift_id': sid, 'action': 'upsert'} for sid in upserted] +
+            [{'calendar_id': calendar_id, 'version': version, 'shift_id': sid, 'action': 'delete'} for sid in deleted]
+        )
+        # Только что изменённые смены лежат в identity map — get() обходится без запросов
+        shifts = [db.session.get(Shift, sid) for sid in upserted]
+        queue_event(db.session, calendar_id, 'shifts', {
+            'version': version,
+            'reset': False,
+            'shifts': [serialize_shift(shift) for shift in shifts if shift is not None],
+            'deleted_ids': deleted
+        })
+    if rows:
+        db.session.execute(ShiftChange.__table__.insert(), rows)
+    return version
+
+
+def shift_duration(start_time, end_time):
+    """(duration_minutes, crosses_midnight): конец раньше начала — смена через полночь."""
+    minutes = (end_time.hour * 60 + end_time.minute) - (start_time.hour * 60 + start_time.minute)
+    if minutes < 0:
+        return minutes + 24 * 60, True
+    return minutes, False
+
+
+SHIFT_INSERT_COLUMNS = (
+    'title', 'start_time', 'end_time', 'calendar_id', 'user_id',
+    'date', 'template_id', 'show_time', 'color_class',
+    'duration_minutes', 'crosses_midnight'
 )
 
 
+def bulk_insert_shifts(rows):
+    """Массовая вставка смен одним executemany драйвера.
+
+    Значения приводятся к формату хранения обработчиками типов SQLAlchemy,
+    но по разу на каждое различающееся значение, а не на каждую строку —
+    на десятках тысяч смен это основная часть времени вставки.
+    Возвращает число вставленных строк.
+    """
+    if not rows:
+        return 0
+    connection = db.session.connection()
+    dialect = connection.dialect
+    table = Shift.__table__
+    converters = [
+        (name, table.c[name].type.dialect_impl(dialect).bind_processor(dialect), {})
+        for name in SHIFT_INSERT_COLUMNS
+    ]
+
+    durations = {}
+    params = []
+    for row in rows:
+        times = (row['start_time'], row['end_time'])
+        if times not in durations:
+            durations[times] = shift_duration(*times)
+        row = dict(row, duration_minutes=durations[times][0], crosses_midnight=durations[times][1])
+        values = []
+        for name, processor, cache in converters:
+            value = row.get(name)
+            if processor is not None and value is not None:
+                if value not in cache:
+                    cache[value] = processor(value)
+                value = cache[value]
+            values.append(value)
+        params.append(tuple(values))
+
+    placeholder = '?' if dialect.paramstyle == 'qmark' else '%s'
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        dialect.identifier_preparer.format_table(table),
+        ', '.join(dialect.identifier_preparer.quote(name) for name in SHIFT_INSERT_COLUMNS),
+        ', '.join([placeholder] * len(SHIFT_INSERT_COLUMNS))
+    )
+    connection.exec_driver_sql(sql, params)
+    return len(params)
+
+
+def get_shift_ids(*criteria):
+    """Id смен по условию — для журнала перед массовым удалением/обновлением."""
+    return list(db.session.execute(select(Shift.id).where(*criteria)).scalars())
+
+
 class ShiftTemplate(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
@@ -119,84 +326,18 @@ class ShiftTemplate(db.Model):
     owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     show_time = db.Column(db.Boolean, default=True)
     color_class = db.Column(db.String(20), default='badge-color-1', nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=0)
+    crosses_midnight = db.Column(db.Boolean, nullable=False, default=False)
 
     calendar = db.relationship('Calendar', back_populates='shift_templates')
     owner = db.relationship('User', backref='shift_templates')
 
 
-def ensure_user_columns():
-    """Гарантирует наличие колонок first_name/last_name/age/phone в таблице user (SQLite)."""
-    try:
-        with db.engine.connect() as conn:
-            # Получаем список колонок таблицы user
-            result = conn.execute(text("PRAGMA table_info('user')"))
-            table_info = result.fetchall()
-            columns = {row[1]: row for row in table_info}  # name -> row
-
-            # Добавляем колонки при отсутствии: NOT NULL + DEFAULT ''
-            if 'first_name' not in columns:
-                conn.execute(text('ALTER TABLE "user" ADD COLUMN first_name VARCHAR(50) NOT NULL DEFAULT ""'))
-            if 'last_name' not in columns:
-                conn.execute(text('ALTER TABLE "user" ADD COLUMN last_name VARCHAR(50) NOT NULL DEFAULT ""'))
-            
-            # Добавляем новые колонки age и phone (nullable)
-            if 'age' not in columns:
-                conn.execute(text('ALTER TABLE "user" ADD COLUMN age INTEGER'))
-            if 'phone' not in columns:
-                conn.execute(text('ALTER TABLE "user" ADD COLUMN phone VARCHAR(20)'))
-
-            # Если колонки есть, но допускают NULL или пустые значения — создаём защитные триггеры
-            # PRAGMA table_info: (cid, name, type, notnull, dflt_value, pk)
-            def _create_trigger_if_missing(trigger_name: str, sql: str):
-                exists = conn.execute(text(
-                    "SELECT name FROM sqlite_master WHERE type='trigger' AND name=:name"
-                ), {"name": trigger_name}).fetchone()
-                if not exists:
-                    conn.execute(text(sql))
-
-            # Триггеры на first_name
-            first_info = columns.get('first_name')
-            if first_info and (first_info[3] == 0):  # notnull == 0
-                _create_trigger_if_missing(
-                    'user_first_name_not_empty_insert',
-                    (
-                        'CREATE TRIGGER user_first_name_not_empty_insert '\
-                        'BEFORE INSERT ON "user" '\
-                        'FOR EACH ROW WHEN NEW.first_name IS NULL OR length(trim(NEW.first_name))=0 '\
-                        "BEGIN SELECT RAISE(ABORT, 'first_name required'); END;"
-                    )
-                )
-                _create_trigger_if_missing(
-                    'user_first_name_not_empty_update',
-                    (
-                        'CREATE TRIGGER user_first_name_not_empty_update '\
-                        'BEFORE UPDATE OF first_name ON "user" '\
-                        'FOR EACH ROW WHEN NEW.first_name IS NULL OR length(trim(NEW.first_name))=0 '\
-                        "BEGIN SELECT RAISE(ABORT, 'first_name required'); END;"
-                    )
-                )
-
-            # Триггеры на last_name
-            last_info = columns.get('last_name')
-            if last_info and (last_info[3] == 0):  # notnull == 0
-                _create_trigger_if_missing(
-                    'user_last_name_not_empty_insert',
-                    (
-                        'CREATE TRIGGER user_last_name_not_empty_insert '\
-                        'BEFORE INSERT ON "user" '\
-                        'FOR EACH ROW WHEN NEW.last_name IS NULL OR length(trim(NEW.last_name))=0 '\
-                        "BEGIN SELECT RAISE(ABORT, 'last_name required'); END;"
-                    )
-                )
-                _create_trigger_if_missing(
-                    'user_last_name_not_empty_update',
-                    (
-                        'CREATE TRIGGER user_last_name_not_empty_update '\
-                        'BEFORE UPDATE OF last_name ON "user" '\
-                        'FOR EACH ROW WHEN NEW.last_name IS NULL OR length(trim(NEW.last_name))=0 '\
-                        "BEGIN SELECT RAISE(ABORT, 'last_name required'); END;"
-                    )
-                )
-    except Exception:
-        # Избегаем падения приложения на старте, детали будут в логах Flask
-        pass
\ No newline at end of file
+@event.listens_for(Shift, 'before_insert')
+@event.listens_for(Shift, 'before_update')
+@event.listens_for(ShiftTemplate, 'before_insert')
+@event.listens_for(ShiftTemplate, 'before_update')
+def set_shift_duration(mapper, connection, target):
+    """Длительность смены или шаблона пересчитывается при каждой записи через ORM."""
+    if target.start_time is not None and target.end_time is not None:
+        target.duration_minutes, target.crosses_midnight = shift_duration(target.start_time, target.end_time)
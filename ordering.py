@@ -0,0 +1,267 @@
+"""Порядок участников и групп календаря лексикографическими ключами.
+
+sort_key — дробь 0.xxx в 62-ричной записи без хвостовых нулей, хранится
+строкой: порядок строк совпадает с порядком чисел (BINARY-сравнение SQLite),
+и между любыми двумя ключами всегда найдётся третий. Поэтому перенос
+элемента меняет одну строку. Ключи удлиняются только при многократных
+вставках в одно и то же место — тогда порядок календаря перенумеровывается
+(rebalance) равномерными короткими ключами.
+
+Участники упорядочены по возрастанию ключа, группы тоже: первая группа —
+верхняя в таблице. Колонка position больше не обновляется; позиции в ответах
+API вычисляются из порядка.
+"""
+from sqlalchemy import bindparam, func, select
+
+from models import db, Group, calendar_members
+
+RANK_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+RANK_BASE = len(RANK_DIGITS)
+RANK_VALUES = {digit: value for value, digit in enumerate(RANK_DIGITS)}
+
+# Ключ длиннее — порядок календаря перенумеровывается
+RANK_MAX_LENGTH = 24
+
+
+def _decode(key, width):
+    value = 0
+    for index in range(width):
+        value = value * RANK_BASE + (RANK_VALUES[key[index]] if index < len(key) else 0)
+    return value
+
+
+def _encode(value, width):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, RANK_BASE)
+        digits.append(RANK_DIGITS[digit])
+    return ''.join(reversed(digits)).rstrip('0')
+
+
+def rank_keys_between(lower=None, upper=None, count=1, min_gap=1):
+    """count возрастающих ключей строго между lower и upper (None — без границы).
+
+    Ключи распределяются равномерно; min_gap > 1 оставляет между соседними
+    ключами место для вставок без удлинения.
+    """
+    if lower is not None and upper is not None and lower >= upper:
+        raise ValueError('lower должен быть меньше upper')
+    width = max(len(lower or ''), len(upper or ''), 1)
+    while True:
+        low = _decode(lower, width) if lower else 0
+        high = _decode(upper, width) if upper else RANK_BASE ** width
+        if high - low >= (count + 1) * min_gap:
+            break
+        width += 1
+    span = high - low
+    return [_encode(low + span * (index + 1) // (count + 1), width) for index in range(count)]
+
+
+def rank_between(lower=None, upper=None):
+    """Ключ строго между lower и upper."""
+    return rank_keys_between(lower, upper, 1)[0]
+
+
+class _OrderedSet:
+    """Упорядоченный по sort_key набор строк одного календаря."""
+
+    def __init__(self, table, id_column, calendar_id):
+        self.table = table
+        self.id_column = id_column
+        self.scope = table.c.calendar_id == calendar_id
+        self.sort_key = table.c.sort_key
+
+    def ordered(self):
+        """[(id, sort_key)] сверху вниз."""
+        return db.session.execute(
+            select(self.id_column, self.sort_key)
+            .where(self.scope)
+            .order_by(self.sort_key, self.id_column)
+        ).all()
+
+    def key_of(self, item_id):
+        """Ключ элемента; None — элемента нет. Строки без ключа (старые данные) перенумеровываются."""
+        row = db.session.execute(
+            select(self.sort_key).where(self.scope, self.id_column == item_id)
+        ).first()
+        if row is None:
+            return None
+        if row.sort_key is None:
+            self.rebalance()
+            return self.key_of(item_id)
+        return row.sort_key
+
+    def _neighbour(self, item_id, key, above):
+        condition = self.sort_key < key if above else self.sort_key > key
+        aggregate = func.max if above else func.min
+        return db.session.execute(
+            select(aggregate(self.sort_key)).where(self.scope, condition, self.id_column != item_id)
+        ).scalar()
+
+    def _write(self, keys):
+        """keys: {id: sort_key} — один executemany UPDATE."""
+        if not keys:
+            return
+        db.session.execute(
+            self.table.update()
+            .where(self.scope, self.id_column == bindparam('b_id'))
+            .values(sort_key=bindparam('b_key')),
+            [{'b_id': item_id, 'b_key': key} for item_id, key in keys.items()]
+        )
+
+    def move(self, item_id, after_id=None, before_id=None):
+        """Ставит элемент сразу после after_id, перед before_id или (без обоих) наверх.
+
+        Меняется одна строка; если соседние ключи совпали или ключ вышел
+        длиннее RANK_MAX_LENGTH, набор перенумеровывается целиком.
+        Возвращает False, если элемента или соседа нет в календаре.
+        """
+        if self.key_of(item_id) is None:
+            return False
+        if after_id is not None:
+            lower = self.key_of(after_id)
+            if lower is None:
+                return False
+            upper = self._neighbour(item_id, lower, above=False)
+        elif before_id is not None:
+            upper = self.key_of(before_id)
+            if upper is None:
+                return False
+            lower = self._neighbour(item_id, upper, above=True)
+        else:
+            lower = None
+            upper = db.session.execute(
+                select(func.min(self.sort_key)).where(self.scope, self.id_column != item_id)
+            ).scalar()
+
+        if lower is not None and upper is not None and lower >= upper:
+            # Дубли ключей (старые данные или гонка) — перенумеровываем и повторяем
+            self.rebalance()
+            return self.move(item_id, after_id, before_id)
+
+        key = rank_between(lower, upper)
+        self._write({item_id: key})
+        if len(key) > RANK_MAX_LENGTH:
+            self.rebalance()
+        return True
+
+    def reorder(self, ordered_ids):
+        """Приводит порядок к ordered_ids, переписывая минимум строк.
+
+        Элементы, не попавшие в ordered_ids, уходят в конец в прежнем порядке.
+        Остаются на месте элементы наибольшей возрастающей подпоследовательности
+        текущего порядка; остальные получают ключи между соседями.
+        Возвращает число изменённых строк.
+        """
+        current = self.ordered()
+        current_keys = dict(current)
+        seen = set()
+        target = []
+        for item_id in ordered_ids:
+            if item_id in current_keys and item_id not in seen:
+                seen.add(item_id)
+                target.append(item_id)
+        target.extend(item_id for item_id, _ in current if item_id not in seen)
+
+        rank = {item_id: index for index, (item_id, _) in enumerate(current)}
+        keep = _longest_increasing(target, rank)
+        # Ключи оставленных элементов должны строго возрастать, иначе между ними не вставить
+        kept_keys = [current_keys[item_id] for item_id in target if item_id in keep]
+        if any(key is None for key in kept_keys) or any(a >= b for a, b in zip(kept_keys, kept_keys[1:])):
+            keys = dict(zip(target, rank_keys_between(None, None, len(target), min_gap=RANK_BASE)))
+            self._write(keys)
+            return len(keys)
+
+        new_keys = {}
+        pending = []
+        lower = None
+        for item_id in target + [None]:
+            if item_id is not None and item_id not in keep:
+                pending.append(item_id)
+                continue
+            upper = current_keys[item_id] if item_id is not None else None
+            if pending:
+                new_keys.update(zip(pending, rank_keys_between(lower, upper, len(pending))))
+                pending = []
+            lower = upper
+        self._write(new_keys)
+        if any(len(key) > RANK_MAX_LENGTH for key in new_keys.values()):
+            self.rebalance()
+        return len(new_keys)
+
+    def append_keys(self, count):
+        """Ключи для count новых элементов в конце."""
+        last = db.session.execute(select(func.max(self.sort_key)).where(self.scope)).scalar()
+        return rank_keys_between(last, None, count)
+
+    def top_key(self):
+        """Ключ для нового элемента в начале."""
+        first = db.session.execute(select(func.min(self.sort_key)).where(self.scope)).scalar()
+        return rank_between(None, first)
+
+    def rebalance(self):
+        """Равномерные короткие ключи в текущем порядке. Возвращает число строк."""
+        ids = [item_id for item_id, _ in self.ordered()]
+        if ids:
+            self._write(dict(zip(ids, rank_keys_between(None, None, len(ids), min_gap=RANK_BASE))))
+        return len(ids)
+
+
+def _longest_increasing(sequence, rank):
+    """Множество элементов наибольшей подпоследовательности sequence, возрастающей по rank."""
+    tails, tail_index, previous = [], [], [None] * len(sequence)
+    for index, item in enumerate(sequence):
+        value = rank[item]
+        low, high = 0, len(tails)
+        while low < high:
+            middle = (low + high) // 2
+            if tails[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(tails):
+            tails.append(value)
+            tail_index.append(index)
+        else:
+            tails[low] = value
+            tail_index[low] = index
+        previous[index] = tail_index[low - 1] if low else None
+    result = set()
+    index = tail_index[-1] if tail_index else None
+    while index is not None:
+        result.add(sequence[index])
+        index = previous[index]
+    return result
+
+
+def member_order(calendar_id):
+    """Порядок участников календаря (без владельца)."""
+    return _OrderedSet(calendar_members, calendar_members.c.user_id, calendar_id)
+
+
+def group_order(calendar_id):
+    """Порядок групп календаря: первая — верхняя."""
+    table = Group.__table__
+    return _OrderedSet(table, table.c.id, calendar_id)
+
+
+def rebalance_calendar_order(calendar_id):
+    """Перенумеровывает участников и группы календаря. Возвращает число строк."""
+    return member_order(calendar_id).rebalance() + group_order(calendar_id).rebalance()
+
+
+def calendars_needing_rebalance(max_length=RANK_MAX_LENGTH):
+    """Id календарей, где ключ участника или группы длиннее max_length."""
+    group_table = Group.__table__
+    ids = set()
+    for table in (calendar_members, group_table):
+        ids.update(db.session.execute(
+            select(table.c.calendar_id).where(func.length(table.c.sort_key) > max_length).distinct()
+        ).scalars())
+    return sorted(ids)
+
+
+def group_positions(calendar_id):
+    """{group_id: позиция} для ответов API: у верхней группы наибольшая, как у прежнего position."""
+    ids = [group_id for group_id, _ in group_order(calendar_id).ordered()]
+    return {group_id: len(ids) - index for index, group_id in enumerate(ids)}
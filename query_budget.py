@@ -0,0 +1,51 @@
+"""Бюджет SQL-запросов для горячих маршрутов.
+
+Маршрут объявляет, сколько запросов ему положено:
+
+    @app.route(...)
+    @login_required
+    @query_budget(6)
+    def view(...):
+
+Запросы считаются слушателем before_cursor_execute только внутри таких
+маршрутов (загрузка пользователя в login_required в бюджет не входит).
+При превышении пишется предупреждение в лог, а с QUERY_BUDGET_STRICT=True
+(тестовый режим) маршрут падает с QueryBudgetExceeded — так N+1 видно сразу.
+"""
+import functools
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and g.get('query_budget') is not None:
+        g.query_count += 1
+
+
+def query_budget(limit):
+    """Декоратор маршрута: не больше limit SQL-запросов на вызов."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.query_budget = limit
+            g.query_count = 0
+            try:
+                response = view(*args, **kwargs)
+            finally:
+                count = g.query_count
+                g.query_budget = None
+            if count > limit:
+                message = f'{view.__name__}: {count} SQL-запросов при бюджете {limit}'
+                if current_app.config.get('QUERY_BUDGET_STRICT'):
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,86 @@
+"""Дневная сводка смен shift_daily_rollup.
+
+Строка сводки — (calendar_id, user_id, date, color_class) с числом смен,
+числом смен со временем и их минутами. Сводку поддерживают триггеры SQLite
+на таблице shift, поэтому она меняется в той же транзакции, что и сами
+смены, при любом способе записи: ORM, bulk_insert_shifts, INSERT ... SELECT
+копирования. Смены без пользователя входят в сводку с user_id = NO_USER:
+их часы и число смен учитываются в трендах так же, как в shift_stats.
+
+Если сводка разошлась со сменами (ручная правка базы), её пересобирает
+rebuild_shift_rollup / `flask rebuild-rollup`.
+"""
+from sqlalchemy import text
+
+from models import db
+
+NO_USER = 0  # user_id строк сводки для смен без пользователя (настоящие id начинаются с 1)
+
+_KEY = 'calendar_id, user_id, date, color_class'
+
+# Вклад одной смены в сводку; {row} — NEW или OLD
+_USER = f'COALESCE({{row}}.user_id, {NO_USER})'
+_TIMED = 'CASE WHEN {row}.show_time THEN 1 ELSE 0 END'
+_MINUTES = 'CASE WHEN {row}.show_time THEN {row}.duration_minutes ELSE 0 END'
+
+_ADD = (
+    'INSERT INTO shift_daily_rollup ({key}, shift_count, timed_shift_count, minutes) '
+    'SELECT NEW.calendar_id, {user}, NEW.date, NEW.color_class, 1, {timed}, {minutes} '
+    'WHERE true '  # без WHERE SQLite принял бы ON CONFLICT за часть JOIN
+    'ON CONFLICT ({key}) DO UPDATE SET '
+    'shift_count = shift_count + excluded.shift_count, '
+    'timed_shift_count = timed_shift_count + excluded.timed_shift_count, '
+    'minutes = minutes + excluded.minutes;'
+).format(key=_KEY, user=_USER.format(row='NEW'), timed=_TIMED.format(row='NEW'), minutes=_MINUTES.format(row='NEW'))
+
+_OLD_KEY = (
+    'calendar_id = OLD.calendar_id AND user_id = {user} '
+    'AND date = OLD.date AND color_class = OLD.color_class'
+).format(user=_USER.format(row='OLD'))
+_SUBTRACT = (
+    'UPDATE shift_daily_rollup SET shift_count = shift_count - 1, '
+    'timed_shift_count = timed_shift_count - {timed}, minutes = minutes - {minutes} '
+    'WHERE {old_key}; '
+    'DELETE FROM shift_daily_rollup WHERE {old_key} AND shift_count <= 0;'
+).format(timed=_TIMED.format(row='OLD'), minutes=_MINUTES.format(row='OLD'), old_key=_OLD_KEY)
+
+ROLLUP_TRIGGERS = {
+    'shift_rollup_insert': f'CREATE TRIGGER shift_rollup_insert AFTER INSERT ON shift BEGIN {_ADD} END;',
+    'shift_rollup_delete': f'CREATE TRIGGER shift_rollup_delete AFTER DELETE ON shift BEGIN {_SUBTRACT} END;',
+    'shift_rollup_update': (
+        'CREATE TRIGGER shift_rollup_update AFTER UPDATE OF '
+        'calendar_id, user_id, date, color_class, show_time, duration_minutes ON shift '
+        f'BEGIN {_SUBTRACT} {_ADD} END;'
+    ),
+}
+
+
+def create_rollup_triggers(conn, replace=False):
+    """Создаёт недостающие триггеры сводки; replace=True пересоздаёт и существующие."""
+    for name, sql in ROLLUP_TRIGGERS.items():
+        if replace:
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        exists = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type='trigger' AND name=:name"
+        ), {'name': name}).fetchone()
+        if not exists:
+            conn.execute(text(sql))
+
+
+def rebuild_shift_rollup(calendar_id=None, conn=None):
+    """Пересобирает сводку из shift (всю или одного календаря). Возвращает число строк сводки.
+
+    conn — соединение миграции; по умолчанию сессия, commit делает вызывающий.
+    """
+    conn = conn if conn is not None else db.session
+    scope = '' if calendar_id is None else ' WHERE calendar_id = :calendar_id'
+    user = _USER.format(row='shift')
+    params = {'calendar_id': calendar_id}
+    conn.execute(text(f'DELETE FROM shift_daily_rollup{scope}'), params)
+    conn.execute(text(
+        f'INSERT INTO shift_daily_rollup ({_KEY}, shift_count, timed_shift_count, minutes) '
+        f'SELECT calendar_id, {user}, date, color_class, '
+        f'COUNT(*), SUM({_TIMED.format(row="shift")}), SUM({_MINUTES.format(row="shift")}) '
+        f'FROM shift{scope} GROUP BY calendar_id, {user}, date, color_class'
+    ), params)
+    return conn.execute(text(f'SELECT COUNT(*) FROM shift_daily_rollup{scope}'), params).scalar()
@@ -1,10 +1,30 @@
 import traceback
 import logging
-from flask import render_template, request, redirect, url_for, flash, jsonify, abort
-from sqlalchemy import exists, and_, or_, extract
+import queue
+import time
+import json
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort, Response, send_file, stream_with_context
+from sqlalchemy import exists, and_, or_, select
+from sqlalchemy.orm import joinedload, lazyload, undefer
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
-from models import db, User, generate_user_id, generate_calendar_id, FriendRequest, Calendar, Shift, ShiftTemplate, calendar_members, Group, group_members
+from models import db, User, generate_user_id, generate_calendar_id, FriendRequest, Calendar, Shift, ShiftTemplate, StaffingTarget, calendar_members, friends as friends_table, Group, group_members, ShiftChange, record_shift_changes, get_shift_ids, serialize_shift, bulk_insert_shifts
+from events import broker, queue_event, format_sse
+from shift_batch import apply_shift_batch
+from scheduling import rotation_assignments, build_shift_rows
+from query_budget import query_budget
+from analytics import build_analysis, analysis_scope, profile_shift_totals
+from analysis_cache import analysis_cache, analysis_cache_key, calendar_versions
+from export import (
+    ANALYSIS_SECTIONS, CSV_MIMETYPE, SHIFT_EXPORT_HEADER, XLSX_MIMETYPE,
+    analysis_tables, csv_stream, shift_export_rows, xlsx_available, xlsx_file
+)
+from ordering import member_order, group_order, group_positions
+from calendar_copy import copy_shift_range, clone_calendar
+from access import (
+    ROLE_OWNER, resolve_calendar_roles, calendar_role, can_access_calendar,
+    is_calendar_member, calendar_member_ids, users_by_ids
+)
 
 from datetime import datetime, timedelta, timezone
 from config import Config
@@ -33,13 +53,30 @@ def add_jinja2_filters(app):
 
     env.filters['to_msk'] = to_msk
 
+    # Роль текущего пользователя в календаре (owner / member / None) без загрузки участников
+    env.globals['calendar_role'] = calendar_role
+
 
 def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in Config.ALLOWED_EXTENSIONS
 
 
+def parse_calendar_month(month):
+    """Возвращает (первый, последний) день месяца из строки вида YYYY-MM-DD.
+    При пустом или некорректном значении используется текущий месяц."""
+    try:
+        current_month = datetime.strptime(month, '%Y-%m-%d').date().replace(day=1)
+    except (TypeError, ValueError):
+        current_month = datetime.utcnow().date().replace(day=1)
+    next_month = current_month.replace(day=28) + timedelta(days=4)
+    last_day = next_month - timedelta(days=next_month.day)
+    return current_month, last_day
+
+
 def register_routes(app):
+    analysis_cache.configure(app.config['ANALYSIS_CACHE_SIZE'], app.config['ANALYSIS_CACHE_TTL'])
+
     @app.route('/')
     def home():
         return render_template('index.html')
@@ -275,11 +312,29 @@ def register_routes(app):
 
         users = users_query.filter(User.id != current_user.id).limit(10).all()
 
+        # Дружба и заявки для всей страницы результатов — по запросу на каждое, а не на пользователя
+        found_ids = [user.id for user in users]
+        friend_ids = set(db.session.execute(
+            select(friends_table.c.friend_id).where(
+                friends_table.c.user_id == current_user.id, friends_table.c.friend_id.in_(found_ids)
+            )
+        ).scalars()) if found_ids else set()
+        outgoing_ids = set(db.session.execute(
+            select(FriendRequest.receiver_id).where(
+                FriendRequest.sender_id == current_user.id, FriendRequest.receiver_id.in_(found_ids)
+            )
+        ).scalars()) if found_ids else set()
+        incoming_ids = set(db.session.execute(
+            select(FriendRequest.sender_id).where(
+                FriendRequest.receiver_id == current_user.id, FriendRequest.sender_id.in_(found_ids)
+            )
+        ).scalars()) if found_ids else set()
+
         results = []
         for user in users:
-            is_friend = user in current_user.friends
-            outgoing = FriendRequest.query.filter_by(sender_id=current_user.id, receiver_id=user.id).first() is not None
-            incoming = FriendRequest.query.filter_by(sender_id=user.id, receiver_id=current_user.id).first() is not None
+            is_friend = user.id in friend_ids
+            outgoing = user.id in outgoing_ids
+            incoming = user.id in incoming_ids
 
             if is_friend:
                 request_status = 'friends'
@@ -329,11 +384,22 @@ def register_routes(app):
 
     @app.route('/my-calendars')
     @login_required
+    @query_budget(4)
     def my_calendars():
-        # Получаем календари пользователя
+        # Получаем календари пользователя; число участников и владельцы — в тех же запросах
         personal_calendars = Calendar.query.filter_by(owner_id=current_user.id, is_team=False).all()
-        team_calendars = Calendar.query.filter_by(owner_id=current_user.id, is_team=True).all()
-        shared_calendars = current_user.shared_calendars
+        team_calendars = (
+            Calendar.query.filter_by(owner_id=current_user.id, is_team=True)
+            .options(undefer(Calendar.member_count))
+            .all()
+        )
+        shared_calendars = (
+            Calendar.query
+            .join(calendar_members, calendar_members.c.calendar_id == Calendar.id)
+            .filter(calendar_members.c.user_id == current_user.id)
+            .options(joinedload(Calendar.owner))
+            .all()
+        )
 
         return render_template(
             'calendar/my_calendars.html',
@@ -376,26 +442,16 @@ def register_routes(app):
 
     @app.route('/calendar/<int:calendar_id>')
     @login_required
+    @query_budget(9)
     def view_calendar(calendar_id):
         calendar = Calendar.query.get_or_404(calendar_id)
 
         # Проверка доступа
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
+        if not can_access_calendar(calendar):
             abort(403)
 
-        # Получаем месяц
-        month = request.args.get('month')
-        if month:
-            try:
-                current_month = datetime.strptime(month, '%Y-%m-%d').date().replace(day=1)
-            except ValueError:
-                current_month = datetime.utcnow().date().replace(day=1)
-        else:
-            current_month = datetime.utcnow().date().replace(day=1)
-
-        # Получаем все дни месяца
-        next_month = current_month.replace(day=28) + timedelta(days=4)
-        last_day = next_month - timedelta(days=next_month.day)
+        # Получаем месяц и все его дни
+        current_month, last_day = parse_calendar_month(request.args.get('month'))
         days_in_month = [current_month.replace(day=day) for day in range(1, last_day.day + 1)]
 
         # Получаем участников с позициями
@@ -405,17 +461,14 @@ def register_routes(app):
         owner = User.query.get(calendar.owner_id)
         members_with_positions.append((owner, 0))
 
-        # Добавляем остальных участников с их позициями
-        other_members = db.session.query(
-            User,
-            calendar_members.c.position
-        ).join(
+        # Добавляем остальных участников в порядке sort_key, позиция — номер в этом порядке
+        other_members = db.session.query(User).join(
             calendar_members,
             (calendar_members.c.user_id == User.id) &
             (calendar_members.c.calendar_id == calendar.id)
-        ).order_by(calendar_members.c.position).all()
+        ).order_by(calendar_members.c.sort_key, User.id).all()
 
-        members_with_positions.extend(other_members)
+        members_with_positions.extend((member, index) for index, member in enumerate(other_members, start=1))
 
         # Создаем списки для передачи в шаблон
         members_sorted = [m[0] for m in members_with_positions]
@@ -435,18 +488,18 @@ def register_routes(app):
             Shift.date <= last_day
         ).all()
 
-        # Преобразуем смены в удобный формат для шаблона
-        shifts = []
+        # Раскладываем смены в сетку {user_id: {date: [смены]}} за один проход,
+        # чтобы шаблон брал ячейку напрямую, а не перебирал все смены месяца
+        shift_grid = {}
         for shift, template_show_time, template_color_class in shifts_with_templates:
-            show_time = template_show_time if template_show_time is not None else True
-            color_class = template_color_class if template_color_class else 'badge-color-1'
-            shifts.append({
+            shift_grid.setdefault(shift.user_id, {}).setdefault(shift.date, []).append({
                 'id': shift.id,
                 'title': shift.title,
                 'start_time': shift.start_time.strftime('%H:%M'),
                 'end_time': shift.end_time.strftime('%H:%M'),
                 'date': shift.date,
                 'user_id': shift.user_id,
+                'template_id': shift.template_id,
                 'show_time': shift.show_time,
                 'color_class': shift.color_class
             })
@@ -454,8 +507,8 @@ def register_routes(app):
         # Получаем шаблоны
         shift_templates = ShiftTemplate.query.filter_by(calendar_id=calendar.id).all()
 
-        # Получаем группы календаря
-        groups = Group.query.filter_by(calendar_id=calendar.id).all()
+        # Получаем группы календаря сверху вниз (состав групп — одним selectin-запросом)
+        groups = Group.query.filter_by(calendar_id=calendar.id).order_by(Group.sort_key, Group.id).all()
         
         # Создаем словарь для быстрого поиска групп пользователей
         user_groups = {}
@@ -469,7 +522,7 @@ def register_routes(app):
             'calendar/view_calendar.html',
             calendar=calendar,
             current_user=current_user,
-            shifts=shifts,  # Теперь передаем список словарей вместо объектов Shift
+            shift_grid=shift_grid,  # Смены, сгруппированные по участнику и дню
             shift_templates=shift_templates,
             current_month=current_month,
             days_in_month=days_in_month,
@@ -497,20 +550,29 @@ def register_routes(app):
         date = request.form.get('date')
 
         try:
+            shift_date = datetime.strptime(date, '%Y-%m-%d').date()
+
+            # Одна смена на пользователя в день (уникальный индекс на Shift)
+            if Shift.query.filter_by(calendar_id=calendar.id, user_id=user_id, date=shift_date).first():
+                return jsonify({'success': False, 'error': 'У пользователя уже есть смена в этот день'}), 400
+
             shift = Shift(
                 title=title,
                 start_time=datetime.strptime(start_time, '%H:%M').time(),
                 end_time=datetime.strptime(end_time, '%H:%M').time(),
                 calendar_id=calendar.id,
                 user_id=user_id,
-                date=datetime.strptime(date, '%Y-%m-%d').date()
+                date=shift_date
             )
 
             db.session.add(shift)
+            db.session.flush()
+            record_shift_changes(calendar.id, upserted=[shift.id])
             db.session.commit()
 
             return jsonify({'success': True, 'shift_id': shift.id})
         except Exception as e:
+            db.session.rollback()
             return jsonify({'success': False, 'error': str(e)}), 400
 
     @app.route('/calendar/<int:calendar_id>/add-members', methods=['POST'])
@@ -525,31 +587,31 @@ def register_routes(app):
         user_ids = data.get('user_ids', [])
         added_members = []
 
-        # Получаем текущую максимальную позицию
-        max_position = db.session.query(db.func.max(calendar_members.c.position)).filter(
-            calendar_members.c.calendar_id == calendar.id
-        ).scalar() or 0
-
-        # Назначаем уникальные возрастающие позиции для каждого добавляемого пользователя
-        for idx, user_id in enumerate(user_ids, start=1):
-            user = User.query.get(user_id)
+        # Новые участники встают в конец: ключи порядка после последнего участника
+        existing_ids = calendar_member_ids(calendar.id)
+        sort_keys = iter(member_order(calendar.id).append_keys(len(user_ids))) if user_ids else iter(())
+        users_by_id = users_by_ids(user_ids)
+        for user_id in user_ids:
+            user = users_by_id.get(user_id)
             if not user:
                 return jsonify({'success': False, 'message': f'Пользователь с ID {user_id} не найден'}), 400
 
-            if user not in calendar.members:
-                new_position = max_position + idx
+            if user.id not in existing_ids:
+                existing_ids.add(user.id)
                 db.session.execute(calendar_members.insert().values(
                     calendar_id=calendar.id,
                     user_id=user.id,
-                    position=new_position
+                    sort_key=next(sort_keys)
                 ))
                 added_members.append({
                     'id': user.id,
                     'username': user.username,
                     'avatar': user.avatar,
-                    'position': new_position
+                    'position': len(existing_ids)
                 })
 
+        if added_members:
+            queue_event(db.session, calendar.id, 'members', {'added': [m['id'] for m in added_members]})
         db.session.commit()
 
         return jsonify({
@@ -567,12 +629,18 @@ def register_routes(app):
         if calendar.owner_id != current_user.id:
             abort(403)
 
-        if user in calendar.members:
+        if is_calendar_member(calendar.id, user.id):
             # Удаляем все смены пользователя в этом календаре
+            deleted_ids = get_shift_ids(Shift.calendar_id == calendar.id, Shift.user_id == user.id)
             Shift.query.filter_by(calendar_id=calendar.id, user_id=user.id).delete()
+            record_shift_changes(calendar.id, deleted=deleted_ids)
 
             # Удаляем пользователя из календаря
-            calendar.members.remove(user)
+            db.session.execute(calendar_members.delete().where(
+                calendar_members.c.calendar_id == calendar.id,
+                calendar_members.c.user_id == user.id
+            ))
+            queue_event(db.session, calendar.id, 'members', {'removed': [user.id]})
             db.session.commit()
 
             return jsonify({
@@ -599,8 +667,11 @@ def register_routes(app):
         try:
             # Удаляем все связанные шаблоны вручную (на всякий случай)
             ShiftTemplate.query.filter_by(calendar_id=calendar.id).delete()
-            # Удаляем все связанные смены
+            # Нормы численности
+            StaffingTarget.query.filter_by(calendar_id=calendar.id).delete()
+            # Удаляем все связанные смены и журнал их изменений
             Shift.query.filter_by(calendar_id=calendar.id).delete()
+            ShiftChange.query.filter_by(calendar_id=calendar.id).delete()
             # Удаляем связи с участниками
             db.session.execute(calendar_members.delete().where(calendar_members.c.calendar_id == calendar.id))
 
@@ -631,7 +702,9 @@ def register_routes(app):
             abort(403)
 
         calendar_id = shift.calendar_id
+        deleted_id = shift.id
         db.session.delete(shift)
+        record_shift_changes(calendar_id, deleted=[deleted_id])
         db.session.commit()
 
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -677,7 +750,7 @@ def register_routes(app):
         data = request.get_json()
         try:
             calendar = Calendar.query.get(data['calendar_id'])
-            if not calendar or (calendar.owner_id != current_user.id and current_user not in calendar.members):
+            if not calendar or (not can_access_calendar(calendar)):
                 return jsonify({'success': False, 'error': 'Доступ запрещён'}), 403
 
             template = ShiftTemplate.query.get(data['template_id'])
@@ -685,7 +758,7 @@ def register_routes(app):
                 return jsonify({'success': False, 'error': 'Шаблон не найден'}), 404
 
             user = User.query.get(data['user_id'])
-            if not user or (user.id != current_user.id and user not in calendar.members):
+            if not user or (user.id != current_user.id and not is_calendar_member(calendar.id, user.id)):
                 return jsonify({'success': False, 'error': 'Неверный пользователь'}), 400
 
             # Проверяем существующую смену
@@ -715,6 +788,8 @@ def register_routes(app):
             )
 
             db.session.add(shift)
+            db.session.flush()
+            record_shift_changes(calendar.id, upserted=[shift.id])
             db.session.commit()
 
             return jsonify({
@@ -732,6 +807,232 @@ def register_routes(app):
             db.session.rollback()
             return jsonify({'success': False, 'error': str(e)}), 500
 
+    @app.route('/api/shifts/batch', methods=['POST'])
+    @login_required
+    def shifts_batch():
+        """Пакет операций со сменами (create / move / delete) одной транзакцией."""
+        data = request.get_json(silent=True) or {}
+        calendar = Calendar.query.get(data.get('calendar_id'))
+        if not calendar or (not can_access_calendar(calendar)):
+            return jsonify({'success': False, 'error': 'Доступ запрещён'}), 403
+
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'success': False, 'error': 'Список операций пуст'}), 400
+        max_operations = app.config.get('SHIFT_BATCH_MAX_OPERATIONS', 2000)
+        if len(operations) > max_operations:
+            return jsonify({'success': False, 'error': f'Не более {max_operations} операций за запрос'}), 400
+
+        try:
+            results, applied = apply_shift_batch(calendar, operations, current_user.id, atomic=bool(data.get('atomic')))
+            if applied:
+                db.session.commit()
+            else:
+                db.session.rollback()
+
+            return jsonify({
+                'success': all(result['success'] for result in results),
+                'applied': applied,
+                'results': results
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/api/calendar/<int:calendar_id>/rotation', methods=['POST'])
+    @login_required
+    def generate_rotation(calendar_id):
+        """Заполнение календаря сменами по ротации.
+
+        Ожидает JSON:
+        {
+            "pattern": [template_id | null, ...],   # null — выходной
+            "members": [{"user_id": 1, "offset": 0}, ...],
+            "start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD",
+            "on_conflict": "skip" | "replace",      # что делать с уже занятыми днями
+            "dry_run": true,                        # только предпросмотр, без записи
+            "preview_days": 14                      # дней в предпросмотре, 1..ROTATION_MAX_DAYS
+        }
+        """
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if calendar.owner_id != current_user.id:
+            return jsonify({'success': False, 'error': 'Доступ запрещён'}), 403
+
+        data = request.get_json(silent=True) or {}
+        pattern = data.get('pattern')
+        if not isinstance(pattern, list) or all(step is None for step in pattern):
+            return jsonify({'success': False, 'error': 'В ротации нет ни одной смены'}), 400
+
+        try:
+            pattern = [int(step) if step is not None else None for step in pattern]
+            start_date = datetime.strptime(data.get('start_date'), '%Y-%m-%d').date()
+            end_date = datetime.strptime(data.get('end_date'), '%Y-%m-%d').date()
+            member_offsets = [(int(m['user_id']), int(m.get('offset', 0))) for m in data.get('members') or []]
+            preview_days = int(data.get('preview_days', 14))
+        except (TypeError, ValueError, KeyError):
+            return jsonify({'success': False, 'error': 'Некорректные параметры ротации'}), 400
+
+        max_days = app.config.get('ROTATION_MAX_DAYS', 366)
+        if end_date < start_date or (end_date - start_date).days >= max_days:
+            return jsonify({'success': False, 'error': f'Диапазон дат должен быть не длиннее {max_days} дней'}), 400
+        preview_days = min(max(preview_days, 1), max_days)
+
+        user_ids = [user_id for user_id, _ in member_offsets]
+        if not user_ids or len(set(user_ids)) != len(user_ids):
+            return jsonify({'success': False, 'error': 'Список участников пуст или содержит повторы'}), 400
+        allowed_ids = calendar_member_ids(calendar.id)
+        allowed_ids.add(calendar.owner_id)
+        if not set(user_ids) <= allowed_ids:
+            return jsonify({'success': False, 'error': 'Не все пользователи состоят в календаре'}), 400
+
+        template_ids = {step for step in pattern if step is not None}
+        templates = {t.id: t for t in ShiftTemplate.query.filter(
+            ShiftTemplate.id.in_(template_ids), ShiftTemplate.calendar_id == calendar.id
+        )}
+        if len(templates) != len(template_ids):
+            return jsonify({'success': False, 'error': 'Шаблон не найден'}), 404
+
+        on_conflict = data.get('on_conflict', 'skip')
+        if on_conflict not in ('skip', 'replace'):
+            return jsonify({'success': False, 'error': 'on_conflict: skip или replace'}), 400
+
+        range_filter = (
+            Shift.calendar_id == calendar.id,
+            Shift.user_id.in_(user_ids),
+            Shift.date >= start_date,
+            Shift.date <= end_date
+        )
+        occupied = set()
+        if on_conflict == 'skip':
+            occupied = set(db.session.execute(db.select(Shift.user_id, Shift.date).where(*range_filter)).tuples())
+
+        assignments = rotation_assignments(pattern, member_offsets, start_date, end_date)
+        rows, skipped = build_shift_rows(calendar.id, assignments, templates, occupied)
+
+        per_member = {}
+        for row in rows:
+            per_member[row['user_id']] = per_member.get(row['user_id'], 0) + 1
+
+        if data.get('dry_run'):
+            preview_end = start_date + timedelta(days=preview_days)
+            preview = {}
+            for user_id, day, template_id in assignments:
+                if day < preview_end:
+                    preview.setdefault(user_id, []).append([day.strftime('%Y-%m-%d'), template_id])
+            return jsonify({
+                'success': True,
+                'dry_run': True,
+                'total': len(rows),
+                'skipped': skipped,
+                'per_member': per_member,
+                'preview': preview
+            })
+
+        try:
+            replaced = 0
+            if on_conflict == 'replace':
+                replaced = Shift.query.filter(*range_filter).delete(synchronize_session=False)
+            bulk_insert_shifts(rows)
+            record_shift_changes(calendar.id, reset=True)
+            db.session.commit()
+
+            return jsonify({
+                'success': True,
+                'created': len(rows),
+                'skipped': skipped,
+                'replaced': replaced,
+                'per_member': per_member
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/api/calendar/<int:calendar_id>/copy-shifts', methods=['POST'])
+    @login_required
+    def copy_calendar_shifts(calendar_id):
+        """Копирование смен из одного диапазона дат в другой (неделя, месяц).
+
+        Ожидает JSON: source_start, source_end и либо target_start, либо weeks
+        (сдвиг на N недель); необязательно user_ids и on_conflict (skip / replace).
+        """
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if calendar.owner_id != current_user.id:
+            return jsonify({'success': False, 'error': 'Доступ запрещён'}), 403
+
+        data = request.get_json(silent=True) or {}
+        try:
+            source_start = datetime.strptime(data.get('source_start'), '%Y-%m-%d').date()
+            source_end = datetime.strptime(data.get('source_end'), '%Y-%m-%d').date()
+            if data.get('target_start'):
+                target_start = datetime.strptime(data['target_start'], '%Y-%m-%d').date()
+            else:
+                target_start = source_start + timedelta(weeks=int(data['weeks']))
+            user_ids = data.get('user_ids')
+            if user_ids is not None:
+                user_ids = [int(user_id) for user_id in user_ids]
+        except (TypeError, ValueError, KeyError):
+            return jsonify({'success': False, 'error': 'Некорректные параметры копирования'}), 400
+
+        max_days = app.config.get('ROTATION_MAX_DAYS', 366)
+        if source_end < source_start or (source_end - source_start).days >= max_days:
+            return jsonify({'success': False, 'error': f'Диапазон дат должен быть не длиннее {max_days} дней'}), 400
+        day_offset = (target_start - source_start).days
+        if abs(day_offset) <= (source_end - source_start).days:
+            return jsonify({'success': False, 'error': 'Исходный и целевой диапазоны пересекаются'}), 400
+
+        on_conflict = data.get('on_conflict', 'skip')
+        if on_conflict not in ('skip', 'replace'):
+            return jsonify({'success': False, 'error': 'on_conflict: skip или replace'}), 400
+
+        try:
+            created_ids, deleted_ids = copy_shift_range(
+                calendar.id, source_start, source_end, day_offset,
+                user_ids=user_ids, replace=on_conflict == 'replace'
+            )
+            if created_ids or deleted_ids:
+                record_shift_changes(calendar.id, upserted=created_ids, deleted=deleted_ids)
+            db.session.commit()
+
+            return jsonify({
+                'success': True,
+                'created': len(created_ids),
+                'replaced': len(deleted_ids),
+                'target_start': target_start.strftime('%Y-%m-%d'),
+                'target_end': (source_end + timedelta(days=day_offset)).strftime('%Y-%m-%d')
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/calendar/<int:calendar_id>/clone', methods=['POST'])
+    @login_required
+    def clone_calendar_route(calendar_id):
+        """Клон календаря с шаблонами, группами и участниками (без смен)."""
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if calendar.owner_id != current_user.id:
+            return jsonify({'success': False, 'error': 'Доступ запрещён'}), 403
+
+        data = request.get_json(silent=True) or {}
+        name = (data.get('name') or '').strip() or f'{calendar.name} (копия)'
+
+        try:
+            # Генерируем уникальный 8-значный ID календаря
+            new_calendar_id = generate_calendar_id()
+            while Calendar.query.get(new_calendar_id):
+                new_calendar_id = generate_calendar_id()
+
+            clone = clone_calendar(calendar, new_calendar_id, name[:100], current_user.id)
+            db.session.commit()
+
+            return jsonify({
+                'success': True,
+                'calendar_id': clone.id,
+                'url': url_for('view_calendar', calendar_id=clone.id)
+            })
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
     @app.route('/api/delete_shift_template/<int:template_id>', methods=['DELETE'])
     @login_required
     def delete_shift_template(template_id):
@@ -751,6 +1052,13 @@ def register_routes(app):
                 shift.color_class = template.color_class  # Сохраняем цвет из шаблона
                 shift.template_id = None  # Отвязываем от шаблона
 
+            # Смены могут лежать в календаре шаблона — фиксируем изменение для синхронизации
+            calendar_shift_ids = {}
+            for shift in related_shifts:
+                calendar_shift_ids.setdefault(shift.calendar_id, []).append(shift.id)
+            for shifts_calendar_id, shift_ids in calendar_shift_ids.items():
+                record_shift_changes(shifts_calendar_id, upserted=shift_ids)
+
             db.session.commit()  # Сохраняем изменения в сменах
 
             # Теперь удаляем шаблон
@@ -782,21 +1090,17 @@ def register_routes(app):
 
     @app.route('/analysis')
     @login_required
+    @query_budget(3)
     def analysis():
-        # Получаем календари пользователя (владелец или участник)
-        owned_calendars = Calendar.query.filter_by(owner_id=current_user.id).all()
-        shared_calendars = current_user.shared_calendars
-        
-        # Объединяем все календари
-        all_calendars = list(owned_calendars) + list(shared_calendars)
-        
-        # Убираем дубликаты
-        unique_calendars = []
-        seen_ids = set()
-        for calendar in all_calendars:
-            if calendar.id not in seen_ids:
-                unique_calendars.append(calendar)
-                seen_ids.add(calendar.id)
+        # Календари пользователя (владелец или участник) одним запросом: сначала свои
+        shared_ids = select(calendar_members.c.calendar_id).where(calendar_members.c.user_id == current_user.id)
+        unique_calendars = (
+            Calendar.query
+            .filter(or_(Calendar.owner_id == current_user.id, Calendar.id.in_(shared_ids)))
+            .options(undefer(Calendar.member_count))
+            .order_by(Calendar.owner_id != current_user.id, Calendar.id)
+            .all()
+        )
         
         # Определяем роль пользователя для каждого календаря
         calendar_roles = {}
@@ -834,8 +1138,27 @@ def register_routes(app):
                 'status': 'error'
             }), 500
 
+    def _analysis_body(accessible_calendars, user_calendar_roles, period, month, filters,
+                       comparison=None, comparisons=None):
+        """JSON-тело ответа аналитики; повторный запрос при неизменных сменах отдаётся из кэша."""
+        cache_key = analysis_cache_key(
+            accessible_calendars, period, month, filters, [comparison, comparisons],
+            analysis_scope(current_user.id, user_calendar_roles)
+        )
+        versions = calendar_versions(accessible_calendars)
+        body = analysis_cache.get(cache_key, versions)
+        if body is None:
+            analysis_data = build_analysis(
+                accessible_calendars, period, month, filters,
+                current_user.id, user_calendar_roles, comparison, comparisons
+            )
+            body = app.json.dumps(analysis_data)
+            analysis_cache.put(cache_key, versions, body)
+        return body
+
     @app.route('/api/analysis-data', methods=['POST'])
     @login_required
+    @query_budget(6)
     def get_analysis_data():
         try:
             data = request.get_json()
@@ -848,105 +1171,35 @@ def register_routes(app):
             calendar_ids = data.get('calendar_ids', [])
             filters = data.get('filters', {})
             comparison = data.get('comparison')
+            # Несколько периодов сравнения: [{'period': 'month', 'month': '2025-05'}, ...]
+            comparisons = data.get('comparisons')
+            if comparisons is not None:
+                if not isinstance(comparisons, list) or not all(isinstance(item, dict) for item in comparisons):
+                    return jsonify({'error': 'comparisons must be a list of periods'}), 400
+                if len(comparisons) > app.config['ANALYSIS_MAX_COMPARISONS']:
+                    return jsonify({'error': f"Too many comparison periods (max {app.config['ANALYSIS_MAX_COMPARISONS']})"}), 400
             
             app.logger.info(f"Analysis request: period={period}, month={month}, calendars={calendar_ids}, filters={filters}")
             
             if not calendar_ids:
                 return jsonify({'error': 'No calendars selected'}), 400
             
-            accessible_calendars = []
-            user_calendar_roles = {}  # Track user's role in each calendar
-            for calendar_id in calendar_ids:
-                try:
-                    calendar = Calendar.query.get(calendar_id)
-                    if calendar and (calendar.owner_id == current_user.id or current_user in calendar.members):
-                        accessible_calendars.append(calendar_id)
-                        user_calendar_roles[calendar_id] = 'creator' if calendar.owner_id == current_user.id else 'participant'
-                except Exception as e:
-                    app.logger.error(f"Error checking calendar {calendar_id}: {str(e)}")
+            # Роли во всех выбранных календарях — одним запросом
+            roles = resolve_calendar_roles(calendar_ids)
+            accessible_calendars = list(roles)
+            user_calendar_roles = {  # Track user's role in each calendar
+                calendar_id: 'creator' if role == ROLE_OWNER else 'participant'
+                for calendar_id, role in roles.items()
+            }
             
             if not accessible_calendars:
                 return jsonify({'error': 'No accessible calendars'}), 403
             
             try:
-                if period == 'week':
-                    start_date, end_date = get_week_range(month)
-                elif period == 'quarter':
-                    start_date, end_date = get_quarter_range(month)
-                elif period == 'year':
-                    start_date, end_date = get_year_range(month)
-                else:
-                    start_date, end_date = get_month_range(month)
-                
-                app.logger.info(f"Date range: {start_date} to {end_date}")
-                
-                analysis_data = {}
-                
-                # Calculate each section separately with error handling
-                try:
-                    analysis_data['shift_stats'] = calculate_shift_stats(accessible_calendars, start_date, end_date, filters, current_user.id, user_calendar_roles)
-                except Exception as e:
-                    app.logger.error(f"Error in shift_stats: {str(e)}")
-                    analysis_data['shift_stats'] = {'total_hours': 0, 'total_shifts': 0, 'avg_duration': 0, 'top_template': None}
-                
-                try:
-                    analysis_data['team_analysis'] = calculate_team_analysis(accessible_calendars, start_date, end_date, filters, current_user.id, user_calendar_roles)
-                except Exception as e:
-                    app.logger.error(f"Error in team_analysis: {str(e)}")
-                    analysis_data['team_analysis'] = {'activity_ranking': [], 'coverage_data': [], 'workload_balance': {'labels': [], 'values': []}}
-                
-                try:
-                    analysis_data['time_slots'] = calculate_time_slots(accessible_calendars, start_date, end_date, filters, current_user.id, user_calendar_roles)
-                except Exception as e:
-                    app.logger.error(f"Error in time_slots: {str(e)}")
-                    analysis_data['time_slots'] = {'morning': {'percentage': 0}, 'day': {'percentage': 0}, 'evening': {'percentage': 0}, 'night': {'percentage': 0}}
-                
-                try:
-                    analysis_data['work_time_distribution'] = calculate_work_time_distribution(accessible_calendars, start_date, end_date, filters, current_user.id, user_calendar_roles)
-                except Exception as e:
-                    app.logger.error(f"Error in work_time_distribution: {str(e)}")
-                    analysis_data['work_time_distribution'] = {'labels': [], 'values': []}
-                
-                try:
-                    analysis_data['weekday_activity'] = calculate_weekday_activity(accessible_calendars, start_date, end_date, filters, current_user.id, user_calendar_roles)
-                except Exception as e:
-                    app.logger.error(f"Error in weekday_activity: {str(e)}")
-                    analysis_data['weekday_activity'] = {'hours': [0] * 7}
-                
-                try:
-                    analysis_data['trends_data'] = calculate_trends_data(accessible_calendars, period, month, filters, current_user.id, user_calendar_roles)
-                except Exception as e:
-                    app.logger.error(f"Error in trends_data: {str(e)}")
-                    analysis_data['trends_data'] = {'hours': {'labels': [], 'values': []}, 'shifts': {'labels': [], 'values': []}, 'people': {'labels': [], 'values': []}}
-                
-                # Add comparison data if requested
-                if comparison:
-                    try:
-                        comp_period = comparison.get('period', 'month')
-                        comp_month = comparison.get('month')
-                        
-                        if comp_period == 'week':
-                            comp_start_date, comp_end_date = get_week_range(comp_month)
-                        elif comp_period == 'quarter':
-                            comp_start_date, comp_end_date = get_quarter_range(comp_month)
-                        elif comp_period == 'year':
-                            comp_start_date, comp_end_date = get_year_range(comp_month)
-                        else:
-                            comp_start_date, comp_end_date = get_month_range(comp_month)
-                        
-                        analysis_data['comparison'] = {
-                            'shift_stats': calculate_shift_stats(accessible_calendars, comp_start_date, comp_end_date, filters, current_user.id, user_calendar_roles),
-                            'team_analysis': calculate_team_analysis(accessible_calendars, comp_start_date, comp_end_date, filters, current_user.id, user_calendar_roles),
-                            'time_slots': calculate_time_slots(accessible_calendars, comp_start_date, comp_end_date, filters, current_user.id, user_calendar_roles),
-                            'work_time_distribution': calculate_work_time_distribution(accessible_calendars, comp_start_date, comp_end_date, filters, current_user.id, user_calendar_roles),
-                            'weekday_activity': calculate_weekday_activity(accessible_calendars, comp_start_date, comp_end_date, filters, current_user.id, user_calendar_roles),
-                            'trends_data': calculate_trends_data(accessible_calendars, comp_period, comp_month, filters, current_user.id, user_calendar_roles)
-                        }
-                    except Exception as e:
-                        app.logger.error(f"Error in comparison data: {str(e)}")
-                        analysis_data['comparison'] = None
-                
-                return jsonify(analysis_data)
+                body = _analysis_body(
+                    accessible_calendars, user_calendar_roles, period, month, filters, comparison, comparisons
+                )
+                return app.response_class(body, mimetype='application/json')
             
             except Exception as e:
                 app.logger.error(f"Error in date calculation or analysis: {str(e)}")
@@ -960,6 +1213,146 @@ def register_routes(app):
             app.logger.error(traceback.format_exc())
             return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+    @app.route('/api/analysis-cache/stats')
+    @login_required
+    def analysis_cache_stats():
+        """Счётчики кэша аналитики — только в отладке или с ANALYSIS_CACHE_STATS."""
+        if not (app.debug or app.config.get('ANALYSIS_CACHE_STATS')):
+            abort(404)
+        return jsonify({'success': True, 'stats': analysis_cache.stats()})
+
+    @app.route('/api/calendar/<int:calendar_id>/staffing-targets', methods=['GET'])
+    @login_required
+    def get_staffing_targets(calendar_id):
+        """Нормы численности календаря: список из 7 чисел (пн–вс), null — нормы нет."""
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if not can_access_calendar(calendar):
+            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
+
+        targets = [None] * 7
+        for target in StaffingTarget.query.filter_by(calendar_id=calendar.id):
+            targets[target.weekday] = target.required
+        return jsonify({'success': True, 'targets': targets})
+
+    @app.route('/api/calendar/<int:calendar_id>/staffing-targets', methods=['PUT'])
+    @login_required
+    def set_staffing_targets(calendar_id):
+        """Задаёт нормы: {"targets": [7 значений пн–вс]}; null или 0 — без нормы."""
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if calendar.owner_id != current_user.id:
+            return jsonify({'success': False, 'error': 'Изменять нормы может только владелец календаря'}), 403
+
+        targets = (request.get_json(silent=True) or {}).get('targets')
+        if not isinstance(targets, list) or len(targets) != 7 or not all(
+            value is None or (isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= 10000)
+            for value in targets
+        ):
+            return jsonify({'success': False, 'error': 'targets — список из 7 целых чисел от 0 или null'}), 400
+
+        StaffingTarget.query.filter_by(calendar_id=calendar.id).delete()
+        db.session.add_all(
+            StaffingTarget(calendar_id=calendar.id, weekday=weekday, required=required)
+            for weekday, required in enumerate(targets) if required
+        )
+        # Версия календаря — ключ кэша аналитики: покрытие пересчитается с новыми нормами
+        calendar_table = Calendar.__table__
+        db.session.execute(
+            calendar_table.update()
+            .where(calendar_table.c.id == calendar.id)
+            .values(version=calendar_table.c.version + 1)
+        )
+        db.session.commit()
+        return jsonify({'success': True, 'targets': [value or None for value in targets]})
+
+    def _export_response(export_format, filename, sheets):
+        """Ответ выгрузки: CSV — потоком из первого листа, XLSX — файлом со всеми листами."""
+        if export_format == 'xlsx':
+            return send_file(xlsx_file(sheets), mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+        _, header, rows = sheets[0]
+        return Response(stream_with_context(csv_stream(header, rows)), mimetype=CSV_MIMETYPE, headers={
+            'Content-Disposition': f'attachment; filename={filename}'
+        })
+
+    def _export_format_error(export_format):
+        """Ответ с ошибкой, если формат не поддерживается, иначе None."""
+        if export_format not in ('csv', 'xlsx'):
+            return jsonify({'success': False, 'error': 'format — csv или xlsx'}), 400
+        if export_format == 'xlsx' and not xlsx_available():
+            return jsonify({'success': False, 'error': 'Выгрузка в XLSX недоступна: не установлен openpyxl'}), 501
+        return None
+
+    @app.route('/api/calendar/<int:calendar_id>/export/shifts', methods=['GET'])
+    @login_required
+    def export_calendar_shifts(calendar_id):
+        """Смены календаря в CSV (потоком, по мере чтения из базы) или XLSX.
+
+        ?format=csv|xlsx; период — ?start=YYYY-MM-DD&end=YYYY-MM-DD или месяц
+        ?month=YYYY-MM-DD, как у страницы календаря (по умолчанию текущий).
+        """
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if not can_access_calendar(calendar):
+            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
+
+        export_format = request.args.get('format', 'csv')
+        error = _export_format_error(export_format)
+        if error:
+            return error
+
+        if request.args.get('start') or request.args.get('end'):
+            try:
+                start_date = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+                end_date = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'success': False, 'error': 'start и end — даты YYYY-MM-DD'}), 400
+        else:
+            start_date, end_date = parse_calendar_month(request.args.get('month'))
+        if end_date < start_date or (end_date - start_date).days >= app.config['EXPORT_MAX_DAYS']:
+            return jsonify({
+                'success': False,
+                'error': f"Период выгрузки — от 1 до {app.config['EXPORT_MAX_DAYS']} дней"
+            }), 400
+
+        filename = f'shifts-{calendar.id}-{start_date:%Y%m%d}-{end_date:%Y%m%d}.{export_format}'
+        rows = shift_export_rows(calendar.id, start_date, end_date)
+        return _export_response(export_format, filename, [('Смены', SHIFT_EXPORT_HEADER, rows)])
+
+    @app.route('/api/analysis-export', methods=['POST'])
+    @login_required
+    def export_analysis():
+        """Разделы аналитики в CSV или XLSX.
+
+        Тело — как у /api/analysis-data (без сравнений) плюс format и section
+        (ключ export.ANALYSIS_SECTIONS). XLSX без section — все разделы листами.
+        """
+        data = request.get_json(silent=True) or {}
+        export_format = data.get('format', 'csv')
+        error = _export_format_error(export_format)
+        if error:
+            return error
+
+        section = data.get('section')
+        if section is None and export_format == 'xlsx':
+            sections = list(ANALYSIS_SECTIONS)
+        elif isinstance(section, str) and section in ANALYSIS_SECTIONS:
+            sections = [section]
+        else:
+            return jsonify({'success': False, 'error': f"section — одно из: {', '.join(ANALYSIS_SECTIONS)}"}), 400
+
+        roles = resolve_calendar_roles(data.get('calendar_ids') or [])
+        if not roles:
+            return jsonify({'success': False, 'error': 'Нет доступных календарей'}), 403
+        user_calendar_roles = {
+            calendar_id: 'creator' if role == ROLE_OWNER else 'participant'
+            for calendar_id, role in roles.items()
+        }
+        period = data.get('period', 'month')
+        month = data.get('month', datetime.utcnow().strftime('%Y-%m'))
+        analysis_data = json.loads(_analysis_body(list(roles), user_calendar_roles, period, month, data.get('filters', {})))
+
+        sheets = [(ANALYSIS_SECTIONS[name], *analysis_tables(analysis_data, name)) for name in sections]
+        filename = secure_filename(f"analysis-{period}-{month}-{section or 'all'}.{export_format}")
+        return _export_response(export_format, filename, sheets)
+
     @app.route('/api/calendar-users', methods=['POST'])
     @login_required
     def get_calendar_users():
@@ -970,30 +1363,27 @@ def register_routes(app):
             return jsonify([])
         
         try:
-            users = {}
-            for calendar_id in calendar_ids:
-                calendar = Calendar.query.get(calendar_id)
-                if calendar and (calendar.owner_id == current_user.id or current_user in calendar.members):
-                    # Add owner
-                    owner = calendar.owner
-                    users[owner.id] = {
-                        'id': owner.id,
-                        'username': owner.username,
-                        'first_name': owner.first_name,
-                        'last_name': owner.last_name,
-                        'avatar': owner.avatar
-                    }
-                    # Add members
-                    for member in calendar.members:
-                        users[member.id] = {
-                            'id': member.id,
-                            'username': member.username,
-                            'first_name': member.first_name,
-                            'last_name': member.last_name,
-                            'avatar': member.avatar
-                        }
+            accessible_calendars = list(resolve_calendar_roles(calendar_ids))
+            if not accessible_calendars:
+                return jsonify([])
+
+            # Владельцы и участники всех доступных календарей одним запросом
+            owner_ids = select(Calendar.owner_id).where(Calendar.id.in_(accessible_calendars))
+            member_ids = select(calendar_members.c.user_id).where(calendar_members.c.calendar_id.in_(accessible_calendars))
+            rows = db.session.query(User.id, User.username, User.first_name, User.last_name, User.avatar).filter(
+                or_(User.id.in_(owner_ids), User.id.in_(member_ids))
+            ).all()
+            users = [
+                {
+                    'id': row.id,
+                    'username': row.username,
+                    'first_name': row.first_name,
+                    'last_name': row.last_name,
+                    'avatar': row.avatar
+                } for row in rows
+            ]
             
-            return jsonify(list(users.values()))
+            return jsonify(users)
         
         except Exception as e:
             app.logger.error(f"Error getting calendar users: {str(e)}")
@@ -1009,11 +1399,7 @@ def register_routes(app):
             return jsonify([])
         
         # Проверяем доступ к календарям
-        accessible_calendars = []
-        for calendar_id in calendar_ids:
-            calendar = Calendar.query.get(calendar_id)
-            if calendar and (calendar.owner_id == current_user.id or current_user in calendar.members):
-                accessible_calendars.append(calendar_id)
+        accessible_calendars = list(resolve_calendar_roles(calendar_ids))
         
         if not accessible_calendars:
             return jsonify([])
@@ -1072,19 +1458,20 @@ def register_routes(app):
 
     @app.route('/calendar/<int:calendar_id>/members', methods=['GET'])
     @login_required
+    @query_budget(3)
     def get_calendar_members_route(calendar_id):
         calendar = Calendar.query.get_or_404(calendar_id)
 
         # Проверка доступа
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
+        if not can_access_calendar(calendar):
             abort(403)
 
-        # Возвращаем участников с их позицией из calendar_members, отсортированных по позиции (возрастание)
+        # Возвращаем участников в порядке sort_key; position — номер в этом порядке
         # Владелец не включается (для групп он не нужен)
         rows = (
-            db.session.query(User.id, User.username, User.first_name, User.last_name, User.avatar, calendar_members.c.position)
+            db.session.query(User.id, User.username, User.first_name, User.last_name, User.avatar)
             .join(calendar_members, (calendar_members.c.user_id == User.id) & (calendar_members.c.calendar_id == calendar.id))
-            .order_by(calendar_members.c.position.asc(), User.id.asc())
+            .order_by(calendar_members.c.sort_key, User.id)
             .all()
         )
 
@@ -1095,36 +1482,37 @@ def register_routes(app):
                 'first_name': r.first_name,
                 'last_name': r.last_name,
                 'avatar': r.avatar,
-                'position': int(r.position) if r.position is not None else None,
+                'position': position,
             }
-            for r in rows
+            for position, r in enumerate(rows, start=1)
         ]
 
         return jsonify(members)
 
     @app.route('/api/get_calendar_groups/<int:calendar_id>', methods=['GET'])
     @login_required
+    @query_budget(4)
     def get_calendar_groups_route(calendar_id):
         calendar = Calendar.query.get_or_404(calendar_id)
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
+        if not can_access_calendar(calendar):
             return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
 
-        # Возвращаем группы в порядке позиции (новые выше), при равной позиции — по id (новые выше)
+        # Возвращаем группы сверху вниз; position убывает сверху вниз, как раньше
         groups = (
             Group.query
             .filter_by(calendar_id=calendar_id)
-            .order_by(Group.position.desc(), Group.id.desc())
+            .order_by(Group.sort_key, Group.id)
             .all()
         )
         groups_data = []
         
-        for group in groups:
+        for index, group in enumerate(groups):
             groups_data.append({
                 'id': group.id,
                 'name': group.name,
                 'color': group.color,
                 'owner_id': group.owner_id,
-                'position': group.position,
+                'position': len(groups) - index,
                 'members': [
                     {
                         'id': m.id,
@@ -1140,11 +1528,12 @@ def register_routes(app):
 
     @app.route('/calendar/<int:calendar_id>/shifts', methods=['GET'])
     @login_required
+    @query_budget(3)
     def get_calendar_shifts(calendar_id):
         calendar = Calendar.query.get_or_404(calendar_id)
 
         # Проверка доступа
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
+        if not can_access_calendar(calendar):
             abort(403)
 
         # Получаем месяц из параметров запроса
@@ -1187,91 +1576,347 @@ def register_routes(app):
 
         return jsonify(shifts_data)
 
-    @app.route('/api/create_group', methods=['POST'])
+    @app.route('/calendar/<int:calendar_id>/shifts/changes', methods=['GET'])
     @login_required
-    def create_group():
-        data = request.get_json()
-        calendar_id = data.get('calendar_id')
-        name = data.get('name')
-        color = data.get('color', 'badge-color-1')
-        user_ids = data.get('user_ids', [])
+    def get_calendar_shift_changes(calendar_id):
+        """Изменения смен после версии ?since=N.
 
+        Если журнал не может восстановить изменения (массовая операция или
+        версия клиента больше текущей), возвращается reset=true — клиент должен
+        перезагрузить месяц целиком.
+        """
         calendar = Calendar.query.get_or_404(calendar_id)
-        if calendar.owner_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
-
-        try:
-            # Получаем максимальную позицию для групп в этом календаре
-            max_position = db.session.query(db.func.max(Group.position)).filter(
-                Group.calendar_id == calendar_id
-            ).scalar() or 0
-            
-            # Новая группа получает позицию на 1 больше максимальной
-            new_position = max_position + 1
-            
-            group = Group(
-                name=name,
-                color=color,
-                calendar_id=calendar_id,
-                owner_id=current_user.id,
-                position=new_position
-            )
-            db.session.add(group)
-            db.session.flush()  # Получаем ID группы
 
-            # Добавляем участников в группу (исключаем создателя календаря)
-            for user_id in user_ids:
-                user = User.query.get(user_id)
-                if user and user in calendar.members and user.id != calendar.owner_id:
-                    group.members.append(user)
+        # Проверка доступа
+        if not can_access_calendar(calendar):
+            abort(403)
 
-            db.session.commit()
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'success': False, 'error': 'Не указан параметр since'}), 400
 
-            return jsonify({
-                'success': True,
-                'group': {
-                    'id': group.id,
-                    'name': group.name,
-                    'color': group.color,
-                    'position': group.position,
-                    'members': [
-                        {
-                            'id': m.id,
-                            'username': m.username,
-                            'first_name': m.first_name,
-                            'last_name': m.last_name,
-                            'avatar': m.avatar
-                        } for m in group.members
-                    ]
-                }
-            })
+        version = calendar.version or 0
+        response = {'success': True, 'version': version, 'reset': False, 'shifts': [], 'deleted_ids': []}
+        if since == version:
+            return jsonify(response)
 
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
+        changes = (
+            db.session.query(ShiftChange.shift_id, ShiftChange.action)
+            .filter(ShiftChange.calendar_id == calendar.id, ShiftChange.version > since)
+            .order_by(ShiftChange.version, ShiftChange.id)
+            .all()
+        )
+        if since > version or any(action == 'reset' for _, action in changes):
+            response['reset'] = True
+            return jsonify(response)
+
+        # Последнее действие по каждой смене
+        latest = {}
+        for shift_id, action in changes:
+            latest[shift_id] = action
+        upserted_ids = [sid for sid, action in latest.items() if action == 'upsert']
+
+        found_ids = set()
+        if upserted_ids:
+            for shift in Shift.query.filter(Shift.calendar_id == calendar.id, Shift.id.in_(upserted_ids)).all():
+                found_ids.add(shift.id)
+                response['shifts'].append(serialize_shift(shift))
+
+        response['deleted_ids'] = [
+            sid for sid, action in latest.items()
+            if action == 'delete' or (action == 'upsert' and sid not in found_ids)
+        ]
+        return jsonify(response)
 
-    @app.route('/calendar/<int:calendar_id>/update-positions', methods=['POST'])
+    @app.route('/calendar/<int:calendar_id>/events', methods=['GET'])
     @login_required
-    def update_calendar_positions(calendar_id):
-        if not request.is_json:
-            return jsonify({'success': False, 'error': 'Invalid content type'}), 400
+    def calendar_events(calendar_id):
+        """SSE-поток изменений календаря: смены, участники, группы, порядок.
 
+        Генератор намеренно не использует stream_with_context: сессия БД и
+        контекст запроса освобождаются сразу, поток живёт только на очереди.
+        """
         calendar = Calendar.query.get_or_404(calendar_id)
 
-        if calendar.owner_id != current_user.id:
-                return jsonify({
-                    'success': False,
-                    'error': 'Forbidden',
-                    'message': 'Только владелец календаря может изменять порядок участников'
-                }), 403
-
-        try:
-            data = request.get_json() or {}
-            # Поддерживаем оба формата: { "positions": {"<uid>": pos} } и {"<uid>": pos}
-            positions = data.get('positions') if isinstance(data, dict) and 'positions' in data else data
+        # Проверка доступа
+        if not can_access_calendar(calendar):
+            abort(403)
 
-            if not isinstance(positions, dict) or not positions:
-                return jsonify({'success': False, 'error': 'Empty positions data'}), 400
+        version = calendar.version or 0
+        heartbeat = app.config.get('SSE_HEARTBEAT_SECONDS', 15)
+        max_duration = app.config.get('SSE_MAX_DURATION_SECONDS', 300)
+        retry_ms = app.config.get('SSE_RETRY_MS', 3000)
+        subscriber = broker.subscribe(calendar.id)
+
+        def stream():
+            try:
+                # Клиент переподключится сам — после max_duration поток закрывается
+                yield f'retry: {retry_ms}\n\n'
+                yield format_sse('hello', {'version': version})
+                deadline = time.monotonic() + max_duration
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        yield subscriber.get(timeout=min(heartbeat, remaining))
+                    except queue.Empty:
+                        yield ': heartbeat\n\n'
+            finally:
+                broker.unsubscribe(calendar_id, subscriber)
+
+        return Response(stream(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
+    @app.route('/calendar/<int:calendar_id>/grid', methods=['GET'])
+    @login_required
+    @query_budget(4)
+    def get_calendar_grid(calendar_id):
+        """Компактная сетка месяца для переключения месяцев без перезагрузки страницы.
+
+        cells: {user_id: {день месяца: [[shift_id, индекс в shift_types], ...]}}
+        shift_types: уникальные сочетания шаблона, названия, времени и цвета.
+        """
+        calendar = Calendar.query.get_or_404(calendar_id)
+
+        # Проверка доступа
+        if not can_access_calendar(calendar):
+            abort(403)
+
+        current_month, last_day = parse_calendar_month(request.args.get('month'))
+
+        # Порядок строк: владелец, затем участники по позиции
+        member_ids = [calendar.owner_id] + [
+            row.user_id for row in db.session.query(calendar_members.c.user_id)
+            .filter(calendar_members.c.calendar_id == calendar.id)
+            .order_by(calendar_members.c.sort_key, calendar_members.c.user_id)
+        ]
+
+        rows = db.session.query(
+            Shift.id, Shift.user_id, Shift.date, Shift.template_id, Shift.title,
+            Shift.start_time, Shift.end_time, Shift.show_time, Shift.color_class
+        ).filter(
+            Shift.calendar_id == calendar.id,
+            Shift.date >= current_month,
+            Shift.date <= last_day
+        ).order_by(Shift.id).all()
+
+        shift_types = []
+        type_index = {}
+        cells = {}
+        for shift_id, user_id, day, template_id, title, start_time, end_time, show_time, color_class in rows:
+            key = (template_id, title, start_time, end_time, show_time, color_class)
+            idx = type_index.get(key)
+            if idx is None:
+                idx = type_index[key] = len(shift_types)
+                shift_types.append({
+                    'template_id': template_id,
+                    'title': title,
+                    'start_time': start_time.strftime('%H:%M'),
+                    'end_time': end_time.strftime('%H:%M'),
+                    'show_time': show_time,
+                    'color_class': color_class
+                })
+            cells.setdefault(str(user_id), {}).setdefault(str(day.day), []).append([shift_id, idx])
+
+        return jsonify({
+            'version': calendar.version or 0,
+            'month': current_month.strftime('%Y-%m-%d'),
+            'days': [(current_month + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(last_day.day)],
+            'members': member_ids,
+            'shift_types': shift_types,
+            'cells': cells
+        })
+
+    @app.route('/api/calendar/<int:calendar_id>/bootstrap', methods=['GET'])
+    @login_required
+    @query_budget(8)
+    def calendar_bootstrap(calendar_id):
+        """Всё, что нужно странице календаря после загрузки, одним ответом.
+
+        Заменяет отдельные запросы участников, групп, друзей и смен месяца.
+        Пользователи группы передаются списком member_ids — сами участники
+        уже есть в members. Число запросов не зависит от размера календаря.
+        """
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if not can_access_calendar(calendar):
+            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
+
+        current_month, last_day = parse_calendar_month(request.args.get('month'))
+
+        # Участники с позициями (без владельца) — как /calendar/<id>/members
+        member_rows = (
+            db.session.query(User.id, User.username, User.first_name, User.last_name, User.avatar)
+            .join(calendar_members, (calendar_members.c.user_id == User.id) & (calendar_members.c.calendar_id == calendar.id))
+            .order_by(calendar_members.c.sort_key, User.id)
+            .all()
+        )
+        members = [
+            {
+                'id': r.id,
+                'username': r.username,
+                'first_name': r.first_name,
+                'last_name': r.last_name,
+                'avatar': r.avatar,
+                'position': position,
+            }
+            for position, r in enumerate(member_rows, start=1)
+        ]
+
+        # Группы и их состав — два запроса на все группы (пользователи уже есть в members)
+        groups = (
+            Group.query
+            .filter_by(calendar_id=calendar.id)
+            .options(lazyload(Group.members))
+            .order_by(Group.sort_key, Group.id)
+            .all()
+        )
+        group_member_ids = {group.id: [] for group in groups}
+        if groups:
+            for group_id, user_id in db.session.query(group_members.c.group_id, group_members.c.user_id).filter(
+                group_members.c.group_id.in_(list(group_member_ids))
+            ):
+                group_member_ids[group_id].append(user_id)
+        groups_data = [
+            {
+                'id': group.id,
+                'name': group.name,
+                'color': group.color,
+                'owner_id': group.owner_id,
+                'position': len(groups) - index,
+                'member_ids': group_member_ids[group.id]
+            }
+            for index, group in enumerate(groups)
+        ]
+
+        templates = ShiftTemplate.query.filter_by(calendar_id=calendar.id).order_by(ShiftTemplate.id).all()
+        templates_data = [
+            {
+                'id': template.id,
+                'title': template.title,
+                'start_time': template.start_time.strftime('%H:%M'),
+                'end_time': template.end_time.strftime('%H:%M'),
+                'show_time': template.show_time,
+                'color_class': template.color_class
+            }
+            for template in templates
+        ]
+
+        # Друзья текущего пользователя, которых ещё нет в календаре
+        calendar_user_ids = select(calendar_members.c.user_id).where(calendar_members.c.calendar_id == calendar.id)
+        available_friends = current_user.friends.filter(
+            User.id != calendar.owner_id,
+            User.id.notin_(calendar_user_ids)
+        ).order_by(User.id).all()
+        friends_data = [{
+            'id': friend.id,
+            'username': friend.username,
+            'first_name': friend.first_name,
+            'last_name': friend.last_name,
+            'avatar': friend.avatar
+        } for friend in available_friends]
+
+        shifts = Shift.query.filter(
+            Shift.calendar_id == calendar.id,
+            Shift.date >= current_month,
+            Shift.date <= last_day
+        ).order_by(Shift.id).all()
+
+        return jsonify({
+            'success': True,
+            'version': calendar.version or 0,
+            'month': current_month.strftime('%Y-%m-%d'),
+            'owner_id': calendar.owner_id,
+            'members': members,
+            'groups': groups_data,
+            'templates': templates_data,
+            'available_friends': friends_data,
+            'shifts': [serialize_shift(shift) for shift in shifts]
+        })
+
+    @app.route('/api/create_group', methods=['POST'])
+    @login_required
+    def create_group():
+        data = request.get_json()
+        calendar_id = data.get('calendar_id')
+        name = data.get('name')
+        color = data.get('color', 'badge-color-1')
+        user_ids = data.get('user_ids', [])
+
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if calendar.owner_id != current_user.id:
+            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
+
+        try:
+            # Новая группа встаёт наверх
+            group = Group(
+                name=name,
+                color=color,
+                calendar_id=calendar_id,
+                owner_id=current_user.id,
+                sort_key=group_order(calendar_id).top_key()
+            )
+            db.session.add(group)
+            db.session.flush()  # Получаем ID группы
+
+            # Добавляем участников в группу (исключаем создателя календаря)
+            member_ids = calendar_member_ids(calendar.id)
+            users_by_id = users_by_ids(user_ids)
+            for user_id in user_ids:
+                user = users_by_id.get(user_id)
+                if user and user.id in member_ids and user.id != calendar.owner_id:
+                    group.members.append(user)
+
+            queue_event(db.session, calendar.id, 'groups', {'action': 'create', 'group_id': group.id})
+            db.session.commit()
+
+            return jsonify({
+                'success': True,
+                'group': {
+                    'id': group.id,
+                    'name': group.name,
+                    'color': group.color,
+                    'position': group_positions(group.calendar_id).get(group.id),
+                    'members': [
+                        {
+                            'id': m.id,
+                            'username': m.username,
+                            'first_name': m.first_name,
+                            'last_name': m.last_name,
+                            'avatar': m.avatar
+                        } for m in group.members
+                    ]
+                }
+            })
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    @app.route('/calendar/<int:calendar_id>/update-positions', methods=['POST'])
+    @login_required
+    def update_calendar_positions(calendar_id):
+        if not request.is_json:
+            return jsonify({'success': False, 'error': 'Invalid content type'}), 400
+
+        calendar = Calendar.query.get_or_404(calendar_id)
+
+        if calendar.owner_id != current_user.id:
+                return jsonify({
+                    'success': False,
+                    'error': 'Forbidden',
+                    'message': 'Только владелец календаря может изменять порядок участников'
+                }), 403
+
+        try:
+            data = request.get_json() or {}
+            # Поддерживаем оба формата: { "positions": {"<uid>": pos} } и {"<uid>": pos}
+            positions = data.get('positions') if isinstance(data, dict) and 'positions' in data else data
+
+            if not isinstance(positions, dict) or not positions:
+                return jsonify({'success': False, 'error': 'Empty positions data'}), 400
 
             # Приводим ключи и значения к int и валидируем
             try:
@@ -1279,26 +1924,22 @@ def register_routes(app):
             except Exception:
                 return jsonify({'success': False, 'error': 'Positions must be a dict of {user_id:int -> position:int}'}), 400
 
-            valid_user_ids = {m.id for m in calendar.members}
+            valid_user_ids = calendar_member_ids(calendar.id)
             for uid in normalized.keys():
                 if uid not in valid_user_ids:
                     return jsonify({'success': False, 'error': f'Invalid user ID: {uid}'}), 400
 
-            # Обновляем позиции по одной записи
-            for uid, pos in normalized.items():
-                db.session.execute(
-                    calendar_members.update()
-                    .where(calendar_members.c.calendar_id == calendar.id)
-                    .where(calendar_members.c.user_id == uid)
-                    .values(position=pos)
-                )
+            # Переписываются только ключи действительно сдвинутых участников
+            order = sorted(normalized, key=lambda uid: (normalized[uid], uid))
+            updated_count = member_order(calendar.id).reorder(order)
 
+            queue_event(db.session, calendar.id, 'positions', {'members': normalized})
             db.session.commit()
 
             return jsonify({
                 'success': True,
                 'message': 'Positions updated successfully',
-                'updated_count': len(normalized)
+                'updated_count': updated_count
             })
 
         except Exception as e:
@@ -1310,7 +1951,7 @@ def register_routes(app):
     def update_group_positions(calendar_id):
         """Обновляет порядок групп в календаре.
         Ожидает JSON вида { "order": [group_id_top, group_id_next, ...] }
-        Позиции присваиваются так, чтобы первый элемент имел наибольшую позицию (для order_by desc).
+        Ключи порядка меняются только у сдвинутых групп; для одной группы есть /move.
         """
         calendar = Calendar.query.get_or_404(calendar_id)
         if calendar.owner_id != current_user.id:
@@ -1321,27 +1962,83 @@ def register_routes(app):
         if not isinstance(order, list) or not all(isinstance(i, int) for i in order):
             return jsonify({'success': False, 'error': 'Некорректный формат данных'}), 400
 
-        # Получаем все группы календаря
-        groups = Group.query.filter_by(calendar_id=calendar_id).all()
-        group_map = {g.id: g for g in groups}
-
         # Фильтруем входной порядок только по существующим группам этого календаря
-        filtered_order = [gid for gid in order if gid in group_map]
+        groups = group_order(calendar_id)
+        group_ids = {group_id for group_id, _ in groups.ordered()}
+        filtered_order = [gid for gid in order if gid in group_ids]
         if not filtered_order:
             return jsonify({'success': False, 'error': 'Список групп пуст или неверен'}), 400
 
         try:
-            # Максимальная позиция присваивается верхнему элементу
-            max_pos = len(filtered_order)
-            for idx, gid in enumerate(filtered_order):
-                group_map[gid].position = max_pos - idx
+            updated_count = groups.reorder(filtered_order)
 
+            queue_event(db.session, calendar.id, 'positions', {'groups': filtered_order})
             db.session.commit()
-            return jsonify({'success': True})
+            return jsonify({'success': True, 'updated_count': updated_count})
         except Exception as e:
             db.session.rollback()
             return jsonify({'success': False, 'error': str(e)}), 500
 
+    def _parse_move_target(data):
+        """(after_id, before_id) из тела запроса перемещения; ошибка — ValueError."""
+        after_id = data.get('after_id')
+        before_id = data.get('before_id')
+        if after_id is not None and before_id is not None:
+            raise ValueError('Укажите только after_id или before_id')
+        return (
+            int(after_id) if after_id is not None else None,
+            int(before_id) if before_id is not None else None
+        )
+
+    @app.route('/calendar/<int:calendar_id>/members/<int:user_id>/move', methods=['POST'])
+    @login_required
+    def move_calendar_member(calendar_id, user_id):
+        """Переносит одного участника: {"after_id": id} или {"before_id": id}, без них — наверх.
+
+        Меняется ключ порядка одной строки calendar_members.
+        """
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if calendar.owner_id != current_user.id:
+            return jsonify({'success': False, 'error': 'Только владелец календаря может изменять порядок участников'}), 403
+
+        try:
+            after_id, before_id = _parse_move_target(request.get_json(silent=True) or {})
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        members = member_order(calendar.id)
+        if not members.move(user_id, after_id=after_id, before_id=before_id):
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Участник не найден в календаре'}), 404
+
+        positions = {uid: index for index, (uid, _) in enumerate(members.ordered(), start=1)}
+        queue_event(db.session, calendar.id, 'positions', {'members': positions})
+        db.session.commit()
+        return jsonify({'success': True, 'positions': positions})
+
+    @app.route('/api/calendar/<int:calendar_id>/groups/<int:group_id>/move', methods=['POST'])
+    @login_required
+    def move_group(calendar_id, group_id):
+        """Переносит одну группу: {"after_id": id} или {"before_id": id}, без них — наверх."""
+        calendar = Calendar.query.get_or_404(calendar_id)
+        if calendar.owner_id != current_user.id:
+            return jsonify({'success': False, 'error': 'Изменять порядок групп может только владелец календаря'}), 403
+
+        try:
+            after_id, before_id = _parse_move_target(request.get_json(silent=True) or {})
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        groups = group_order(calendar.id)
+        if not groups.move(group_id, after_id=after_id, before_id=before_id):
+            db.session.rollback()
+            return jsonify({'success': False, 'error': 'Группа не найдена в календаре'}), 404
+
+        order = [gid for gid, _ in groups.ordered()]
+        queue_event(db.session, calendar.id, 'positions', {'groups': order})
+        db.session.commit()
+        return jsonify({'success': True, 'order': order})
+
     @app.route('/api/update_group/<int:group_id>', methods=['PUT'])
     @login_required
     def update_group(group_id):
@@ -1366,23 +2063,24 @@ def register_routes(app):
                 group.color = color
             
             # Получаем текущих участников группы
-            current_members = set(m.id for m in group.members)
+            current_members = {m.id: m for m in group.members}
             new_members = set(user_ids)
             
-            # Удаляем участников, которых нет в новом списке
-            to_remove = current_members - new_members
+            # Удаляем участников, которых нет в новом списке (они уже загружены с группой)
+            to_remove = set(current_members) - new_members
             for user_id in to_remove:
-                user = User.query.get(user_id)
-                if user and user in group.members:
-                    group.members.remove(user)
+                group.members.remove(current_members[user_id])
             
             # Добавляем новых участников
-            to_add = new_members - current_members
+            to_add = new_members - set(current_members)
+            member_ids = calendar_member_ids(group.calendar_id)
+            users_by_id = users_by_ids(to_add)
             for user_id in to_add:
-                user = User.query.get(user_id)
-                if user and user in group.calendar.members and user.id != group.calendar.owner_id:
+                user = users_by_id.get(user_id)
+                if user and user.id in member_ids and user.id != group.calendar.owner_id:
                     group.members.append(user)
             
+            queue_event(db.session, group.calendar_id, 'groups', {'action': 'update', 'group_id': group.id})
             db.session.commit()
             
             return jsonify({
@@ -1391,7 +2089,7 @@ def register_routes(app):
                     'id': group.id,
                     'name': group.name,
                     'color': group.color,
-                    'position': group.position,
+                    'position': group_positions(group.calendar_id).get(group.id),
                     'members': [
                         {
                             'id': m.id,
@@ -1418,6 +2116,7 @@ def register_routes(app):
         
         try:
             # Удаляем группу (участники остаются в календаре)
+            queue_event(db.session, group.calendar_id, 'groups', {'action': 'delete', 'group_id': group.id})
             db.session.delete(group)
             db.session.commit()
             
@@ -1448,12 +2147,19 @@ def register_routes(app):
             group.members.remove(user)
             
             # Удаляем пользователя из календаря
-            if user in group.calendar.members:
-                group.calendar.members.remove(user)
+            if is_calendar_member(group.calendar_id, user.id):
+                db.session.execute(calendar_members.delete().where(
+                    calendar_members.c.calendar_id == group.calendar_id,
+                    calendar_members.c.user_id == user.id
+                ))
                 
                 # Удаляем все смены пользователя в этом календаре
+                deleted_ids = get_shift_ids(Shift.calendar_id == group.calendar.id, Shift.user_id == user.id)
                 Shift.query.filter_by(calendar_id=group.calendar.id, user_id=user.id).delete()
+                record_shift_changes(group.calendar.id, deleted=deleted_ids)
+                queue_event(db.session, group.calendar_id, 'members', {'removed': [user.id]})
             
+            queue_event(db.session, group.calendar_id, 'groups', {'action': 'update', 'group_id': group.id})
             db.session.commit()
             
             return jsonify({
@@ -1483,6 +2189,7 @@ def register_routes(app):
             data = request.get_json() or {}
             month = data.get('month')
             
+            criteria = [Shift.calendar_id == calendar.id]
             if month:
                 try:
                     # Парсим месяц и определяем диапазон дат
@@ -1491,17 +2198,15 @@ def register_routes(app):
                     last_day = next_month - timedelta(days=next_month.day)
                     
                     # Удаляем смены только за указанный месяц
-                    deleted_count = Shift.query.filter(
-                        Shift.calendar_id == calendar.id,
-                        Shift.date >= current_month,
-                        Shift.date <= last_day
-                    ).delete()
+                    criteria += [Shift.date >= current_month, Shift.date <= last_day]
                 except ValueError:
                     # Если месяц некорректный, удаляем все смены
-                    deleted_count = Shift.query.filter_by(calendar_id=calendar.id).delete()
-            else:
-                # Если месяц не указан, удаляем все смены календаря
-                deleted_count = Shift.query.filter_by(calendar_id=calendar.id).delete()
+                    pass
+            # Если месяц не указан, удаляем все смены календаря
+
+            deleted_ids = get_shift_ids(*criteria)
+            deleted_count = Shift.query.filter(*criteria).delete()
+            record_shift_changes(calendar.id, deleted=deleted_ids)
             
             db.session.commit()
             
@@ -1574,25 +2279,7 @@ def register_routes(app):
     @login_required
     def profile():
         # Подсчет статистики пользователя
-        user_shifts = Shift.query.filter_by(user_id=current_user.id).all()
-        
-        # Подсчет общего времени работы
-        total_hours = 0
-        shifts_with_time = 0
-        
-        for shift in user_shifts:
-            if shift.start_time and shift.end_time and shift.show_time:
-                shifts_with_time += 1
-                # Вычисляем разность времени
-                start_datetime = datetime.combine(shift.date, shift.start_time)
-                end_datetime = datetime.combine(shift.date, shift.end_time)
-                
-                # Если смена переходит на следующий день
-                if shift.end_time < shift.start_time:
-                    end_datetime += timedelta(days=1)
-                
-                duration = end_datetime - start_datetime
-                total_hours += duration.total_seconds() / 3600
+        shifts_with_time, total_hours = profile_shift_totals(current_user.id)
         
         total_calendars = Calendar.query.filter_by(owner_id=current_user.id).count()
         total_friends = current_user.friends.count()
@@ -1610,25 +2297,7 @@ def register_routes(app):
         user = User.query.filter_by(username=username).first_or_404()
         
         # Подсчет статистики пользователя
-        user_shifts = Shift.query.filter_by(user_id=user.id).all()
-        
-        # Подсчет общего времени работы
-        total_hours = 0
-        shifts_with_time = 0
-        
-        for shift in user_shifts:
-            if shift.start_time and shift.end_time and shift.show_time:
-                shifts_with_time += 1
-                # Вычисляем разность времени
-                start_datetime = datetime.combine(shift.date, shift.start_time)
-                end_datetime = datetime.combine(shift.date, shift.end_time)
-                
-                # Если смена переходит на следующий день
-                if shift.end_time < shift.start_time:
-                    end_datetime += timedelta(days=1)
-                
-                duration = end_datetime - start_datetime
-                total_hours += duration.total_seconds() / 3600
+        shifts_with_time, total_hours = profile_shift_totals(user.id)
         
         total_calendars = Calendar.query.filter_by(owner_id=user.id).count()
         total_friends = user.friends.count()
@@ -1821,1237 +2490,3 @@ def register_routes(app):
             db.session.rollback()
             flash(f"Ошибка: {str(e)}", "danger")
             return redirect(url_for('friends_page'))
-
-def apply_filters(query, filters):
-    """Apply filters to shift query"""
-    if not filters:
-        return query
-    
-    # Filter by users
-    if filters.get('users'):
-        query = query.filter(Shift.user_id.in_(filters['users']))
-    
-    # Filter by shift type (based on color_class)
-    if filters.get('shiftType'):
-        shift_types = filters['shiftType']
-        if isinstance(shift_types, str):
-            shift_types = [shift_types]
-        
-        if shift_types and shift_types != ['']:
-            # Filter by color_class from shift templates
-            query = query.join(ShiftTemplate).filter(ShiftTemplate.color_class.in_(shift_types))
-    
-    # Filter by duration
-    if filters.get('duration'):
-        duration_type = filters['duration']
-        if duration_type == 'short':
-            # Short shifts: < 4 hours
-            query = query.filter(
-                (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) < 4 * 3600
-            )
-        elif duration_type == 'medium':
-            # Medium shifts: 4-8 hours
-            query = query.filter(
-                (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) >= 4 * 3600,
-                (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) <= 8 * 3600
-            )
-        elif duration_type == 'long':
-            # Long shifts: > 8 hours
-            query = query.filter(
-                (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) > 8 * 3600
-            )
-    
-    return query
-
-    @app.route('/calendar/<int:calendar_id>/clear-all-shifts', methods=['POST'])
-    @login_required
-    def clear_all_shifts(calendar_id):
-        calendar = Calendar.query.get_or_404(calendar_id)
-        
-        # Проверка прав доступа - только владелец может очищать смены
-        if calendar.owner_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Доступ запрещён'}), 403
-        
-        try:
-            # Получаем месяц из запроса
-            data = request.get_json() or {}
-            month = data.get('month')
-            
-            if month:
-                try:
-                    # Парсим месяц и определяем диапазон дат
-                    current_month = datetime.strptime(month, '%Y-%m-%d').date().replace(day=1)
-                    next_month = current_month.replace(day=28) + timedelta(days=4)
-                    last_day = next_month - timedelta(days=next_month.day)
-                    
-                    # Удаляем смены только за указанный месяц
-                    deleted_count = Shift.query.filter(
-                        Shift.calendar_id == calendar.id,
-                        Shift.date >= current_month,
-                        Shift.date <= last_day
-                    ).delete()
-                except ValueError:
-                    # Если месяц некорректный, удаляем все смены
-                    deleted_count = Shift.query.filter_by(calendar_id=calendar.id).delete()
-            else:
-                # Если месяц не указан, удаляем все смены календаря
-                deleted_count = Shift.query.filter_by(calendar_id=calendar.id).delete()
-                
-            db.session.commit()
-            
-            return jsonify({
-                'success': True, 
-                'message': f'Удалено смен: {deleted_count}',
-                'deleted_count': deleted_count
-            })
-        except Exception as e:
-            db.session.rollback()
-            app.logger.error(f"Error clearing shifts: {str(e)}")
-            return jsonify({'success': False, 'error': 'Ошибка при удалении смен'}), 500
-
-    @app.route('/calendar/<int:calendar_id>/members', methods=['GET'])
-    @login_required
-    def get_calendar_members(calendar_id):
-        calendar = Calendar.query.get_or_404(calendar_id)
-
-        # Проверка доступа
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
-            abort(403)
-
-        # Возвращаем участников с их позицией из calendar_members, отсортированных по позиции (возрастание)
-        # Владелец не включается (для групп он не нужен)
-        rows = (
-            db.session.query(User.id, User.username, User.first_name, User.last_name, User.avatar, calendar_members.c.position)
-            .join(calendar_members, (calendar_members.c.user_id == User.id) & (calendar_members.c.calendar_id == calendar.id))
-            .order_by(calendar_members.c.position.asc(), User.id.asc())
-            .all()
-        )
-
-        members = [
-            {
-                'id': r.id,
-                'username': r.username,
-                'first_name': r.first_name,
-                'last_name': r.last_name,
-                'avatar': r.avatar,
-                'position': int(r.position) if r.position is not None else None,
-            }
-            for r in rows
-        ]
-
-        return jsonify(members)
-
-    @app.route('/calendar/<int:calendar_id>/shifts', methods=['GET'])
-    @login_required
-    def get_calendar_shifts(calendar_id):
-        calendar = Calendar.query.get_or_404(calendar_id)
-
-        # Проверка доступа
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
-            abort(403)
-
-        # Получаем месяц из параметров запроса
-        month = request.args.get('month')
-        if month:
-            try:
-                current_month = datetime.strptime(month, '%Y-%m-%d').date().replace(day=1)
-            except ValueError:
-                current_month = datetime.utcnow().date().replace(day=1)
-        else:
-            current_month = datetime.utcnow().date().replace(day=1)
-
-        # Получаем все дни месяца
-        next_month = current_month.replace(day=28) + timedelta(days=4)
-        last_day = next_month - timedelta(days=next_month.day)
-
-        shifts = Shift.query.filter(
-            Shift.calendar_id == calendar_id,
-            Shift.date >= current_month,
-            Shift.date <= last_day
-        ).all()
-
-        # Формируем список смен
-        shifts_data = []
-        for shift in shifts:
-            shift_data = {
-                'id': shift.id,
-                'user_id': shift.user_id,
-                'date': shift.date.strftime('%Y-%m-%d'),
-                'title': shift.title,
-                'color_class': shift.color_class,
-                'show_time': shift.show_time
-            }
-            
-            if shift.show_time and shift.start_time and shift.end_time:
-                shift_data['start_time'] = shift.start_time.strftime('%H:%M')
-                shift_data['end_time'] = shift.end_time.strftime('%H:%M')
-            
-            shifts_data.append(shift_data)
-
-        return jsonify(shifts_data)
-
-
-    @app.route('/calendar/<int:calendar_id>/update-positions', methods=['POST'])
-    @login_required
-    def update_calendar_positions(calendar_id):
-        if not request.is_json:
-            return jsonify({'success': False, 'error': 'Invalid content type'}), 400
-
-        calendar = Calendar.query.get_or_404(calendar_id)
-
-        if calendar.owner_id != current_user.id:
-                return jsonify({
-                    'success': False,
-                    'error': 'Forbidden',
-                    'message': 'Только владелец календаря может изменять порядок участников'
-                }), 403
-
-        try:
-            data = request.get_json() or {}
-            # Поддерживаем оба формата: { "positions": {"<uid>": pos} } и {"<uid>": pos}
-            positions = data.get('positions') if isinstance(data, dict) and 'positions' in data else data
-
-            if not isinstance(positions, dict) or not positions:
-                return jsonify({'success': False, 'error': 'Empty positions data'}), 400
-
-            # Приводим ключи и значения к int и валидируем
-            try:
-                normalized = {int(uid): int(pos) for uid, pos in positions.items()}
-            except Exception:
-                return jsonify({'success': False, 'error': 'Positions must be a dict of {user_id:int -> position:int}'}), 400
-
-            valid_user_ids = {m.id for m in calendar.members}
-            for uid in normalized.keys():
-                if uid not in valid_user_ids:
-                    return jsonify({'success': False, 'error': f'Invalid user ID: {uid}'}), 400
-
-            # Обновляем позиции по одной записи
-            for uid, pos in normalized.items():
-                db.session.execute(
-                    calendar_members.update()
-                    .where(calendar_members.c.calendar_id == calendar.id)
-                    .where(calendar_members.c.user_id == uid)
-                    .values(position=pos)
-                )
-
-            db.session.commit()
-
-            return jsonify({
-                'success': True,
-                'message': 'Positions updated successfully',
-                'updated_count': len(normalized)
-            })
-
-        except Exception as e:
-            db.session.rollback()
-            app.logger.error(f"Position update error: {str(e)}")
-            return jsonify({
-                'success': False,
-                'error': str(e)
-            }), 500
-
-    @app.route('/api/get_template_info/<int:template_id>', methods=['GET'])
-    @login_required
-    def get_template_info(template_id):
-        template = ShiftTemplate.query.get_or_404(template_id)
-
-        # Проверка прав доступа
-        if template.owner_id != current_user.id and current_user not in template.calendar.members:
-            abort(403)
-
-        return jsonify({
-            'id': template.id,
-            'title': template.title,
-            'start_time': template.start_time.strftime('%H:%M'),
-            'end_time': template.end_time.strftime('%H:%M'),
-            'show_time': template.show_time
-        })
-
-    @app.route('/api/get_shift_info/<int:shift_id>', methods=['GET'])
-    @login_required
-    def get_shift_info(shift_id):
-        shift = Shift.query.get_or_404(shift_id)
-
-        # Проверка прав доступа
-        if shift.calendar.owner_id != current_user.id and current_user not in shift.calendar.members:
-            abort(403)
-
-        show_time = True
-        if shift.template:
-            show_time = shift.template.show_time
-
-        return jsonify({
-            'id': shift.id,
-            'title': shift.title,
-            'start_time': shift.start_time.strftime('%H:%M'),
-            'end_time': shift.end_time.strftime('%H:%M'),
-            'show_time': shift.show_time,
-            'template': {
-                'id': shift.template.id if shift.template else None,
-                'color_class': shift.template.color_class if shift.template else 'badge-color-1'
-            }
-        })
-
-    # Маршруты для работы с группами
-    @app.route('/api/create_group', methods=['POST'])
-    @login_required
-    def create_group():
-        data = request.get_json()
-        calendar_id = data.get('calendar_id')
-        name = data.get('name')
-        color = data.get('color', 'badge-color-1')
-        user_ids = data.get('user_ids', [])
-
-        calendar = Calendar.query.get_or_404(calendar_id)
-        if calendar.owner_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
-
-        try:
-            # Получаем максимальную позицию для групп в этом календаре
-            max_position = db.session.query(db.func.max(Group.position)).filter(
-                Group.calendar_id == calendar_id
-            ).scalar() or 0
-            
-            # Новая группа получает позицию на 1 больше максимальной
-            new_position = max_position + 1
-            
-            group = Group(
-                name=name,
-                color=color,
-                calendar_id=calendar_id,
-                owner_id=current_user.id,
-                position=new_position
-            )
-            db.session.add(group)
-            db.session.flush()  # Получаем ID группы
-
-            # Добавляем участников в группу (исключаем создателя календаря)
-            for user_id in user_ids:
-                user = User.query.get(user_id)
-                if user and user in calendar.members and user.id != calendar.owner_id:
-                    group.members.append(user)
-
-            db.session.commit()
-
-            return jsonify({
-                'success': True,
-                'group': {
-                    'id': group.id,
-                    'name': group.name,
-                    'color': group.color,
-                    'position': group.position,
-                    'members': [{'id': m.id, 'username': m.username, 'avatar': m.avatar} for m in group.members]
-                }
-            })
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
-
-    @app.route('/api/update_group/<int:group_id>', methods=['PUT'])
-    @login_required
-    def update_group(group_id):
-        group = Group.query.get_or_404(group_id)
-        # Проверяем, что пользователь является владельцем группы ИЛИ владельцем календаря
-        if group.owner_id != current_user.id and group.calendar.owner_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
-
-        data = request.get_json()
-        name = data.get('name')
-        color = data.get('color')
-        user_ids = data.get('user_ids', [])
-
-        try:
-            if name:
-                group.name = name
-            if color:
-                group.color = color
-
-            # Обновляем участников группы (исключаем создателя календаря)
-            group.members.clear()
-            for user_id in user_ids:
-                user = User.query.get(user_id)
-                if user and user in group.calendar.members and user.id != group.calendar.owner_id:
-                    group.members.append(user)
-
-            db.session.commit()
-
-            return jsonify({
-                'success': True,
-                'group': {
-                    'id': group.id,
-                    'name': group.name,
-                    'color': group.color,
-                    'position': group.position,
-                    'members': [{'id': m.id, 'username': m.username, 'avatar': m.avatar} for m in group.members]
-                }
-            })
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
-
-    @app.route('/api/delete_group/<int:group_id>', methods=['DELETE'])
-    @login_required
-    def delete_group(group_id):
-        group = Group.query.get_or_404(group_id)
-        # Проверяем, что пользователь является владельцем группы ИЛИ владельцем календаря
-        if group.owner_id != current_user.id and group.calendar.owner_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
-
-        try:
-            db.session.delete(group)
-            db.session.commit()
-            return jsonify({'success': True, 'message': 'Группа успешно удалена'})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
-
-    @app.route('/api/get_calendar_groups/<int:calendar_id>', methods=['GET'])
-    @login_required
-    def get_calendar_groups(calendar_id):
-        calendar = Calendar.query.get_or_404(calendar_id)
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
-            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
-
-        # Возвращаем группы в порядке позиции (новые выше), при равной позиции — по id (новые выше)
-        groups = (
-            Group.query
-            .filter_by(calendar_id=calendar_id)
-            .order_by(Group.position.desc(), Group.id.desc())
-            .all()
-        )
-        groups_data = []
-        
-        for group in groups:
-            groups_data.append({
-                'id': group.id,
-                'name': group.name,
-                'color': group.color,
-                'owner_id': group.owner_id,
-                'position': group.position,
-                'members': [
-                    {
-                        'id': m.id,
-                        'username': m.username,
-                        'first_name': m.first_name,
-                        'last_name': m.last_name,
-                        'avatar': m.avatar
-                    } for m in group.members
-                ]
-            })
-
-        return jsonify({'success': True, 'groups': groups_data})
-
-    @app.route('/api/get_user_groups/<int:calendar_id>', methods=['GET'])
-    @login_required
-    def get_user_groups(calendar_id):
-        calendar = Calendar.query.get_or_404(calendar_id)
-        if calendar.owner_id != current_user.id and current_user not in calendar.members:
-            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
-
-        # Получаем всех участников календаря с их группами
-        all_members = [calendar.owner] + list(calendar.members)
-        members_with_groups = []
-
-        for member in all_members:
-            member_groups = Group.query.filter(
-                Group.members.contains(member)
-            ).filter_by(calendar_id=calendar_id).all()
-            
-            members_with_groups.append({
-                'id': member.id,
-                'username': member.username,
-                'first_name': member.first_name,
-                'last_name': member.last_name,
-                'avatar': member.avatar,
-                'groups': [{'id': g.id, 'name': g.name, 'color': g.color} for g in member_groups]
-            })
-
-        return jsonify({'success': True, 'members': members_with_groups})
-
-    @app.route('/api/update_group_positions/<int:calendar_id>', methods=['POST'])
-    @login_required
-    def update_group_positions(calendar_id):
-        """Обновляет порядок групп в календаре.
-        Ожидает JSON вида { "order": [group_id_top, group_id_next, ...] }
-        Позиции присваиваются так, чтобы первый элемент имел наибольшую позицию (для order_by desc).
-        """
-        calendar = Calendar.query.get_or_404(calendar_id)
-        if calendar.owner_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Изменять порядок групп может только владелец календаря'}), 403
-
-        data = request.get_json(silent=True) or {}
-        order = data.get('order')
-        if not isinstance(order, list) or not all(isinstance(i, int) for i in order):
-            return jsonify({'success': False, 'error': 'Некорректный формат данных'}), 400
-
-        # Получаем все группы календаря
-        groups = Group.query.filter_by(calendar_id=calendar_id).all()
-        group_map = {g.id: g for g in groups}
-
-        # Фильтруем входной порядок только по существующим группам этого календаря
-        filtered_order = [gid for gid in order if gid in group_map]
-        if not filtered_order:
-            return jsonify({'success': False, 'error': 'Список групп пуст или неверен'}), 400
-
-        try:
-            # Максимальная позиция присваивается верхнему элементу
-            max_pos = len(filtered_order)
-            for idx, gid in enumerate(filtered_order):
-                group_map[gid].position = max_pos - idx
-
-            db.session.commit()
-            return jsonify({'success': True})
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
-
-    @app.route('/api/remove_member_from_group/<int:group_id>/<int:user_id>', methods=['POST'])
-    @login_required
-    def remove_member_from_group(group_id, user_id):
-        group = Group.query.get_or_404(group_id)
-        user = User.query.get_or_404(user_id)
-        
-        # Проверяем, что пользователь является владельцем группы ИЛИ владельцем календаря
-        if group.owner_id != current_user.id and group.calendar.owner_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Доступ запрещен'}), 403
-        
-        # Проверяем, что пользователь состоит в группе
-        if user not in group.members:
-            return jsonify({'success': False, 'error': 'Пользователь не состоит в этой группе'}), 400
-        
-        try:
-            # Удаляем пользователя из группы
-            group.members.remove(user)
-            
-            # Удаляем пользователя из календаря
-            if user in group.calendar.members:
-                group.calendar.members.remove(user)
-                
-                # Удаляем все смены пользователя в этом календаре
-                Shift.query.filter_by(calendar_id=group.calendar.id, user_id=user.id).delete()
-            
-            db.session.commit()
-            
-            return jsonify({
-                'success': True,
-                'message': f'{user.username} удален из группы и календаря',
-                'removed_user': {
-                    'id': user.id,
-                    'username': user.username,
-                    'avatar': user.avatar
-                }
-            })
-        except Exception as e:
-            db.session.rollback()
-            return jsonify({'success': False, 'error': str(e)}), 500
-
-    @app.route('/upload_avatar', methods=['POST'])
-    @login_required
-    def upload_avatar():
-        try:
-            if 'avatar' not in request.files:
-                return jsonify({'success': False, 'message': 'Файл не выбран'}), 400
-
-            file = request.files['avatar']
-            if file.filename == '':
-                return jsonify({'success': False, 'message': 'Файл не выбран'}), 400
-
-            if file and allowed_file(file.filename):
-                # Создаем безопасное имя файла с уникальным идентификатором
-                filename = secure_filename(file.filename)
-                file_extension = filename.rsplit('.', 1)[1].lower()
-                unique_filename = f"avatar_{current_user.id}_{int(datetime.now().timestamp())}.{file_extension}"
-                
-                # Путь для сохранения файла
-                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], 'images', unique_filename)
-                
-                # Создаем директорию если её нет
-                os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-                
-                # Удаляем старый аватар если он не дефолтный
-                if current_user.avatar and current_user.avatar != 'default_avatar.svg':
-                    old_avatar_path = os.path.join(app.config['UPLOAD_FOLDER'], 'images', current_user.avatar)
-                    if os.path.exists(old_avatar_path):
-                        try:
-                            os.remove(old_avatar_path)
-                        except OSError:
-                            pass  # Игнорируем ошибки удаления старого файла
-                
-                # Сохраняем новый файл
-                file.save(upload_path)
-                
-                # Обновляем аватар пользователя в базе данных
-                current_user.avatar = unique_filename
-                db.session.commit()
-                
-                # Возвращаем успешный ответ с URL нового аватара
-                avatar_url = url_for('static', filename=f'images/{unique_filename}')
-                return jsonify({
-                    'success': True,
-                    'message': 'Аватар успешно обновлен',
-                    'avatar_url': avatar_url
-                })
-            else:
-                return jsonify({'success': False, 'message': 'Неподдерживаемый формат файла'}), 400
-
-        except Exception as e:
-            db.session.rollback()
-            app.logger.error(f"Error uploading avatar: {str(e)}")
-            return jsonify({'success': False, 'message': 'Ошибка при загрузке аватара'}), 500
-
-
-# Analysis helper functions
-def get_week_range(month_str):
-    """Get start and end date for a week period"""
-    try:
-        if 'W' in month_str:
-            # Parse week format: 2025-W35
-            year, week = month_str.split('-W')
-            # Use ISO week date parsing
-            date = datetime.strptime(f'{year}-W{week.zfill(2)}-1', '%Y-W%W-%w').date()
-            start_date = date - timedelta(days=date.weekday())
-            end_date = start_date + timedelta(days=6)
-            return start_date, end_date
-        else:
-            # Old format fallback
-            date = datetime.strptime(month_str, '%Y-%m').date()
-            # Get the first day of the week containing the first day of the month
-            start_date = date - timedelta(days=date.weekday())
-            end_date = start_date + timedelta(days=6)
-            return start_date, end_date
-    except ValueError:
-        # Fallback to current week
-        today = datetime.utcnow().date()
-        start_date = today - timedelta(days=today.weekday())
-        end_date = start_date + timedelta(days=6)
-        return start_date, end_date
-
-
-def get_month_range(month_str):
-    """Get start and end date for a month period"""
-    try:
-        date = datetime.strptime(month_str, '%Y-%m').date().replace(day=1)
-        next_month = date.replace(day=28) + timedelta(days=4)
-        end_date = next_month - timedelta(days=next_month.day)
-        return date, end_date
-    except ValueError:
-        # Fallback to current month
-        today = datetime.utcnow().date()
-        start_date = today.replace(day=1)
-        next_month = start_date.replace(day=28) + timedelta(days=4)
-        end_date = next_month - timedelta(days=next_month.day)
-        return start_date, end_date
-
-
-def get_quarter_range(month_str):
-    """Get start and end date for a quarter period"""
-    try:
-        if 'Q' in month_str:
-            # Parse quarter format: 2025-Q3
-            year, quarter = month_str.split('-Q')
-            year = int(year)
-            quarter = int(quarter)
-            start_month = (quarter - 1) * 3 + 1
-            start_date = datetime(year, start_month, 1).date()
-            
-            if quarter == 4:
-                end_date = datetime(year, 12, 31).date()
-            else:
-                end_month = quarter * 3
-                import calendar
-                last_day = calendar.monthrange(year, end_month)[1]
-                end_date = datetime(year, end_month, last_day).date()
-            
-            return start_date, end_date
-        else:
-            # Old format fallback
-            date = datetime.strptime(month_str, '%Y-%m').date()
-            quarter = (date.month - 1) // 3 + 1
-            start_month = (quarter - 1) * 3 + 1
-            start_date = date.replace(month=start_month, day=1)
-            
-            if quarter == 4:
-                end_date = date.replace(year=date.year + 1, month=1, day=1) - timedelta(days=1)
-            else:
-                end_month = quarter * 3 + 1
-                end_date = date.replace(month=end_month, day=1) - timedelta(days=1)
-            
-            return start_date, end_date
-    except ValueError:
-        # Fallback to current quarter
-        today = datetime.utcnow().date()
-        quarter = (today.month - 1) // 3 + 1
-        start_month = (quarter - 1) * 3 + 1
-        start_date = today.replace(month=start_month, day=1)
-        
-        if quarter == 4:
-            end_date = today.replace(year=today.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            end_month = quarter * 3 + 1
-            end_date = today.replace(month=end_month, day=1) - timedelta(days=1)
-        
-        return start_date, end_date
-
-
-def get_year_range(month_str):
-    """Get start and end date for a year period"""
-    try:
-        # For year period, month_str is just the year (e.g., '2024')
-        if len(month_str) == 4 and month_str.isdigit():
-            year = int(month_str)
-        else:
-            # Try parsing as year-month format and extract year
-            date = datetime.strptime(month_str, '%Y-%m').date()
-            year = date.year
-        
-        start_date = datetime(year, 1, 1).date()
-        end_date = datetime(year, 12, 31).date()
-        return start_date, end_date
-    except (ValueError, TypeError):
-        # Fallback to current year
-        today = datetime.utcnow().date()
-        start_date = today.replace(month=1, day=1)
-        end_date = today.replace(month=12, day=31)
-        return start_date, end_date
-
-
-def calculate_shift_stats(calendar_ids, start_date, end_date, filters=None, user_id=None, user_calendar_roles=None):
-    """Calculate shift statistics"""
-    query = Shift.query.filter(
-        Shift.calendar_id.in_(calendar_ids),
-        Shift.date >= start_date,
-        Shift.date <= end_date
-    )
-    
-    # If user is only a participant (not creator of any selected calendars), show only their shifts
-    if user_id and user_calendar_roles:
-        is_creator_of_any = any(role == 'creator' for role in user_calendar_roles.values())
-        if not is_creator_of_any:
-            query = query.filter(Shift.user_id == user_id)
-    
-    if filters:
-        query = apply_filters(query, filters)
-    
-    shifts = query.all()
-    
-    if not shifts:
-        return {
-            'total_hours': 0,
-            'total_shifts': 0,
-            'avg_duration': 0,
-            'top_template': None
-        }
-    
-    total_minutes = 0
-    template_usage = {}
-    
-    for shift in shifts:
-        # Only calculate duration for shifts that show time
-        if shift.show_time:
-            # Calculate shift duration in minutes
-            start_time = datetime.combine(shift.date, shift.start_time)
-            end_time = datetime.combine(shift.date, shift.end_time)
-            
-            # Handle shifts that cross midnight
-            if end_time < start_time:
-                end_time += timedelta(days=1)
-            
-            duration = (end_time - start_time).total_seconds() / 60
-            total_minutes += duration
-        
-        # Track template usage only for shifts with time
-        if shift.show_time and shift.template_id:
-            template = ShiftTemplate.query.get(shift.template_id)
-            if template:
-                template_usage[template.title] = template_usage.get(template.title, 0) + 1
-    
-    total_hours = total_minutes / 60
-    # Only calculate average duration for shifts with time
-    shifts_with_time = [shift for shift in shifts if shift.show_time]
-    avg_duration = total_minutes / len(shifts_with_time) if shifts_with_time else 0
-    top_template = max(template_usage.items(), key=lambda x: x[1])[0] if template_usage else None
-    
-    return {
-        'total_hours': round(total_hours, 1),
-        'total_shifts': len(shifts_with_time),
-        'avg_duration': round(avg_duration),
-        'top_template': top_template
-    }
-
-
-def calculate_team_analysis(calendar_ids, start_date, end_date, filters=None, user_id=None, user_calendar_roles=None):
-    """Calculate team analysis data"""
-    # Get all users involved in shifts
-    query = db.session.query(Shift, User).join(User, Shift.user_id == User.id).filter(
-        Shift.calendar_id.in_(calendar_ids),
-        Shift.date >= start_date,
-        Shift.date <= end_date
-    )
-    
-    # If user is only a participant (not creator of any selected calendars), show only their shifts
-    if user_id and user_calendar_roles:
-        is_creator_of_any = any(role == 'creator' for role in user_calendar_roles.values())
-        if not is_creator_of_any:
-            query = query.filter(Shift.user_id == user_id)
-    
-    if filters:
-        # Apply filters to the Shift part of the query
-        if filters.get('users'):
-            query = query.filter(Shift.user_id.in_(filters['users']))
-        
-        if filters.get('shiftType'):
-            shift_types = filters['shiftType']
-            if isinstance(shift_types, str):
-                shift_types = [shift_types]
-            
-            if shift_types and shift_types != ['']:
-                # Filter by color_class from shifts directly
-                query = query.filter(Shift.color_class.in_(shift_types))
-        
-        if filters.get('duration'):
-            duration_type = filters['duration']
-            if duration_type == 'short':
-                query = query.filter(
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) < 4 * 3600
-                )
-            elif duration_type == 'medium':
-                query = query.filter(
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) >= 4 * 3600,
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) <= 8 * 3600
-                )
-            elif duration_type == 'long':
-                query = query.filter(
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) > 8 * 3600
-                )
-    
-    shifts = query.all()
-    
-    user_stats = {}
-    coverage_data = []
-    
-    # Calculate user statistics
-    for shift, user in shifts:
-        if user.id not in user_stats:
-            user_stats[user.id] = {
-                'user': user,
-                'total_hours': 0,
-                'total_shifts': 0
-            }
-        
-        # Only calculate duration and count shifts that show time
-        if shift.show_time:
-            # Calculate shift duration
-            start_time = datetime.combine(shift.date, shift.start_time)
-            end_time = datetime.combine(shift.date, shift.end_time)
-            
-            if end_time < start_time:
-                end_time += timedelta(days=1)
-            
-            duration = (end_time - start_time).total_seconds() / 3600
-            user_stats[user.id]['total_hours'] += duration
-            user_stats[user.id]['total_shifts'] += 1
-    
-    # Create activity ranking
-    activity_ranking = []
-    for user_id, stats in user_stats.items():
-        user = stats['user']
-        activity_ranking.append({
-            'id': user.id,
-            'username': user.username,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'avatar': user.avatar,
-            'total_hours': round(stats['total_hours'], 1),
-            'total_shifts': stats['total_shifts']
-        })
-    
-    # Sort by total hours descending
-    activity_ranking.sort(key=lambda x: x['total_hours'], reverse=True)
-    
-    # Calculate coverage data (simplified - by day of month)
-    # Русские названия месяцев
-    russian_months = {
-        1: 'Январь', 2: 'Февраль', 3: 'Март', 4: 'Апрель',
-        5: 'Май', 6: 'Июнь', 7: 'Июль', 8: 'Август',
-        9: 'Сентябрь', 10: 'Октябрь', 11: 'Ноябрь', 12: 'Декабрь'
-    }
-    
-    current_date = start_date
-    while current_date <= end_date:
-        day_shifts = [s for s, u in shifts if s.date == current_date]
-        coverage_percent = min(100, len(day_shifts) * 20)  # Simplified calculation
-        
-        coverage_data.append({
-            'day': current_date.day,
-            'month': current_date.month,
-            'month_name': russian_months[current_date.month],
-            'full_date': current_date.strftime('%Y-%m-%d'),
-            'coverage_percent': coverage_percent,
-            'shifts_count': len(day_shifts)
-        })
-        current_date += timedelta(days=1)
-    
-    # Workload balance data
-    workload_balance = {
-        'labels': [f"{u['first_name']} {u['last_name']}" for u in activity_ranking[:10]],
-        'values': [u['total_hours'] for u in activity_ranking[:10]]
-    }
-    
-    return {
-        'activity_ranking': activity_ranking,
-        'coverage_data': coverage_data,
-        'workload_balance': workload_balance
-    }
-
-
-def calculate_time_slots(calendar_ids, start_date, end_date, filters=None, user_id=None, user_calendar_roles=None):
-    """Calculate time slot distribution"""
-    query = Shift.query.filter(
-        Shift.calendar_id.in_(calendar_ids),
-        Shift.date >= start_date,
-        Shift.date <= end_date
-    )
-    
-    # If user is only a participant (not creator of any selected calendars), show only their shifts
-    if user_id and user_calendar_roles:
-        is_creator_of_any = any(role == 'creator' for role in user_calendar_roles.values())
-        if not is_creator_of_any:
-            query = query.filter(Shift.user_id == user_id)
-    
-    if filters:
-        query = apply_filters(query, filters)
-    
-    shifts = query.all()
-    
-    if not shifts:
-        return {'templates': []}
-    
-    # Group shifts by their time ranges (template-like grouping)
-    template_data = {}
-    
-    for shift in shifts:
-        # Handle shifts with time
-        if shift.show_time and shift.start_time and shift.end_time:
-            time_range = f"{shift.start_time.strftime('%H:%M')} - {shift.end_time.strftime('%H:%M')}"
-            template_key = f"{shift.title}|{time_range}"
-        # Handle shifts without time
-        else:
-            time_range = "Без времени"
-            template_key = f"{shift.title}|{time_range}"
-        
-        if template_key not in template_data:
-            template_data[template_key] = {
-                'title': shift.title,
-                'time_range': time_range,
-                'count': 0,
-                'color_class': shift.color_class,
-                'shifts': []
-            }
-        
-        template_data[template_key]['count'] += 1
-        template_data[template_key]['shifts'].append({
-            'id': shift.id,
-            'title': shift.title,
-            'date': shift.date.strftime('%Y-%m-%d'),
-            'user_id': shift.user_id
-        })
-    
-    # Calculate total shifts for percentage (include all shifts for seasonal patterns)
-    total_shifts = len(shifts)
-    
-    if total_shifts == 0:
-        return {'templates': []}
-    
-    # Convert to list and calculate percentages
-    templates_list = []
-    for time_range, data in template_data.items():
-        templates_list.append({
-            'title': data['title'],
-            'time_range': time_range,
-            'percentage': (data['count'] / total_shifts) * 100,
-            'count': data['count'],
-            'color_class': data['color_class'],
-            'shifts': data['shifts']
-        })
-    
-    # Sort by usage count (most used first), then by title for same counts
-    templates_list.sort(key=lambda x: (-x['count'], x['title']))
-    
-    return {'templates': templates_list}
-
-
-def calculate_work_time_distribution(calendar_ids, start_date, end_date, filters=None, user_id=None, user_calendar_roles=None):
-    """Calculate work time distribution by user"""
-    query = db.session.query(Shift, User).join(User, Shift.user_id == User.id).filter(
-        Shift.calendar_id.in_(calendar_ids),
-        Shift.date >= start_date,
-        Shift.date <= end_date
-    )
-    
-    # If user is only a participant (not creator of any selected calendars), show only their shifts
-    if user_id and user_calendar_roles:
-        is_creator_of_any = any(role == 'creator' for role in user_calendar_roles.values())
-        if not is_creator_of_any:
-            query = query.filter(Shift.user_id == user_id)
-    
-    if filters:
-        if filters.get('users'):
-            query = query.filter(Shift.user_id.in_(filters['users']))
-        
-        if filters.get('shiftType'):
-            shift_types = filters['shiftType']
-            if isinstance(shift_types, str):
-                shift_types = [shift_types]
-            
-            if shift_types and shift_types != ['']:
-                # Filter by color_class from shifts directly
-                query = query.filter(Shift.color_class.in_(shift_types))
-        
-        if filters.get('duration'):
-            duration_type = filters['duration']
-            if duration_type == 'short':
-                query = query.filter(
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) < 4 * 3600
-                )
-            elif duration_type == 'medium':
-                query = query.filter(
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) >= 4 * 3600,
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) <= 8 * 3600
-                )
-            elif duration_type == 'long':
-                query = query.filter(
-                    (extract('epoch', Shift.end_time) - extract('epoch', Shift.start_time)) > 8 * 3600
-                )
-    
-    shifts = query.all()
-    
-    user_hours = {}
-    
-    for shift, user in shifts:
-        if user.id not in user_hours:
-            user_hours[user.id] = {
-                'name': f"{user.first_name} {user.last_name}",
-                'hours': 0
-            }
-        
-        # Only calculate duration for shifts that show time
-        if shift.show_time:
-            # Calculate shift duration
-            start_time = datetime.combine(shift.date, shift.start_time)
-            end_time = datetime.combine(shift.date, shift.end_time)
-            
-            if end_time < start_time:
-                end_time += timedelta(days=1)
-            
-            duration = (end_time - start_time).total_seconds() / 3600
-            user_hours[user.id]['hours'] += duration
-    
-    # Sort by hours and take top users
-    sorted_users = sorted(user_hours.values(), key=lambda x: x['hours'], reverse=True)[:6]
-    
-    return {
-        'labels': [user['name'] for user in sorted_users],
-        'values': [round(user['hours'], 1) for user in sorted_users]
-    }
-
-
-def calculate_weekday_activity(calendar_ids, start_date, end_date, filters=None, user_id=None, user_calendar_roles=None):
-    """Calculate activity by weekday"""
-    query = Shift.query.filter(
-        Shift.calendar_id.in_(calendar_ids),
-        Shift.date >= start_date,
-        Shift.date <= end_date
-    )
-    
-    # If user is only a participant (not creator of any selected calendars), show only their shifts
-    if user_id and user_calendar_roles:
-        is_creator_of_any = any(role == 'creator' for role in user_calendar_roles.values())
-        if not is_creator_of_any:
-            query = query.filter(Shift.user_id == user_id)
-    
-    if filters:
-        query = apply_filters(query, filters)
-    
-    shifts = query.all()
-    
-    weekday_hours = [0] * 7  # Monday = 0, Sunday = 6
-    
-    for shift in shifts:
-        # Only calculate duration for shifts that show time
-        if shift.show_time:
-            weekday = shift.date.weekday()
-            
-            # Calculate shift duration
-            start_time = datetime.combine(shift.date, shift.start_time)
-            end_time = datetime.combine(shift.date, shift.end_time)
-            
-            if end_time < start_time:
-                end_time += timedelta(days=1)
-            
-            duration = (end_time - start_time).total_seconds() / 3600
-            weekday_hours[weekday] += duration
-    
-    return {
-        'hours': [round(hours, 1) for hours in weekday_hours]
-    }
-
-
-def calculate_trends_data(calendar_ids, period, month, filters=None, user_id=None, user_calendar_roles=None):
-    """Calculate trends data over time"""
-    # Get date ranges for the last several periods
-    periods = []
-    trends_data = {
-        'hours': {'labels': [], 'values': []},
-        'shifts': {'labels': [], 'values': []},
-        'people': {'labels': [], 'values': []}
-    }
-    
-    try:
-        if period == 'week' and 'W' in month:
-            # Parse week format: 2024-W35
-            year, week = month.split('-W')
-            # Use ISO week date parsing
-            base_date = datetime.strptime(f'{year}-W{week.zfill(2)}-1', '%Y-W%W-%w').date()
-            print(f"Week parsing: {month} -> {base_date}")
-        elif period == 'quarter' and 'Q' in month:
-            # Parse quarter format: 2024-Q3
-            year, quarter = month.split('-Q')
-            quarter_month = (int(quarter) - 1) * 3 + 1
-            base_date = datetime(int(year), quarter_month, 1).date()
-            print(f"Quarter parsing: {month} -> {base_date} (Q{quarter} {year})")
-        elif period == 'year' and len(month) == 4:
-            # Parse year format: 2024
-            base_date = datetime(int(month), 1, 1).date()
-        else:
-            # Parse month format: 2024-08
-            base_date = datetime.strptime(month, '%Y-%m').date()
-    except ValueError as e:
-        print(f"Error parsing {month}: {e}")
-        base_date = datetime.utcnow().date()
-    
-    for i in range(11, -1, -1):  # Last 12 periods
-        if period == 'week':
-            # Calculate each week going backwards from the selected week
-            weeks_back = i  # i goes from 11 to 0, so 11 weeks back to current week
-            target_date = base_date - timedelta(weeks=weeks_back)
-            # Get start of week (Monday)
-            start_date = target_date - timedelta(days=target_date.weekday())
-            end_date = start_date + timedelta(days=6)
-            label = f"Неделя {start_date.strftime('%d.%m')} - {end_date.strftime('%d.%m.%Y')}"
-        elif period == 'month':
-            # Calculate month by subtracting months properly
-            year = base_date.year
-            month_num = base_date.month - i
-            
-            # Handle year rollover
-            while month_num <= 0:
-                month_num += 12
-                year -= 1
-            
-            period_date = datetime(year, month_num, 1).date()
-            start_date, end_date = get_month_range(period_date.strftime('%Y-%m'))
-            
-            # Russian month names
-            russian_months = {
-                1: 'Янв', 2: 'Фев', 3: 'Мар', 4: 'Апр',
-                5: 'Май', 6: 'Июн', 7: 'Июл', 8: 'Авг',
-                9: 'Сен', 10: 'Окт', 11: 'Ноя', 12: 'Дек'
-            }
-            label = f"{russian_months[month_num]} {year}"
-        elif period == 'quarter':
-            # Calculate each quarter going backwards from the selected quarter
-            base_quarter = (base_date.month - 1) // 3 + 1
-            base_year = base_date.year
-            
-            quarters_back = i  # i goes from 11 to 0, so 11 quarters back to current quarter
-            target_quarter = base_quarter - quarters_back
-            target_year = base_year
-            
-            while target_quarter <= 0:
-                target_quarter += 4
-                target_year -= 1
-            
-            start_month = (target_quarter - 1) * 3 + 1
-            start_date = datetime(target_year, start_month, 1).date()
-            
-            # Calculate end of quarter - last day of third month
-            end_month = start_month + 2
-            if end_month == 12:
-                end_date = datetime(target_year, 12, 31).date()
-            elif end_month in [3, 6, 9]:  # March, June, September
-                if end_month == 3:  # March - check for leap year
-                    if target_year % 4 == 0 and (target_year % 100 != 0 or target_year % 400 == 0):
-                        end_date = datetime(target_year, 3, 31).date()
-                    else:
-                        end_date = datetime(target_year, 3, 31).date()
-                elif end_month == 6:  # June
-                    end_date = datetime(target_year, 6, 30).date()
-                else:  # September
-                    end_date = datetime(target_year, 9, 30).date()
-            else:
-                # For other months, use calendar to get last day
-                import calendar
-                last_day = calendar.monthrange(target_year, end_month)[1]
-                end_date = datetime(target_year, end_month, last_day).date()
-            
-            label = f"Q{target_quarter} {target_year}"
-        elif period == 'year':
-            year = base_date.year - i
-            start_date = datetime(year, 1, 1).date()
-            end_date = datetime(year, 12, 31).date()
-            label = str(year)
-        
-        # Get shifts for this period
-        query = Shift.query.filter(
-            Shift.calendar_id.in_(calendar_ids),
-            Shift.date >= start_date,
-            Shift.date <= end_date
-        )
-        
-        # Debug logging
-        print(f"Period {period}, i={i}, Label: {label}, Start: {start_date}, End: {end_date}")
-        shift_count = query.count()
-        print(f"Found {shift_count} shifts for period {label}")
-        
-        # If user is only a participant (not creator of any selected calendars), show only their shifts
-        if user_id and user_calendar_roles:
-            is_creator_of_any = any(role == 'creator' for role in user_calendar_roles.values())
-            if not is_creator_of_any:
-                query = query.filter(Shift.user_id == user_id)
-        
-        if filters:
-            query = apply_filters(query, filters)
-        
-        shifts = query.all()
-        
-        # Calculate metrics
-        total_hours = 0
-        shifts_with_time = 0
-        unique_users = set()
-        
-        for shift in shifts:
-            # Only calculate duration for shifts that show time
-            if shift.show_time:
-                # Calculate duration
-                start_time = datetime.combine(shift.date, shift.start_time)
-                end_time = datetime.combine(shift.date, shift.end_time)
-                
-                if end_time < start_time:
-                    end_time += timedelta(days=1)
-                
-                duration = (end_time - start_time).total_seconds() / 3600
-                total_hours += duration
-                shifts_with_time += 1
-            
-            unique_users.add(shift.user_id)
-        
-        trends_data['hours']['labels'].append(label)
-        trends_data['hours']['values'].append(round(total_hours, 1))
-        
-        trends_data['shifts']['labels'].append(label)
-        trends_data['shifts']['values'].append(shifts_with_time)
-        
-        trends_data['people']['labels'].append(label)
-        trends_data['people']['values'].append(len(unique_users))
-    
-    return trends_data
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""Генерация графиков по ротации (2/2, 5/2, день/ночь/отсыпной/выходной).
+
+Чистые функции без обращения к базе: маршрут загружает шаблоны и занятые
+дни, а здесь только раскладывается шаблон ротации по датам.
+"""
+from datetime import timedelta
+
+
+def rotation_assignments(pattern, member_offsets, start_date, end_date):
+    """Назначения ротации: список (user_id, date, template_id) для рабочих дней.
+
+    pattern — последовательность id шаблонов смен, None означает выходной.
+    member_offsets — пары (user_id, offset): участник с offset=k в первый
+    день диапазона находится на k-м шаге ротации.
+    """
+    length = len(pattern)
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+    # Для каждой фазы ротации заранее считаем рабочие дни — дальше только сдвиг
+    phase_days = {}
+    assignments = []
+    for user_id, offset in member_offsets:
+        phase = offset % length
+        if phase not in phase_days:
+            phase_days[phase] = [
+                (day, pattern[(index + phase) % length])
+                for index, day in enumerate(days)
+                if pattern[(index + phase) % length] is not None
+            ]
+        assignments.extend((user_id, day, template_id) for day, template_id in phase_days[phase])
+    return assignments
+
+
+def build_shift_rows(calendar_id, assignments, templates, occupied=()):
+    """Строки для массовой вставки Shift из назначений ротации.
+
+    templates — {template_id: ShiftTemplate}; смена берёт title, время,
+    show_time и color_class шаблона, как add_shift_from_template.
+    Назначения на занятые дни (user_id, date) из occupied пропускаются.
+    Возвращает (rows, skipped).
+    """
+    template_values = {
+        template_id: {
+            'title': template.title,
+            'start_time': template.start_time,
+            'end_time': template.end_time,
+            'template_id': template_id,
+            'show_time': template.show_time,
+            'color_class': template.color_class,
+        }
+        for template_id, template in templates.items()
+    }
+    rows = []
+    skipped = 0
+    for user_id, day, template_id in assignments:
+        if (user_id, day) in occupied:
+            skipped += 1
+            continue
+        row = dict(template_values[template_id])
+        row['calendar_id'] = calendar_id
+        row['user_id'] = user_id
+        row['date'] = day
+        rows.append(row)
+    return rows, skipped
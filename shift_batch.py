@@ -0,0 +1,210 @@
+"""Пакетные изменения смен: создание, перенос и удаление в одной транзакции.
+
+Все проверки идут по множествам, загруженным один раз на пакет (участники,
+шаблоны, затронутые смены, занятые дни), а запись — тремя массовыми
+операциями: DELETE, executemany UPDATE и INSERT ... RETURNING.
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, Shift, ShiftTemplate, record_shift_changes, serialize_shift, shift_duration
+from access import calendar_member_ids
+
+BATCH_OPERATIONS = ('create', 'move', 'delete')
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def apply_shift_batch(calendar, operations, current_user_id, atomic=False):
+    """Проверяет и применяет операции пакета, commit делает вызывающий.
+
+    Операции:
+        {'op': 'create', 'user_id', 'date', 'template_id'}
+        {'op': 'move', 'shift_id', 'date', 'user_id' (необязательно)}
+        {'op': 'delete', 'shift_id'}
+
+    Операции проверяются по порядку с учётом предыдущих (перенос в день,
+    освобождённый удалением выше, допустим). Ошибочные операции пропускаются;
+    при atomic=True любая ошибка отменяет весь пакет.
+    Возвращает (results, applied): результат на каждую операцию и флаг записи.
+    """
+    is_owner = calendar.owner_id == current_user_id
+
+    # Разбираем операции и собираем, что нужно загрузить
+    parsed = []
+    template_ids, shift_ids, dates = set(), set(), set()
+    for op in operations:
+        op = op if isinstance(op, dict) else {}
+        item = {
+            'op': op.get('op'),
+            'shift_id': _parse_id(op.get('shift_id')),
+            'user_id': _parse_id(op.get('user_id')),
+            'template_id': _parse_id(op.get('template_id')),
+            'date': _parse_date(op.get('date')),
+        }
+        parsed.append(item)
+        if item['template_id'] is not None:
+            template_ids.add(item['template_id'])
+        if item['shift_id'] is not None:
+            shift_ids.add(item['shift_id'])
+        if item['date'] is not None:
+            dates.add(item['date'])
+
+    # Множества для проверок — по одному запросу на каждое
+    member_ids = calendar_member_ids(calendar.id)
+    templates = {}
+    if template_ids:
+        templates = {t.id: t for t in ShiftTemplate.query.filter(
+            ShiftTemplate.id.in_(template_ids), ShiftTemplate.calendar_id == calendar.id
+        )}
+    shifts = {}
+    if shift_ids:
+        shifts = {s.id: s for s in Shift.query.filter(Shift.id.in_(shift_ids), Shift.calendar_id == calendar.id)}
+        dates.update(s.date for s in shifts.values())
+    occupied = set()
+    if dates:
+        occupied = set(db.session.execute(
+            select(Shift.user_id, Shift.date).where(
+                Shift.calendar_id == calendar.id,
+                Shift.date >= min(dates),
+                Shift.date <= max(dates)
+            )
+        ).tuples())
+
+    # Текущее положение смен с учётом уже проверенных операций пакета
+    positions = {s.id: (s.user_id, s.date) for s in shifts.values()}
+    results = []
+    creates, moves, deleted_ids = [], [], []
+
+    for index, item in enumerate(parsed):
+        result = {'index': index, 'op': item['op'], 'success': False}
+        results.append(result)
+        op = item['op']
+
+        if op not in BATCH_OPERATIONS:
+            result['error'] = 'Неизвестная операция'
+            continue
+
+        if op == 'create':
+            template = templates.get(item['template_id'])
+            user_id = item['user_id']
+            if item['date'] is None or user_id is None:
+                result['error'] = 'Не указаны пользователь или дата'
+            elif template is None:
+                result['error'] = 'Шаблон не найден'
+            elif user_id != current_user_id and user_id not in member_ids:
+                result['error'] = 'Неверный пользователь'
+            elif (user_id, item['date']) in occupied:
+                result['error'] = 'У пользователя уже есть смена в этот день'
+            else:
+                occupied.add((user_id, item['date']))
+                # Core INSERT не вызывает set_shift_duration — длительность считаем сами
+                duration_minutes, crosses_midnight = shift_duration(template.start_time, template.end_time)
+                creates.append((result, {
+                    'title': template.title,
+                    'start_time': template.start_time,
+                    'end_time': template.end_time,
+                    'date': item['date'],
+                    'calendar_id': calendar.id,
+                    'user_id': user_id,
+                    'template_id': template.id,
+                    'show_time': template.show_time,
+                    'color_class': template.color_class,
+                    'duration_minutes': duration_minutes,
+                    'crosses_midnight': crosses_midnight
+                }))
+                result['success'] = True
+            continue
+
+        # Перенос и удаление — как delete_shift, только владельцу календаря
+        if not is_owner:
+            result['error'] = 'Доступ запрещён'
+            continue
+        shift_id = item['shift_id']
+        if shift_id not in positions:
+            result['error'] = 'Смена не найдена'
+            continue
+        old_key = positions[shift_id]
+
+        if op == 'delete':
+            occupied.discard(old_key)
+            del positions[shift_id]
+            deleted_ids.append(shift_id)
+            result['shift_id'] = shift_id
+            result['success'] = True
+            continue
+
+        # move
+        user_id = item['user_id'] if item['user_id'] is not None else old_key[0]
+        new_key = (user_id, item['date'])
+        if item['date'] is None:
+            result['error'] = 'Не указана дата'
+        elif user_id != calendar.owner_id and user_id not in member_ids:
+            result['error'] = 'Неверный пользователь'
+        elif new_key != old_key and new_key in occupied:
+            result['error'] = 'У пользователя уже есть смена в этот день'
+        else:
+            occupied.discard(old_key)
+            occupied.add(new_key)
+            positions[shift_id] = new_key
+            moves.append((result, shift_id, new_key))
+            result['success'] = True
+
+    failed = any(not r['success'] for r in results)
+    if atomic and failed:
+        for result in results:
+            if result['success']:
+                result['success'] = False
+                result['error'] = 'Пакет отменён из-за ошибок в других операциях'
+        return results, False
+
+    # Удаления первыми — они только освобождают дни
+    if deleted_ids:
+        Shift.query.filter(Shift.id.in_(deleted_ids)).delete(synchronize_session=False)
+        for shift_id in deleted_ids:
+            db.session.expunge(shifts[shift_id])
+
+    # Переносы строго в порядке операций: каждый шаг не нарушает уникальность дня
+    deleted_set = set(deleted_ids)
+    moves = [m for m in moves if m[1] not in deleted_set]
+    if moves:
+        shift_table = Shift.__table__
+        db.session.execute(
+            update(shift_table)
+            .where(shift_table.c.id == bindparam('b_id'))
+            .values(user_id=bindparam('b_user_id'), date=bindparam('b_date')),
+            [{'b_id': shift_id, 'b_user_id': key[0], 'b_date': key[1]} for _, shift_id, key in moves]
+        )
+        for result, shift_id, (user_id, shift_date) in moves:
+            shift = shifts[shift_id]
+            set_committed_value(shift, 'user_id', user_id)
+            set_committed_value(shift, 'date', shift_date)
+            result['shift'] = serialize_shift(shift)
+
+    created = []
+    if creates:
+        # Один многострочный INSERT; порядок RETURNING в SQLite не гарантирован,
+        # поэтому результаты сопоставляем по (user_id, date) — он уникален в пакете
+        created = db.session.scalars(insert(Shift).returning(Shift), [row for _, row in creates]).all()
+        created_by_key = {(shift.user_id, shift.date): shift for shift in created}
+        for result, row in creates:
+            result['shift'] = serialize_shift(created_by_key[(row['user_id'], row['date'])])
+
+    upserted = [shift.id for shift in created] + [shift_id for _, shift_id, _ in moves]
+    if upserted or deleted_ids:
+        record_shift_changes(calendar.id, upserted=upserted, deleted=deleted_ids)
+    return results, bool(upserted or deleted_ids)
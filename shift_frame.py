@@ -0,0 +1,203 @@
+"""Колоночное представление строк смен для аналитики.
+
+ShiftFrame хранит результат shift_rows_statement по колонкам: порядковые
+номера дат, минуты начала, длительности, id пользователей, признак
+show_time и коды категорий (название смены, цвет, шаблон). Агрегаты
+разделов считаются свёртками по колонкам — суммы по дню недели,
+пользователю, дате, шаблону — вместо разбора каждой строки.
+
+С NumPy колонки — массивы, свёртки векторные (np.unique + np.add.at,
+searchsorted). Без NumPy те же функции работают со списками и дают
+те же результаты; значения наружу всегда отдаются обычными int.
+"""
+from bisect import bisect_left, bisect_right
+from itertools import compress
+
+try:
+    import numpy as np
+except ImportError:  # NumPy необязателен: есть чистый Python
+    np = None
+
+NO_USER = -1       # user_id смены без пользователя
+NO_CATEGORY = -1   # код отсутствующей категории (смена без шаблона)
+MINUTES_PER_DAY = 24 * 60
+
+def _array(values, dtype):
+    return np.asarray(values, dtype=dtype) if np is not None else list(values)
+
+
+def group_sum(keys, values=None):
+    """{ключ: сумма values (или число строк)} в порядке первого появления ключа."""
+    if np is not None:
+        keys = np.asarray(keys)
+        if not len(keys):
+            return {}
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        sums = np.zeros(len(unique), dtype=np.int64)
+        np.add.at(sums, inverse.reshape(-1), 1 if values is None else np.asarray(values, dtype=np.int64))
+        order = np.argsort(first, kind='stable')
+        return dict(zip(unique[order].tolist(), sums[order].tolist()))
+
+    result = {}
+    if values is None:
+        for key in keys:
+            result[key] = result.get(key, 0) + 1
+    else:
+        for key, value in zip(keys, values):
+            result[key] = result.get(key, 0) + value
+    return result
+
+
+def distinct_count(keys, items):
+    """{ключ: число разных items} — например, людей по дате."""
+    if np is not None:
+        keys = np.asarray(keys, dtype=np.int64)
+        if not len(keys):
+            return {}
+        pairs = np.unique(np.stack([keys, np.asarray(items, dtype=np.int64)], axis=1), axis=0)
+        return group_sum(pairs[:, 0])
+    result = {}
+    for key, _ in dict.fromkeys(zip(keys, items)):
+        result[key] = result.get(key, 0) + 1
+    return result
+
+
+def period_index(ordinals, starts, ends):
+    """Номер периода [starts[i], ends[i]] для каждой даты; −1 — вне периодов.
+
+    starts и ends — порядковые номера дат, периоды возрастают и не пересекаются.
+    """
+    if np is not None:
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if not len(starts):
+            return np.full(len(ordinals), -1, dtype=np.int64)
+        index = np.searchsorted(np.asarray(starts, dtype=np.int64), ordinals, side='right') - 1
+        ends = np.asarray(ends, dtype=np.int64)
+        inside = (index >= 0) & (ordinals <= ends[np.maximum(index, 0)])
+        return np.where(inside, index, -1)
+    result = []
+    for ordinal in ordinals:
+        index = bisect_right(starts, ordinal) - 1
+        result.append(index if index >= 0 and ordinal <= ends[index] else -1)
+    return result
+
+
+class ShiftFrame:
+    """Строки смен по колонкам; категории — коды в списках titles/colors/templates."""
+
+    def __init__(self, columns, titles, colors, templates, start_times, end_times):
+        self.columns = columns
+        self.titles = titles
+        self.colors = colors
+        self.templates = templates
+        # Время начала и конца нужно только для подписей слотов — обычные списки
+        self.start_times = start_times
+        self.end_times = end_times
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns')
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.columns['ids'])
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Из кортежей shift_rows_statement (отсортированы по дате)."""
+        (ids, user_ids, days, start_times, end_times, show_time,
+         titles, colors, minutes, templates) = map(list, zip(*rows)) if rows else ([],) * 10
+
+        def encode(values, keep_none=False):
+            categories = {}
+            codes = [
+                NO_CATEGORY if value is None and not keep_none else categories.setdefault(value, len(categories))
+                for value in values
+            ]
+            return codes, list(categories)
+
+        title_codes, title_values = encode(titles, keep_none=True)
+        color_codes, color_values = encode(colors, keep_none=True)
+        template_codes, template_values = encode(templates)
+        columns = {
+            'ids': _array(ids, 'int64'),
+            'user_ids': _array([NO_USER if user_id is None else user_id for user_id in user_ids], 'int64'),
+            'ordinals': _array([day.toordinal() for day in days], 'int64'),
+            'start_minutes': _array([t.hour * 60 + t.minute if t else 0 for t in start_times], 'int64'),
+            'durations': _array([value or 0 for value in minutes], 'int64'),
+            'show_time': _array([bool(value) for value in show_time], bool),
+            'title_codes': _array(title_codes, 'int64'),
+            'color_codes': _array(color_codes, 'int64'),
+            'template_codes': _array(template_codes, 'int64'),
+        }
+        return cls(columns, title_values, color_values, template_values, start_times, end_times)
+
+    def _take(self, selector):
+        """Подмножество строк: срез или булева маска."""
+        if isinstance(selector, slice):
+            columns = {name: column[selector] for name, column in self.columns.items()}
+            start_times, end_times = self.start_times[selector], self.end_times[selector]
+        elif np is not None:
+            mask = np.asarray(selector, dtype=bool)
+            columns = {name: column[mask] for name, column in self.columns.items()}
+            start_times = list(compress(self.start_times, mask.tolist()))
+            end_times = list(compress(self.end_times, mask.tolist()))
+        else:
+            mask = list(selector)
+            columns = {name: list(compress(column, mask)) for name, column in self.columns.items()}
+            start_times = list(compress(self.start_times, mask))
+            end_times = list(compress(self.end_times, mask))
+        return ShiftFrame(columns, self.titles, self.colors, self.templates, start_times, end_times)
+
+    def between(self, start_date, end_date):
+        """Смены с датой в [start_date, end_date]: строки отсортированы по дате — это срез."""
+        ordinals = self.ordinals
+        low, high = start_date.toordinal(), end_date.toordinal()
+        if np is not None:
+            begin = int(np.searchsorted(ordinals, low, side='left'))
+            end = int(np.searchsorted(ordinals, high, side='right'))
+        else:
+            begin, end = bisect_left(ordinals, low), bisect_right(ordinals, high)
+        return self._take(slice(begin, end))
+
+    def timed(self):
+        """Смены со временем (show_time)."""
+        return self._take(self.show_time)
+
+    def with_user(self):
+        """Смены с назначенным пользователем."""
+        if np is not None:
+            return self._take(self.user_ids != NO_USER)
+        return self._take([user_id != NO_USER for user_id in self.user_ids])
+
+    def ending_after(self, start_date):
+        """Смены, которые заканчиваются позже начала start_date — в том числе ночные смены накануне."""
+        offsets = self.day_offsets(start_date)
+        if np is not None:
+            return self._take(offsets * MINUTES_PER_DAY + self.start_minutes + self.durations > 0)
+        return self._take([
+            offset * MINUTES_PER_DAY + start_minute + duration > 0
+            for offset, start_minute, duration in zip(offsets, self.start_minutes, self.durations)
+        ])
+
+    def total(self, name):
+        column = self.columns[name]
+        return int(column.sum()) if np is not None else sum(column)
+
+    def weekdays(self):
+        """День недели каждой смены (0 — понедельник): ordinal 1 — понедельник 0001-01-01."""
+        if np is not None:
+            return (self.ordinals - 1) % 7
+        return [(ordinal - 1) % 7 for ordinal in self.ordinals]
+
+    def day_offsets(self, start_date):
+        """Номер дня смены от start_date."""
+        start = start_date.toordinal()
+        if np is not None:
+            return self.ordinals - start
+        return [ordinal - start for ordinal in self.ordinals]
+
+    def tolist(self, name):
+        column = self.columns[name]
+        return column.tolist() if np is not None else list(column)
@@ -86,6 +86,14 @@ class AnalysisPage {
     }
 
     bindEvents() {
+        // Выгрузка: CSV — выбранный раздел, XLSX — все разделы
+        document.getElementById('exportCsvBtn')?.addEventListener('click', () => {
+            this.exportAnalysis('csv', document.getElementById('exportSection').value);
+        });
+        document.getElementById('exportXlsxBtn')?.addEventListener('click', () => {
+            this.exportAnalysis('xlsx');
+        });
+
         // Period selector changes
         document.getElementById('periodSelect').addEventListener('change', (e) => {
             this.currentPeriod = e.target.value;
@@ -591,6 +599,7 @@ class AnalysisPage {
         this.updateTimeSlots(data.time_slots, data.comparison?.time_slots);
         this.updateWeekdayActivity(data.weekday_activity, data.comparison?.weekday_activity);
         this.updateWorkTimeDistribution(data.work_time_distribution, data.comparison?.work_time_distribution);
+        this.updateDutyHeatmap(data.coverage_heatmap);
         this.lastTrendsData = data.trends_data;
         this.updateCharts(data, data.comparison);
     }
@@ -729,7 +738,7 @@ class AnalysisPage {
                     const dayElement = document.createElement('div');
                     dayElement.className = `coverage-day ${this.getCoverageClass(day.coverage_percent)}`;
                     dayElement.textContent = day.day;
-                    dayElement.title = `${day.full_date}: ${day.coverage_percent}% покрытие, ${day.shifts_count} смен`;
+                    dayElement.title = this.getCoverageTitle(day);
                     monthGrid.appendChild(dayElement);
                 });
                 
@@ -784,12 +793,18 @@ class AnalysisPage {
                 const dayElement = document.createElement('div');
                 dayElement.className = `coverage-day ${this.getCoverageClass(day.coverage_percent)}`;
                 dayElement.textContent = day.day;
-                dayElement.title = `${day.full_date}: ${day.coverage_percent}% покрытие, ${day.shifts_count} смен`;
+                dayElement.title = this.getCoverageTitle(day);
                 container.appendChild(dayElement);
             });
         }
     }
 
+    getCoverageTitle(day) {
+        const title = `${day.full_date}: ${day.coverage_percent}% покрытие, ${day.shifts_count} смен`;
+        // При заданной норме численности показываем людей на смене против нормы
+        return day.required ? `${title}, ${day.headcount} из ${day.required} чел.` : title;
+    }
+
     getCoverageClass(percent) {
         if (percent >= 80) return 'excellent';
         if (percent >= 60) return 'good';
@@ -798,6 +813,44 @@ class AnalysisPage {
         return 'empty';
     }
 
+    updateDutyHeatmap(heatmap) {
+        const container = document.getElementById('dutyHeatmap');
+        if (!container) return;
+        container.innerHTML = '';
+        if (!heatmap || !heatmap.labels.length) return;
+
+        // Среднее число людей на смене по дням недели; насыщенность — от максимума
+        const average = heatmap.weekday.average;
+        const maxValue = Math.max(0, ...average.flat());
+        const slotsPerHour = Math.max(1, 60 / heatmap.slot_minutes);
+        container.style.gridTemplateColumns = `auto repeat(${heatmap.labels.length}, minmax(6px, 1fr))`;
+
+        container.appendChild(document.createElement('div'));
+        heatmap.labels.forEach((label, index) => {
+            const header = document.createElement('div');
+            header.className = 'duty-heatmap-hour';
+            header.textContent = index % (slotsPerHour * 3) === 0 ? label.slice(0, 2) : '';
+            container.appendChild(header);
+        });
+
+        heatmap.weekday.labels.forEach((weekday, row) => {
+            const label = document.createElement('div');
+            label.className = 'duty-heatmap-weekday';
+            label.textContent = weekday;
+            container.appendChild(label);
+
+            average[row].forEach((value, index) => {
+                const cell = document.createElement('div');
+                cell.className = 'duty-heatmap-cell';
+                if (value > 0 && maxValue > 0) {
+                    cell.style.background = `rgba(37, 99, 235, ${0.15 + 0.85 * value / maxValue})`;
+                }
+                cell.title = `${weekday} ${heatmap.labels[index]}: в среднем ${value} чел., максимум ${heatmap.weekday.peak[row][index]}`;
+                container.appendChild(cell);
+            });
+        });
+    }
+
     updateTimeSlots(timeSlots) {
         const templatesContainer = document.getElementById('shiftTemplates');
         
@@ -1986,6 +2039,45 @@ class AnalysisPage {
         console.log('Work time chart created successfully');
     }
 
+    async exportAnalysis(format, section) {
+        if (!this.selectedCalendars.length) {
+            this.showError('Выберите хотя бы один календарь');
+            return;
+        }
+        try {
+            const response = await fetch('/api/analysis-export', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    period: this.currentPeriod,
+                    month: this.currentMonth,
+                    calendar_ids: this.selectedCalendars,
+                    filters: this.filters,
+                    format,
+                    section
+                })
+            });
+            if (!response.ok) {
+                const error = await response.json().catch(() => ({}));
+                this.showError(error.error || 'Ошибка выгрузки');
+                return;
+            }
+            const disposition = response.headers.get('Content-Disposition') || '';
+            const match = disposition.match(/filename="?([^";]+)"?/);
+            const url = URL.createObjectURL(await response.blob());
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = match ? match[1] : `analysis.${format}`;
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+            URL.revokeObjectURL(url);
+        } catch (error) {
+            console.error('Error exporting analysis:', error);
+            this.showError('Ошибка выгрузки');
+        }
+    }
+
     showError(message) {
         // Use the standard toast system from base.js
         console.error(message);
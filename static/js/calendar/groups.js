@@ -31,6 +31,19 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeGroups();
 });
 
+// Живые обновления (view.js): участники, группы и порядок изменились в другой вкладке.
+// События приходят пачками — перестраиваем таблицу один раз после затишья.
+let structureRefreshTimer = null;
+document.addEventListener('calendar:structure-changed', function() {
+    clearTimeout(structureRefreshTimer);
+    structureRefreshTimer = setTimeout(async () => {
+        await updateCalendarAfterGroupChange();
+        if (typeof updateAllUserSummaries === 'function') {
+            updateAllUserSummaries();
+        }
+    }, 300);
+});
+
 function initializeGroups() {
     console.log('Initializing groups...'); // Для отладки
     
@@ -1246,14 +1259,16 @@ async function handleGroupDrop(evt) {
 
         console.log('Final group order:', order);
 
-        // Сохраняем порядок на сервере
-        console.log('Sending request to:', `/api/update_group_positions/${currentCalendarId}`);
-        console.log('Request body:', { order });
+        // Сохраняем на сервере только перенос этой группы относительно соседа
+        const index = order.indexOf(parseInt(groupId));
+        const target = index > 0 ? { after_id: order[index - 1] } : { before_id: order[index + 1] ?? null };
+        console.log('Sending request to:', `/api/calendar/${currentCalendarId}/groups/${groupId}/move`);
+        console.log('Request body:', target);
         
-        const resp = await fetch(`/api/update_group_positions/${currentCalendarId}`, {
+        const resp = await fetch(`/api/calendar/${currentCalendarId}/groups/${groupId}/move`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ order })
+            body: JSON.stringify(target)
         });
         
         console.log('Response status:', resp.status);
@@ -1297,24 +1312,26 @@ async function handleGroupDrop(evt) {
 // Обработка завершения перетаскивания участника
 async function handleUserDrop(evt) {
     try {
-        const rows = document.querySelectorAll('.user-row:not(.owner)');
+        const rows = Array.from(document.querySelectorAll('.user-row:not(.owner)'));
         if (rows.length === 0) return;
 
-        const positions = {};
         const calendarId = document.body.dataset.calendarId || currentCalendarId;
 
-        rows.forEach((row, index) => {
-            const userId = row.dataset.userId;
-            if (userId) positions[userId] = index + 1;
-        });
+        // Сервер переставляет одного участника относительно соседа по таблице
+        const movedRow = evt.item.closest ? evt.item.closest('.user-row') : evt.item;
+        const index = rows.indexOf(movedRow);
+        if (index === -1 || !movedRow.dataset.userId) return;
+        const target = index > 0
+            ? { after_id: parseInt(rows[index - 1].dataset.userId) }
+            : { before_id: rows[index + 1] ? parseInt(rows[index + 1].dataset.userId) : null };
 
-        const response = await fetch(`/calendar/${calendarId}/update-positions`, {
+        const response = await fetch(`/calendar/${calendarId}/members/${movedRow.dataset.userId}/move`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'X-Requested-With': 'XMLHttpRequest'
             },
-            body: JSON.stringify({ positions: positions })
+            body: JSON.stringify(target)
         });
 
         if (!response.ok) {
@@ -1341,63 +1358,44 @@ async function handleUserDrop(evt) {
 // Функция для динамического обновления календаря после изменения групп
 async function updateCalendarAfterGroupChange() {
     try {
-        // Получаем обновленные данные о группах
-        const groupsResponse = await fetch(`/api/get_calendar_groups/${currentCalendarId}`, {
-            method: 'GET',
-            credentials: 'same-origin',
-            headers: {
-                'X-Requested-With': 'XMLHttpRequest'
-            }
-        });
-        const groupsData = await groupsResponse.json();
-        
-        if (groupsData.success) {
-            // Получаем список всех участников календаря
-            const membersResponse = await fetch(`/calendar/${currentCalendarId}/members`, {
-                method: 'GET',
-                credentials: 'same-origin',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
-            });
-            const members = await membersResponse.json();
-            console.log('=== DIAG: updateCalendarAfterGroupChange ===');
-            console.log('Groups (raw from API):', groupsData.groups.map(g => ({ id: g.id, name: g.name, pos: g.position, members: g.members.map(m=>m.id) })));
-            console.log('Members (raw from API):', members.map(m => ({ id: m.id, username: m.username })));
-            
-            // Обновляем календарь динамически
-            await rebuildCalendarTableFromData(groupsData.groups, members);
-            
-            // Обновляем модальное окно добавления участника
-            await updateAddMembersModal();
+        // Группы, участники и смены месяца — одним запросом
+        const data = await loadCalendarBootstrap(getDisplayedMonth());
+        console.log('=== DIAG: updateCalendarAfterGroupChange ===');
+        console.log('Groups (raw from API):', data.groups.map(g => ({ id: g.id, name: g.name, pos: g.position, members: g.member_ids })));
+        console.log('Members (raw from API):', data.members.map(m => ({ id: m.id, username: m.username })));
 
-            // Единоразово обновляем сайдбар групп после полной синхронизации
-            await updateGroupsSidebar();
-        }
+        // Обновляем календарь динамически
+        await rebuildCalendarTableFromData(data.groups, data.members, data.shifts);
+
+        // Обновляем модальное окно добавления участника
+        await updateAddMembersModal(data);
+
+        // Единоразово обновляем сайдбар групп после полной синхронизации
+        await updateGroupsSidebar(data);
     } catch (error) {
         console.error('Ошибка обновления календаря:', error);
     }
 }
 
+// Текущий месяц таблицы из URL, body dataset или сегодняшняя дата
+function getDisplayedMonth() {
+    const urlParams = new URLSearchParams(window.location.search);
+    const month = urlParams.get('month');
+    if (month) return month;
+    const bodyMonth = document.body.dataset.currentMonth;
+    if (bodyMonth) {
+        return new Date(bodyMonth).toISOString().split('T')[0];
+    }
+    return new Date().toISOString().split('T')[0];
+}
+
 // Функция для динамического обновления таблицы календаря (локальная, чтобы не пересекаться с view.js)
-async function rebuildCalendarTableFromData(groups, members) {
+async function rebuildCalendarTableFromData(groups, members, shifts = null) {
     try {
-        // Получаем текущий месяц из URL или используем текущий
-        const urlParams = new URLSearchParams(window.location.search);
-        let currentMonth = urlParams.get('month');
-        if (!currentMonth) {
-            // Если месяц не указан в URL, берем из body dataset или текущий
-            const bodyMonth = document.body.dataset.currentMonth;
-            if (bodyMonth) {
-                currentMonth = new Date(bodyMonth).toISOString().split('T')[0];
-            } else {
-                currentMonth = new Date().toISOString().split('T')[0];
-            }
+        // Смены месяца обычно приходят вместе с группами из bootstrap
+        if (!shifts) {
+            shifts = (await loadCalendarBootstrap(getDisplayedMonth())).shifts;
         }
-        
-        // Получаем смены для отображения с параметром месяца
-        const shiftsResponse = await fetch(`/calendar/${currentCalendarId}/shifts?month=${currentMonth}`);
-        const shifts = await shiftsResponse.json();
         console.log('=== DIAG: updateCalendarTable input ===');
         console.log('Groups count:', groups.length);
         console.log('Groups summary:', groups.map(g => ({ id: g.id, name: g.name, pos: g.position, membersCount: g.members.length })));
@@ -1895,21 +1893,19 @@ document.addEventListener('click', function(e) {
 });
 
 // Функция для обновления модального окна добавления участника
-async function updateAddMembersModal() {
+async function updateAddMembersModal(data = null) {
     try {
-        // Получаем обновленный список участников календаря
-        const membersResponse = await fetch(`/calendar/${currentCalendarId}/members`);
-        const members = await membersResponse.json();
-        
-        // Получаем обновленный список групп
-        const groupsResponse = await fetch(`/api/get_calendar_groups/${currentCalendarId}`);
-        const groupsData = await groupsResponse.json();
+        // Участники и группы — из уже загруженного bootstrap или одним новым запросом
+        if (!data) {
+            data = await loadCalendarBootstrap(getDisplayedMonth());
+        }
+        const members = data.members;
         
         if (members && members.length > 0) {
             // Собираем ID всех пользователей, которые уже состоят в группах
             const usersInGroups = new Set();
-            if (groupsData.success && groupsData.groups) {
-                groupsData.groups.forEach(group => {
+            if (data.groups) {
+                data.groups.forEach(group => {
                     group.members.forEach(member => {
                         usersInGroups.add(member.id);
                     });
@@ -1960,10 +1956,11 @@ async function updateAddMembersModal() {
 }
 
 // Функция для обновления списка групп в сайдбаре
-async function updateGroupsSidebar() {
+async function updateGroupsSidebar(groupsData = null) {
     try {
-        const groupsResponse = await fetch(`/api/get_calendar_groups/${currentCalendarId}`);
-        const groupsData = await groupsResponse.json();
+        if (!groupsData) {
+            groupsData = await loadCalendarBootstrap(getDisplayedMonth());
+        }
         
         if (groupsData.success) {
             const groupList = document.getElementById('groupList');
@@ -1,6 +1,41 @@
 // Глобальная переменная для ID календаря
 let currentCalendarId = null;
 
+// Данные страницы календаря одним запросом: участники, группы, шаблоны,
+// доступные друзья и смены месяца. Одновременные вызовы получают один запрос.
+const calendarBootstrapRequests = new Map();
+
+function loadCalendarBootstrap(month = null) {
+    const calendarId = currentCalendarId || document.body.dataset.calendarId;
+    const key = month || '';
+    if (!calendarBootstrapRequests.has(key)) {
+        const query = month ? `?month=${encodeURIComponent(month)}` : '';
+        const request = fetch(`/api/calendar/${calendarId}/bootstrap${query}`, {
+            method: 'GET',
+            credentials: 'same-origin',
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest'
+            }
+        })
+            .then(async response => {
+                const data = await response.json();
+                if (!response.ok || !data.success) {
+                    throw new Error(data.error || 'Ошибка загрузки данных календаря');
+                }
+                // Группы приходят со списком member_ids — подставляем участников,
+                // чтобы код, работающий с group.members, не менялся
+                const membersById = new Map(data.members.map(member => [member.id, member]));
+                data.groups.forEach(group => {
+                    group.members = group.member_ids.map(id => membersById.get(id)).filter(Boolean);
+                });
+                return data;
+            })
+            .finally(() => calendarBootstrapRequests.delete(key));
+        calendarBootstrapRequests.set(key, request);
+    }
+    return calendarBootstrapRequests.get(key);
+}
+
 document.addEventListener('DOMContentLoaded', () => {
 
     // Получаем ID календаря из URL
@@ -211,6 +246,126 @@ function getUserDisplayName(user, includeYouLabel = false) {
         });
     };
 
+    const weekdayShortNames = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'];
+
+    // Бейдж смены (формат get_calendar_shifts / событий SSE)
+    const buildShiftBadge = (shift) => {
+        // createShiftBadge объявлена в groups.js
+        if (typeof createShiftBadge === 'function') {
+            return createShiftBadge(shift);
+        }
+        const badge = document.createElement('div');
+        badge.className = `shift-badge ${shift.color_class}`;
+        if (!shift.show_time) badge.classList.add('no-time');
+        badge.dataset.shiftId = shift.id;
+        badge.dataset.fullTitle = shift.title + (shift.show_time ? ` (${shift.start_time}-${shift.end_time})` : '');
+        badge.textContent = shift.title.length > 8 ? `${shift.title.substring(0, 8)}...` : shift.title;
+        if (shift.show_time) {
+            badge.appendChild(document.createElement('br'));
+            badge.appendChild(document.createTextNode(`${shift.start_time} - ${shift.end_time}`));
+        }
+        if (isOwner) {
+            badge.insertAdjacentHTML('beforeend', `<button class="remove-shift-btn" data-shift-id="${shift.id}">&times;</button>`);
+        }
+        return badge;
+    };
+
+    // Бейдж смены из компактной сетки месяца
+    const buildGridShiftBadge = (shiftId, type) => buildShiftBadge({
+        id: shiftId,
+        title: type.title,
+        start_time: type.start_time,
+        end_time: type.end_time,
+        show_time: type.show_time,
+        color_class: type.color_class || 'badge-color-1'
+    });
+
+    // Перерисовка шапки и ячеек таблицы по JSON-сетке месяца (строки участников сохраняются)
+    const applyMonthGrid = (grid) => {
+        const table = document.querySelector('.calendar-table');
+        const headerRow = table?.querySelector('thead tr');
+        const tbody = table?.querySelector('tbody');
+        if (!headerRow || !tbody) return false;
+
+        // Если состав участников изменился — строки нужно перестроить целиком
+        const rowIds = Array.from(tbody.querySelectorAll('tr.user-row')).map(row => parseInt(row.dataset.userId, 10));
+        const sameMembers = rowIds.length === grid.members.length &&
+            grid.members.every(id => rowIds.includes(id));
+
+        Array.from(headerRow.children).slice(1).forEach(th => th.remove());
+        grid.days.forEach(day => {
+            const date = new Date(`${day}T00:00:00`);
+            const th = document.createElement('th');
+            th.dataset.date = day;
+            th.innerHTML = `${day.slice(8, 10)}<br>${weekdayShortNames[(date.getDay() + 6) % 7]}`;
+            headerRow.appendChild(th);
+        });
+
+        tbody.querySelectorAll('.group-header-cell').forEach(cell => {
+            cell.colSpan = grid.days.length + 1;
+        });
+
+        if (!sameMembers) return false;
+
+        tbody.querySelectorAll('tr.user-row').forEach(row => {
+            const userId = row.dataset.userId;
+            const userCells = grid.cells[userId] || {};
+            row.querySelectorAll('td.day-cell').forEach(cell => cell.remove());
+
+            const fragment = document.createDocumentFragment();
+            grid.days.forEach((day, index) => {
+                const cell = document.createElement('td');
+                cell.className = 'day-cell';
+                cell.dataset.date = day;
+                cell.dataset.userId = userId;
+                (userCells[index + 1] || []).forEach(([shiftId, typeIdx]) => {
+                    cell.appendChild(buildGridShiftBadge(shiftId, grid.shift_types[typeIdx]));
+                });
+                fragment.appendChild(cell);
+            });
+            row.appendChild(fragment);
+        });
+        return true;
+    };
+
+    // Загрузка сетки текущего месяца в JSON и обновление таблицы на месте
+    const loadMonthGrid = async () => {
+        const tableContainer = document.querySelector('.calendar-table-container');
+        const calendarId = document.body.dataset.calendarId;
+        const month = currentMonth.toISOString().split('T')[0];
+
+        const response = await fetch(`/calendar/${calendarId}/grid?month=${month}`, {
+            headers: {
+                'X-Requested-With': 'XMLHttpRequest'
+            }
+        });
+
+        if (!response.ok) throw new Error('Ошибка загрузки данных');
+
+        const grid = await response.json();
+        if (tableContainer) tableContainer.classList.add('pending-anim');
+
+        if (applyMonthGrid(grid)) {
+            setupCalendarCellHandlers();
+            setupShiftHandlers();
+        } else if (typeof window.updateCalendarAfterGroupChange === 'function') {
+            // Состав участников изменился — перестраиваем строки через groups.js
+            await window.updateCalendarAfterGroupChange();
+        } else {
+            console.warn('updateCalendarAfterGroupChange is not available; falling back to local handlers');
+            setupCalendarCellHandlers();
+            setupShiftHandlers();
+            setupDraggableRows();
+        }
+        hideOwnerControlsIfNotOwner();
+        // Пересчитываем сводки смен и часов после перерендера таблицы
+        if (typeof updateAllUserSummaries === 'function') {
+            updateAllUserSummaries();
+        }
+        // Запускаем анимацию строк после обновления таблицы
+        window.animateCalendarRows();
+    };
+
     // Обновление отображения месяца
     const updateMonthDisplay = async () => {
         // Скрываем строки немедленно до запроса
@@ -223,45 +378,7 @@ function getUserDisplayName(user, includeYouLabel = false) {
         window.history.pushState({}, '', url);
 
         try {
-            const response = await fetch(url.toString(), {
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
-            });
-
-            if (!response.ok) throw new Error('Ошибка загрузки данных');
-
-            const html = await response.text();
-            const parser = new DOMParser();
-            const doc = parser.parseFromString(html, 'text/html');
-            const newTable = doc.querySelector('.calendar-table');
-
-            if (newTable) {
-                const tableContainer = document.querySelector('.calendar-table-container');
-                tableContainer.classList.add('pending-anim');
-                tableContainer.innerHTML = '';
-                tableContainer.appendChild(newTable);
-
-                // После загрузки новой таблицы нормализуем порядок групп и переинициализируем DnD через groups.js
-                if (typeof window.updateCalendarAfterGroupChange === 'function') {
-                    await window.updateCalendarAfterGroupChange();
-                } else {
-                    console.warn('updateCalendarAfterGroupChange is not available; falling back to local handlers');
-                    setupCalendarCellHandlers();
-                    setupShiftHandlers();
-                    setupDraggableRows();
-                }
-                hideOwnerControlsIfNotOwner();
-                // Пересчитываем сводки смен и часов после перерендера таблицы
-                if (typeof updateAllUserSummaries === 'function') {
-                    updateAllUserSummaries();
-                }
-                // Запускаем анимацию строк после обновления таблицы
-                window.animateCalendarRows();
-            } else {
-                const tableContainer = document.querySelector('.calendar-table-container');
-                if (tableContainer) tableContainer.classList.remove('pending-anim');
-            }
+            await loadMonthGrid();
         } catch (error) {
             console.error('Ошибка при загрузке календаря:', error);
             const tableContainer = document.querySelector('.calendar-table-container');
@@ -275,48 +392,7 @@ function getUserDisplayName(user, includeYouLabel = false) {
         // Скрываем строки немедленно до запроса
         preHideCalendarRows();
         try {
-            const calendarId = document.body.dataset.calendarId;
-            const month = currentMonth.toISOString().split('T')[0];
-
-            const response = await fetch(`/calendar/${calendarId}?month=${month}`, {
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
-            });
-
-            if (!response.ok) throw new Error('Ошибка загрузки данных');
-
-            const html = await response.text();
-            const parser = new DOMParser();
-            const doc = parser.parseFromString(html, 'text/html');
-            const newTable = doc.querySelector('.calendar-table');
-
-            if (newTable) {
-                const tableContainer = document.querySelector('.calendar-table-container');
-                tableContainer.classList.add('pending-anim');
-                tableContainer.innerHTML = '';
-                tableContainer.appendChild(newTable);
-
-                // После обновления таблицы нормализуем порядок групп и инициализируем DnD через groups.js
-                if (typeof window.updateCalendarAfterGroupChange === 'function') {
-                    await window.updateCalendarAfterGroupChange();
-                } else {
-                    console.warn('updateCalendarAfterGroupChange is not available; falling back to local handlers');
-                    setupCalendarCellHandlers();
-                    setupShiftHandlers();
-                    setupDraggableRows();
-                }
-                hideOwnerControlsIfNotOwner();
-                // Пересчитываем сводки смен и часов после перерендера таблицы
-                if (typeof updateAllUserSummaries === 'function') {
-                    updateAllUserSummaries();
-                }
-                // Запускаем анимацию строк после обновления таблицы
-                window.animateCalendarRows();
-            } else {
-                const tableContainer = document.querySelector('.calendar-table-container');
-                if (tableContainer) tableContainer.classList.remove('pending-anim');
-            }
+            await loadMonthGrid();
         } catch (error) {
             console.error('Ошибка при обновлении таблицы:', error);
             const tableContainer = document.querySelector('.calendar-table-container');
@@ -328,64 +404,11 @@ function getUserDisplayName(user, includeYouLabel = false) {
     // Функция для обновления списка доступных друзей
     const updateAvailableFriendsList = async () => {
         try {
-            const calendarId = document.body.dataset.calendarId;
             const currentUserId = parseInt(document.body.dataset.currentUserId);
 
-            // Запрашиваем текущих участников календаря
-            const membersResponse = await fetch(`/calendar/${calendarId}/members`, {
-                method: 'GET',
-                credentials: 'same-origin',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
-            });
-
-            if (!membersResponse.ok) {
-                throw new Error('Ошибка загрузки списка участников');
-            }
-
-            const currentMembers = await membersResponse.json();
-
-            // Запрашиваем список друзей текущего пользователя
-            const friendsResponse = await fetch('/api/get_friends', {
-                method: 'GET',
-                credentials: 'same-origin',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
-            });
-
-            if (!friendsResponse.ok) {
-                throw new Error('Ошибка загрузки списка друзей');
-            }
-
-            const friends = await friendsResponse.json();
-
-            // Запрашиваем список всех групп календаря
-            const groupsResponse = await fetch(`/api/get_calendar_groups/${calendarId}`, {
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest'
-                }
-            });
-
-            let usersInGroups = new Set();
-            if (groupsResponse.ok) {
-                const groupsData = await groupsResponse.json();
-                if (groupsData.success && groupsData.groups) {
-                    groupsData.groups.forEach(group => {
-                        group.members.forEach(member => {
-                            usersInGroups.add(member.id);
-                        });
-                    });
-                }
-            }
-
-            // Фильтруем друзей, исключая тех, кто уже в календаре или в группах
-            const availableFriends = friends.filter(friend =>
-                friend.id !== currentUserId &&
-                !currentMembers.some(member => member.id === friend.id) &&
-                !usersInGroups.has(friend.id)
-            );
+            // Друзья, которых ещё нет в календаре, приходят готовым списком
+            const data = await loadCalendarBootstrap(currentMonth.toISOString().split('T')[0]);
+            const availableFriends = data.available_friends.filter(friend => friend.id !== currentUserId);
 
             const friendsSelectList = document.getElementById('friendsSelectList');
             friendsSelectList.innerHTML = '';
@@ -779,6 +802,15 @@ function getUserDisplayName(user, includeYouLabel = false) {
             updateMonthDisplay();
         });
 
+        // Выгрузка смен показанного месяца в CSV
+        const exportShiftsBtn = document.getElementById('exportShiftsBtn');
+        if (exportShiftsBtn) {
+            exportShiftsBtn.addEventListener('click', () => {
+                const month = currentMonth.toISOString().split('T')[0];
+                window.location.href = `/api/calendar/${currentCalendarId}/export/shifts?format=csv&month=${month}`;
+            });
+        }
+
         // Обработчик для кнопки очистки
         const clearAllShiftsBtn = document.getElementById('clearAllShiftsBtn');
         if (clearAllShiftsBtn) {
@@ -1216,68 +1248,185 @@ function getUserDisplayName(user, includeYouLabel = false) {
         }, 350);
     };
 
-    // Добавление смены из шаблона
-    const addShiftFromTemplate = async (templateId) => {
+    // ====================== ПАКЕТНЫЕ ИЗМЕНЕНИЯ СМЕН ======================
+
+    // Операции копятся и уходят одним запросом /api/shifts/batch после паузы
+    const SHIFT_BATCH_DELAY = 400;
+    let shiftBatchQueue = [];
+    let shiftBatchTimer = null;
+    let pendingShiftSeq = 0;
+
+    const flushShiftBatch = async () => {
+        const batch = shiftBatchQueue;
+        shiftBatchQueue = [];
+        shiftBatchTimer = null;
+        if (batch.length === 0) return;
+
+        let results = [];
         try {
-            const response = await fetch('/api/add_shift_from_template', {
+            const response = await fetch('/api/shifts/batch', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'X-Requested-With': 'XMLHttpRequest'
                 },
                 body: JSON.stringify({
-                    template_id: templateId,
-                    date: selectedDate,
-                    user_id: selectedUserId,
-                    calendar_id: document.body.dataset.calendarId
+                    calendar_id: document.body.dataset.calendarId,
+                    operations: batch.map(item => item.operation)
                 })
             });
-
             const data = await response.json();
+            results = data.results || batch.map(() => ({ success: false, error: data.error || 'Ошибка сервера' }));
+        } catch (error) {
+            handleError(error, 'Ошибка при сохранении смен');
+            results = batch.map(() => ({ success: false }));
+        }
 
-            if (data.success) {
-                const cell = document.querySelector(`.day-cell[data-date="${selectedDate}"][data-user-id="${selectedUserId}"]`);
-                if (cell) {
-                    const shiftBadge = document.createElement('div');
-                    const colorClass = data.shift.color_class || 'badge-color-1';  // Используем цвет из ответа
-                    shiftBadge.className = `shift-badge ${colorClass}`;
-                    shiftBadge.dataset.shiftId = data.shift.id;
-
-                    const showTime = data.shift.show_time;
-                    const title = data.shift.title;
-                    const shortTitle = title.length > 8 ? `${title.substring(0, 8)}...` : title;
-
-                    // Добавляем класс, если время не отображается
-                    if (!showTime) {
-                        shiftBadge.classList.add('no-time');
-                    }
+        const touchedUsers = new Set();
+        batch.forEach((item, index) => {
+            item.onResult(results[index] || { success: false }).forEach(userId => touchedUsers.add(userId));
+        });
+        setupShiftHandlers();
+        touchedUsers.forEach(userId => updateSingleUserSummary(userId));
 
-                    // Кастомный тултип через data-атрибут
-                    const fullTitle = showTime
-                        ? `${title} (${data.shift.start_time}-${data.shift.end_time})`
-                        : title;
-                    shiftBadge.dataset.fullTitle = fullTitle;
+        const errors = results.filter(result => !result.success && result.error);
+        if (errors.length) {
+            showToast(errors.length === 1 ? errors[0].error : `Не сохранено смен: ${errors.length}`, 'warning');
+        }
+    };
 
-                    shiftBadge.innerHTML = shortTitle;
-                    if (showTime) {
-                        shiftBadge.innerHTML += `<br>${data.shift.start_time} - ${data.shift.end_time}`;
-                    }
+    // onResult(result) возвращает id пользователей, чьи сводки нужно пересчитать
+    const queueShiftOperation = (operation, onResult) => {
+        shiftBatchQueue.push({ operation, onResult });
+        clearTimeout(shiftBatchTimer);
+        shiftBatchTimer = setTimeout(flushShiftBatch, SHIFT_BATCH_DELAY);
+    };
 
-                    if (isOwner) {
-                        shiftBadge.innerHTML += `<button class="remove-shift-btn" data-shift-id="${data.shift.id}">&times;</button>`;
-                    }
+    // Данные шаблона из списка шаблонов на странице
+    const getTemplateData = (templateId) => {
+        const item = document.querySelector(`.template-item[data-template-id="${templateId}"]`);
+        if (!item) return null;
+        const timeText = item.querySelector('.template-time')?.textContent.trim() || '';
+        const times = timeText.match(/(\d{2}:\d{2})\s*-\s*(\d{2}:\d{2})/);
+        return {
+            title: item.querySelector('.template-title')?.textContent.trim() || '',
+            show_time: Boolean(times),
+            start_time: times ? times[1] : '',
+            end_time: times ? times[2] : '',
+            color_class: Array.from(item.classList).find(cls => cls.startsWith('badge-color-')) || 'badge-color-1'
+        };
+    };
 
-                    cell.appendChild(shiftBadge);
-                    setupShiftHandlers();
-                    // Обновляем сводку для конкретного пользователя
-                    if (typeof updateSingleUserSummary === 'function') {
-                        updateSingleUserSummary(String(selectedUserId));
-                    }
+    // Создание смены: бейдж-заглушка сразу, настоящий — после ответа пакета
+    const queueShiftCreate = (templateId, userId, date) => {
+        const cell = document.querySelector(`.day-cell[data-date="${date}"][data-user-id="${userId}"]`);
+        const template = getTemplateData(templateId);
+        if (!cell || !template || cell.querySelector('.shift-badge')) return;
+
+        const placeholder = buildShiftBadge({ id: `pending-${++pendingShiftSeq}`, ...template });
+        placeholder.classList.add('pending');
+        placeholder.querySelector('.remove-shift-btn')?.remove();
+        cell.appendChild(placeholder);
+
+        queueShiftOperation(
+            { op: 'create', template_id: parseInt(templateId, 10), user_id: parseInt(userId, 10), date },
+            (result) => {
+                if (result.success && result.shift) {
+                    placeholder.replaceWith(buildShiftBadge(result.shift));
+                } else {
+                    placeholder.remove();
                 }
-                selectTemplateModal.style.display = 'none';
+                return [String(userId)];
             }
-        } catch (error) {
-            handleError(error, 'Ошибка при добавлении смены');
-        }
+        );
+    };
+
+    // Перенос смены: бейдж переезжает сразу и возвращается при ошибке
+    const queueShiftMove = (badge, targetCell) => {
+        const sourceCell = badge.closest('.day-cell');
+        if (!sourceCell || sourceCell === targetCell || targetCell.querySelector('.shift-badge')) return;
+
+        targetCell.appendChild(badge);
+        badge.classList.add('pending');
+        queueShiftOperation(
+            {
+                op: 'move',
+                shift_id: parseInt(badge.dataset.shiftId, 10),
+                user_id: parseInt(targetCell.dataset.userId, 10),
+                date: targetCell.dataset.date
+            },
+            (result) => {
+                badge.classList.remove('pending');
+                if (!result.success) {
+                    sourceCell.appendChild(badge);
+                }
+                return [sourceCell.dataset.userId, targetCell.dataset.userId];
+            }
+        );
+    };
+
+    const addShiftFromTemplate = (templateId) => {
+        queueShiftCreate(templateId, selectedUserId, selectedDate);
+        selectTemplateModal.style.display = 'none';
+    };
+
+    // Перетаскивание шаблонов из списка и бейджей смен по ячейкам (только владелец)
+    const setupShiftDragAndDrop = () => {
+        if (!isOwner) return;
+        const TEMPLATE_TYPE = 'application/x-shift-template';
+        const SHIFT_TYPE = 'application/x-shift-id';
+        let draggedBadge = null;
+
+        // Таблица перестраивается целиком, поэтому draggable выставляем при нажатии
+        document.addEventListener('mousedown', (e) => {
+            const source = e.target.closest('.day-cell .shift-badge:not(.pending), #templateList .template-item');
+            if (source && !e.target.closest('button')) source.draggable = true;
+        });
+
+        document.addEventListener('dragstart', (e) => {
+            const badge = e.target.closest?.('.day-cell .shift-badge');
+            const template = e.target.closest?.('#templateList .template-item');
+            if (badge) {
+                draggedBadge = badge;
+                e.dataTransfer.setData(SHIFT_TYPE, badge.dataset.shiftId);
+                e.dataTransfer.effectAllowed = 'move';
+            } else if (template) {
+                e.dataTransfer.setData(TEMPLATE_TYPE, template.dataset.templateId);
+                e.dataTransfer.effectAllowed = 'copy';
+            }
+        });
+
+        document.addEventListener('dragend', () => {
+            draggedBadge = null;
+            document.querySelectorAll('.day-cell.drop-target').forEach(cell => cell.classList.remove('drop-target'));
+        });
+
+        document.addEventListener('dragover', (e) => {
+            const cell = e.target.closest('.day-cell');
+            const types = Array.from(e.dataTransfer?.types || []);
+            if (!cell || !(types.includes(TEMPLATE_TYPE) || types.includes(SHIFT_TYPE))) return;
+            e.preventDefault();
+            document.querySelectorAll('.day-cell.drop-target').forEach(other => {
+                if (other !== cell) other.classList.remove('drop-target');
+            });
+            cell.classList.add('drop-target');
+        });
+
+        document.addEventListener('drop', (e) => {
+            const cell = e.target.closest('.day-cell');
+            if (!cell) return;
+            const templateId = e.dataTransfer.getData(TEMPLATE_TYPE);
+            const shiftId = e.dataTransfer.getData(SHIFT_TYPE);
+            if (!templateId && !shiftId) return;
+            e.preventDefault();
+            cell.classList.remove('drop-target');
+
+            if (templateId) {
+                queueShiftCreate(templateId, cell.dataset.userId, cell.dataset.date);
+            } else if (draggedBadge && draggedBadge.dataset.shiftId === shiftId) {
+                queueShiftMove(draggedBadge, cell);
+            }
+        });
     };
 
     // ====================== ОБРАБОТЧИКИ СОБЫТИЙ ======================
@@ -1747,6 +1896,103 @@ function getUserDisplayName(user, includeYouLabel = false) {
         }
     };
 
+    // ====================== ЖИВЫЕ ОБНОВЛЕНИЯ (SSE) ======================
+
+    let liveVersion = null;
+
+    // Применение изменений смен на месте: удаляем старые бейджи, вставляем новые
+    const applyShiftEvent = (data) => {
+        if (data.reset) {
+            liveVersion = data.version;
+            loadMonthGrid().catch(error => console.error('Ошибка обновления календаря:', error));
+            return;
+        }
+        const touchedUsers = new Set();
+        const removeBadges = (shiftId) => {
+            document.querySelectorAll(`.shift-badge[data-shift-id="${shiftId}"]`).forEach(badge => {
+                const userId = badge.closest('.day-cell')?.dataset.userId;
+                if (userId) touchedUsers.add(userId);
+                badge.remove();
+            });
+        };
+
+        (data.deleted_ids || []).forEach(removeBadges);
+        (data.shifts || []).forEach(shift => {
+            removeBadges(shift.id);
+            // Смены вне отображаемого месяца просто пропускаем
+            const cell = document.querySelector(`td.day-cell[data-user-id="${shift.user_id}"][data-date="${shift.date}"]`);
+            if (!cell) return;
+            cell.appendChild(buildShiftBadge(shift));
+            touchedUsers.add(String(shift.user_id));
+        });
+
+        liveVersion = data.version;
+        setupShiftHandlers();
+        touchedUsers.forEach(userId => updateSingleUserSummary(userId));
+    };
+
+    // Совпадает ли текущий порядок строк с присланным (наше же изменение — перестраивать не нужно)
+    const positionsMatchTable = (data) => {
+        const tbody = document.querySelector('.calendar-table tbody');
+        if (!tbody) return false;
+        if (data.members) {
+            const expected = Object.keys(data.members).sort((a, b) => data.members[a] - data.members[b]);
+            const actual = Array.from(tbody.querySelectorAll('tr.user-row:not(.owner)'))
+                .map(row => row.dataset.userId)
+                .filter(userId => userId in data.members);
+            return expected.join(',') === actual.join(',');
+        }
+        if (data.groups) {
+            const actual = Array.from(tbody.querySelectorAll('tr.group-header-row[data-group-id]'))
+                .map(row => parseInt(row.dataset.groupId, 10));
+            return data.groups.join(',') === actual.slice(0, data.groups.length).join(',');
+        }
+        return false;
+    };
+
+    // Изменения состава и порядка передаём groups.js — он перестраивает строки
+    const notifyStructureChange = (type, data) => {
+        document.dispatchEvent(new CustomEvent('calendar:structure-changed', { detail: { type, data } }));
+    };
+
+    const setupLiveUpdates = () => {
+        const calendarId = document.body.dataset.calendarId;
+        if (!calendarId || typeof window.EventSource !== 'function') return;
+
+        const source = new EventSource(`/calendar/${calendarId}/events`);
+        const parse = (e) => {
+            try {
+                return JSON.parse(e.data);
+            } catch (error) {
+                return null;
+            }
+        };
+
+        source.addEventListener('hello', (e) => {
+            const data = parse(e);
+            if (!data) return;
+            // После переподключения могли пропустить изменения — догружаем месяц
+            if (liveVersion !== null && data.version !== liveVersion) {
+                loadMonthGrid().catch(error => console.error('Ошибка обновления календаря:', error));
+            }
+            liveVersion = data.version;
+        });
+        source.addEventListener('shifts', (e) => {
+            const data = parse(e);
+            if (data) applyShiftEvent(data);
+        });
+        source.addEventListener('positions', (e) => {
+            const data = parse(e);
+            if (data && !positionsMatchTable(data)) notifyStructureChange('positions', data);
+        });
+        ['members', 'groups'].forEach(type => {
+            source.addEventListener(type, (e) => notifyStructureChange(type, parse(e)));
+        });
+        source.addEventListener('reset', () => {
+            loadMonthGrid().catch(error => console.error('Ошибка обновления календаря:', error));
+        });
+    };
+
     // ====================== ИНИЦИАЛИЗАЦИЯ ======================
 
     // Скрываем элементы управления, доступные ТОЛЬКО владельцу календаря
@@ -1758,13 +2004,21 @@ function getUserDisplayName(user, includeYouLabel = false) {
         const firstContainer = document.querySelector('.calendar-table-container');
         if (firstContainer) firstContainer.classList.add('pending-anim');
 
-        updateMonthDisplay();
+        // Таблица месяца уже отрисована сервером — подпись без повторной загрузки,
+        // данные групп и смен придут одним запросом в updateCalendarAfterGroupChange
+        const hasBootstrap = typeof updateCalendarAfterGroupChange === 'function';
+        if (hasBootstrap) {
+            currentMonthEl.textContent = `${monthNames[currentMonth.getMonth()]} ${currentMonth.getFullYear()}`;
+        } else {
+            updateMonthDisplay();
+        }
         setupMonthNavigation();
         setupModals();
         setupTemplateHandlers();
         setupShiftHandlers();
         setupMemberManagement();
         setupCalendarCellHandlers();
+        setupShiftDragAndDrop();
         setupFullscreenToggle();
         syncHorizontalScroll();
         adjustTableLayout();
@@ -1774,16 +2028,20 @@ function getUserDisplayName(user, includeYouLabel = false) {
         }
         
         // Единоразовая синхронизация таблицы и сайдбара групп на первичной загрузке
-        if (typeof updateCalendarAfterGroupChange === 'function') {
+        if (hasBootstrap) {
             try {
                 await updateCalendarAfterGroupChange();
+                hideOwnerControlsIfNotOwner();
                 if (typeof updateAllUserSummaries === 'function') {
                     updateAllUserSummaries();
                 }
             } catch (e) {
                 console.warn('Не удалось выполнить первичную синхронизацию групп:', e);
             }
+            window.animateCalendarRows();
         }
+
+        setupLiveUpdates();
     };
 
     init();
@@ -0,0 +1,96 @@
+-- Схема базы до версионированных миграций (таблицы, какими их создавал db.create_all)
+CREATE TABLE user (
+	id INTEGER NOT NULL, 
+	username VARCHAR(20) NOT NULL, 
+	email VARCHAR(120) NOT NULL, 
+	password_hash VARCHAR(128) NOT NULL, 
+	created_at DATETIME NOT NULL, 
+	avatar VARCHAR(200), 
+	first_name VARCHAR(50) NOT NULL, 
+	last_name VARCHAR(50) NOT NULL, 
+	age INTEGER, 
+	phone VARCHAR(20), 
+	PRIMARY KEY (id), 
+	UNIQUE (username), 
+	UNIQUE (email)
+);
+CREATE TABLE friends (
+	user_id INTEGER, 
+	friend_id INTEGER, 
+	FOREIGN KEY(user_id) REFERENCES user (id), 
+	FOREIGN KEY(friend_id) REFERENCES user (id)
+);
+CREATE TABLE friend_request (
+	id INTEGER NOT NULL, 
+	sender_id INTEGER NOT NULL, 
+	receiver_id INTEGER NOT NULL, 
+	timestamp DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(sender_id) REFERENCES user (id), 
+	FOREIGN KEY(receiver_id) REFERENCES user (id)
+);
+CREATE TABLE calendar (
+	id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	owner_id INTEGER NOT NULL, 
+	created_at DATETIME, 
+	is_team BOOLEAN, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(owner_id) REFERENCES user (id)
+);
+CREATE TABLE IF NOT EXISTS "group" (
+	id INTEGER NOT NULL, 
+	name VARCHAR(100) NOT NULL, 
+	color VARCHAR(20) NOT NULL, 
+	calendar_id INTEGER NOT NULL, 
+	owner_id INTEGER NOT NULL, 
+	position INTEGER NOT NULL, 
+	created_at DATETIME, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(calendar_id) REFERENCES calendar (id), 
+	FOREIGN KEY(owner_id) REFERENCES user (id)
+);
+CREATE TABLE calendar_members (
+	calendar_id INTEGER NOT NULL, 
+	user_id INTEGER NOT NULL, 
+	position INTEGER, 
+	PRIMARY KEY (calendar_id, user_id), 
+	FOREIGN KEY(calendar_id) REFERENCES calendar (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE shift_template (
+	id INTEGER NOT NULL, 
+	title VARCHAR(100) NOT NULL, 
+	start_time TIME NOT NULL, 
+	end_time TIME NOT NULL, 
+	calendar_id INTEGER NOT NULL, 
+	owner_id INTEGER NOT NULL, 
+	show_time BOOLEAN, 
+	color_class VARCHAR(20) NOT NULL, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(calendar_id) REFERENCES calendar (id), 
+	FOREIGN KEY(owner_id) REFERENCES user (id)
+);
+CREATE TABLE group_members (
+	group_id INTEGER NOT NULL, 
+	user_id INTEGER NOT NULL, 
+	PRIMARY KEY (group_id, user_id), 
+	FOREIGN KEY(group_id) REFERENCES "group" (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id)
+);
+CREATE TABLE shift (
+	id INTEGER NOT NULL, 
+	title VARCHAR(100) NOT NULL, 
+	start_time TIME NOT NULL, 
+	end_time TIME NOT NULL, 
+	calendar_id INTEGER NOT NULL, 
+	user_id INTEGER, 
+	date DATE NOT NULL, 
+	template_id INTEGER, 
+	show_time BOOLEAN, 
+	color_class VARCHAR(20) NOT NULL, 
+	PRIMARY KEY (id), 
+	FOREIGN KEY(calendar_id) REFERENCES calendar (id), 
+	FOREIGN KEY(user_id) REFERENCES user (id), 
+	FOREIGN KEY(template_id) REFERENCES shift_template (id)
+);
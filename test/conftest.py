@@ -0,0 +1,119 @@
+"""Общие фикстуры тестов: приложение на временной базе SQLite.
+
+База создаётся один раз на сессию (миграции, триггеры сводки), после
+каждого теста все таблицы очищаются, кэш аналитики сбрасывается.
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import date, time, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='myshiftly-'), 'test.db')
+config.Config.TESTING = True
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app as flask_app  # noqa: E402
+from analysis_cache import analysis_cache  # noqa: E402
+from models import db, User, Calendar, ShiftTemplate, bulk_insert_shifts, calendar_members  # noqa: E402
+
+OWNER_ID = 1000
+MEMBER_IDS = [1001, 1002, 1003, 1004, 1005]
+CALENDAR_ID = 42
+DAY_TEMPLATE_ID = 1     # 09:00–18:00
+NIGHT_TEMPLATE_ID = 2   # 21:00–07:00, через полночь
+PASSWORD = 'password'
+
+# Смены набора generated_shifts: (название, начало, конец, show_time, цвет, шаблон)
+GENERATED_KINDS = [
+    ('День', time(9), time(18), True, 'badge-color-2', DAY_TEMPLATE_ID),
+    ('Ночь', time(21), time(7), True, 'badge-color-5', NIGHT_TEMPLATE_ID),
+    ('Утро', time(7, 30), time(11), True, 'badge-color-3', None),
+    ('Вечер', time(14), time(20, 45), True, 'badge-color-2', None),
+    ('Выходной', time(0), time(0), False, 'badge-color-1', None),
+]
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+    analysis_cache.clear()
+
+
+@pytest.fixture
+def team_calendar(app):
+    """Командный календарь: владелец, пять участников, шаблоны дневной и ночной смены."""
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+    for index, user_id in enumerate([OWNER_ID] + MEMBER_IDS):
+        db.session.add(User(
+            id=user_id, username=f'user{index}', email=f'user{index}@example.com',
+            password_hash=password_hash, first_name=f'Имя{index}', last_name=f'Фамилия{index}'
+        ))
+    calendar = Calendar(id=CALENDAR_ID, name='Команда', owner_id=OWNER_ID, is_team=True)
+    db.session.add(calendar)
+    db.session.flush()
+    for position, user_id in enumerate(MEMBER_IDS, start=1):
+        db.session.execute(calendar_members.insert().values(calendar_id=CALENDAR_ID, user_id=user_id, position=position))
+    db.session.add_all([
+        ShiftTemplate(id=DAY_TEMPLATE_ID, title='День', start_time=time(9), end_time=time(18),
+                      calendar_id=CALENDAR_ID, owner_id=OWNER_ID, color_class='badge-color-2'),
+        ShiftTemplate(id=NIGHT_TEMPLATE_ID, title='Ночь', start_time=time(21), end_time=time(7),
+                      calendar_id=CALENDAR_ID, owner_id=OWNER_ID, color_class='badge-color-5'),
+    ])
+    db.session.commit()
+    return calendar
+
+
+@pytest.fixture
+def login(app):
+    """login(user_id) — тестовый клиент с вошедшим пользователем."""
+    def make_client(user_id=OWNER_ID):
+        client = app.test_client()
+        email = db.session.get(User, user_id).email
+        client.post('/login', data={'email': email, 'password': PASSWORD})
+        return client
+    return make_client
+
+
+@pytest.fixture
+def generated_shifts(team_calendar):
+    """Случайные (с фиксированным seed) смены всех участников с ноября 2023 по июнь 2025.
+
+    Плюс одна смена без пользователя — 2025-03-12.
+    """
+    rng = random.Random(17)
+    rows = []
+    day = date(2023, 11, 1)
+    while day <= date(2025, 6, 30):
+        for user_id in [OWNER_ID] + MEMBER_IDS:
+            if rng.random() < 0.35:
+                continue
+            title, start, end, show_time, color_class, template_id = rng.choice(GENERATED_KINDS)
+            rows.append({
+                'title': title, 'start_time': start, 'end_time': end, 'calendar_id': CALENDAR_ID,
+                'user_id': user_id, 'date': day, 'template_id': template_id, 'show_time': show_time,
+                'color_class': color_class
+            })
+        day += timedelta(days=1)
+    rows.append({
+        'title': 'День', 'start_time': time(9), 'end_time': time(18), 'calendar_id': CALENDAR_ID,
+        'user_id': None, 'date': date(2025, 3, 12), 'template_id': None, 'show_time': True,
+        'color_class': 'badge-color-2'
+    })
+    bulk_insert_shifts(rows)
+    db.session.commit()
+    return rows
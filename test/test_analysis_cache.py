@@ -0,0 +1,23 @@
+"""/api/analysis-cache/stats: закрыт, пока не включён ANALYSIS_CACHE_STATS или отладка."""
+import pytest
+
+from conftest import CALENDAR_ID, MEMBER_IDS
+
+
+def test_cache_stats_hidden_by_default(team_calendar, login):
+    response = login(MEMBER_IDS[0]).get('/api/analysis-cache/stats')
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize('setting', ['ANALYSIS_CACHE_STATS', 'DEBUG'])
+def test_cache_stats_when_enabled(team_calendar, login, app, monkeypatch, setting):
+    monkeypatch.setitem(app.config, setting, True)
+    client = login()
+    response = client.get('/api/analysis-cache/stats')
+    assert response.status_code == 200
+    before = response.get_json()['stats']
+    for _ in range(2):
+        client.post('/api/analysis-data', json={'calendar_ids': [CALENDAR_ID], 'period': 'month', 'month': '2025-03'})
+    after = client.get('/api/analysis-cache/stats').get_json()['stats']
+    # Счётчики — на процесс: первый запрос промах, повтор — попадание
+    assert (after['hits'] - before['hits'], after['misses'] - before['misses']) == (1, 1)
@@ -0,0 +1,79 @@
+"""Выгрузка смен и разделов аналитики в CSV; XLSX — если установлен openpyxl."""
+import csv
+import io
+from datetime import date, time
+
+import pytest
+
+from conftest import CALENDAR_ID, MEMBER_IDS, OWNER_ID
+from export import ANALYSIS_SECTIONS, SHIFT_EXPORT_HEADER, xlsx_available
+from models import db, bulk_insert_shifts
+
+
+@pytest.fixture
+def march_shifts(team_calendar):
+    bulk_insert_shifts([{
+        'title': 'Ночь', 'start_time': time(20), 'end_time': time(8), 'calendar_id': CALENDAR_ID,
+        'user_id': user_id, 'date': date(2025, 3, day), 'template_id': None, 'show_time': True,
+        'color_class': 'badge-color-5'
+    } for user_id in MEMBER_IDS for day in range(1, 11)])
+    db.session.commit()
+
+
+def _csv_rows(response):
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('\ufeff'))))
+
+
+def test_shift_export_csv(march_shifts, login):
+    response = login().get(f'/api/calendar/{CALENDAR_ID}/export/shifts?month=2025-03-01')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    rows = _csv_rows(response)
+    assert rows[0] == SHIFT_EXPORT_HEADER
+    assert len(rows) == 1 + 50
+    assert all(len(row) == len(SHIFT_EXPORT_HEADER) for row in rows)
+    assert rows[1][0] == '2025-03-01'
+    assert rows[1][5:8] == ['20:00', '08:00', '12.0']
+
+
+@pytest.mark.parametrize('query', ['format=pdf', 'start=2025-03-01&end=2026-12-31', 'start=2025-13-01&end=2025-12-31'])
+def test_shift_export_bad_request(march_shifts, login, query):
+    assert login().get(f'/api/calendar/{CALENDAR_ID}/export/shifts?{query}').status_code == 400
+
+
+def test_shift_export_forbidden(march_shifts, app, login):
+    from models import Calendar
+    db.session.add(Calendar(id=CALENDAR_ID + 1, name='Чужой', owner_id=MEMBER_IDS[0]))
+    db.session.commit()
+    assert login(OWNER_ID).get(f'/api/calendar/{CALENDAR_ID + 1}/export/shifts').status_code == 403
+
+
+@pytest.mark.parametrize('section', list(ANALYSIS_SECTIONS))
+def test_analysis_export_csv(march_shifts, login, section):
+    response = login().post('/api/analysis-export', json={
+        'calendar_ids': [CALENDAR_ID], 'period': 'month', 'month': '2025-03', 'format': 'csv', 'section': section
+    })
+    assert response.status_code == 200
+    assert len(_csv_rows(response)) > 1
+
+
+@pytest.mark.parametrize('section', [['coverage'], {'name': 'coverage'}, 7, 'unknown', None])
+def test_analysis_export_bad_section(march_shifts, login, section):
+    response = login().post('/api/analysis-export', json={
+        'calendar_ids': [CALENDAR_ID], 'month': '2025-03', 'format': 'csv', 'section': section
+    })
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_analysis_export_xlsx(march_shifts, login):
+    response = login().post('/api/analysis-export', json={
+        'calendar_ids': [CALENDAR_ID], 'month': '2025-03', 'format': 'xlsx'
+    })
+    if not xlsx_available():
+        assert response.status_code == 501
+        return
+    from openpyxl import load_workbook
+    assert response.status_code == 200
+    workbook = load_workbook(io.BytesIO(response.get_data()), read_only=True)
+    assert workbook.sheetnames == list(ANALYSIS_SECTIONS.values())
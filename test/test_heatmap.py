@@ -0,0 +1,51 @@
+"""Тепловая карта «люди на смене»: разностный массив и ночные смены на границах периода."""
+from datetime import date, time
+
+from analytics import build_analysis
+from conftest import CALENDAR_ID, MEMBER_IDS, OWNER_ID
+from heatmap import on_duty_grid
+from models import db, bulk_insert_shifts
+
+
+def _shift(user_id, day, start, end):
+    return {
+        'title': 'Смена', 'start_time': start, 'end_time': end, 'calendar_id': CALENDAR_ID,
+        'user_id': user_id, 'date': day, 'template_id': None, 'show_time': True, 'color_class': 'badge-color-1'
+    }
+
+
+def test_on_duty_grid_overnight():
+    # 20:00–08:00 в день 0 и хвост такой же смены накануне (день −1)
+    grid = on_duty_grid([0, -1], [20 * 60, 20 * 60], [720, 720], days=2)
+    assert grid[0] == [1] * 8 + [0] * 12 + [1] * 4
+    assert grid[1] == [1] * 8 + [0] * 16
+
+
+def test_on_duty_grid_partial_slots_and_period_end():
+    # 08:30–09:15 задевает слоты 08 и 09; хвост за концом периода отбрасывается
+    grid = on_duty_grid([0, 0], [8 * 60 + 30, 23 * 60], [45, 180], days=1)
+    assert grid == [[0] * 8 + [1, 1] + [0] * 13 + [1]]
+
+
+def test_on_duty_grid_previous_day_shift_without_tail():
+    assert on_duty_grid([-1], [8 * 60], [600], days=1) == [[0] * 24]
+
+
+def test_heatmap_counts_overnight_shift_from_previous_day(team_calendar):
+    bulk_insert_shifts([
+        _shift(MEMBER_IDS[0], date(2025, 2, 28), time(20), time(8)),
+        _shift(MEMBER_IDS[1], date(2025, 2, 28), time(9), time(17)),
+        _shift(MEMBER_IDS[2], date(2025, 3, 1), time(6), time(10)),
+    ])
+    db.session.commit()
+
+    data = build_analysis([CALENDAR_ID], 'month', '2025-03', user_id=OWNER_ID,
+                          user_calendar_roles={CALENDAR_ID: 'creator'})
+
+    first_day = data['coverage_heatmap']['dates'][0]
+    assert first_day['date'] == '2025-03-01'
+    assert first_day['values'][:10] == [1, 1, 1, 1, 1, 1, 2, 2, 1, 1]
+    assert sum(first_day['values'][10:]) == 0
+    # Остальные разделы считают только смены периода
+    assert data['shift_stats']['total_shifts'] == 1
+    assert data['team_analysis']['coverage_data'][0]['headcount'] == 1
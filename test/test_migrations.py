@@ -0,0 +1,116 @@
+"""Миграции старой базы с данными до LATEST_VERSION.
+
+База создаётся по test/baseline_schema.sql — схеме до schema_version —
+и заполняется строками: участники с position, группы, смены через
+полночь, дубль смены дня и смена без пользователя.
+"""
+import os
+import sqlite3
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import migrations
+from migrations import LATEST_VERSION, ensure_schema
+from models import db
+from rollup import NO_USER
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_schema.sql')
+
+BASELINE_ROWS = [
+    "INSERT INTO user (id, username, email, password_hash, created_at, first_name, last_name) VALUES "
+    "(1, 'owner', 'owner@example.com', 'x', '2024-01-01 00:00:00', 'Анна', 'Иванова'), "
+    "(2, 'day', 'day@example.com', 'x', '2024-01-01 00:00:00', 'Борис', 'Петров'), "
+    "(3, 'night', 'night@example.com', 'x', '2024-01-01 00:00:00', 'Вера', 'Сидорова')",
+    "INSERT INTO friends (user_id, friend_id) VALUES (1, 2), (2, 1)",
+    "INSERT INTO calendar (id, name, owner_id, created_at, is_team) VALUES (10, 'Команда', 1, '2024-01-01 00:00:00', 1)",
+    "INSERT INTO calendar_members (calendar_id, user_id, position) VALUES (10, 2, 2), (10, 3, 1)",
+    "INSERT INTO \"group\" (id, name, color, calendar_id, owner_id, position, created_at) VALUES "
+    "(5, 'Смена А', '#ff0000', 10, 1, 0, '2024-01-01 00:00:00'), "
+    "(6, 'Смена Б', '#00ff00', 10, 1, 1, '2024-01-01 00:00:00')",
+    "INSERT INTO group_members (group_id, user_id) VALUES (5, 2), (6, 3)",
+    "INSERT INTO shift_template (id, title, start_time, end_time, calendar_id, owner_id, show_time, color_class) "
+    "VALUES (1, 'Ночь', '21:00:00.000000', '07:00:00.000000', 10, 1, 1, 'badge-color-5')",
+    "INSERT INTO shift (id, title, start_time, end_time, calendar_id, user_id, date, template_id, show_time, "
+    "color_class) VALUES "
+    "(1, 'День', '09:00:00.000000', '18:00:00.000000', 10, 2, '2025-03-03', NULL, 1, 'badge-color-2'), "
+    "(2, 'Ночь', '21:00:00.000000', '07:00:00.000000', 10, 3, '2025-03-03', 1, 1, 'badge-color-5'), "
+    "(3, 'День', '09:00:00.000000', '13:00:00.000000', 10, 2, '2025-03-03', NULL, 1, 'badge-color-2'), "
+    "(4, 'День', '09:00:00.000000', '18:00:00.000000', 10, NULL, '2025-03-04', NULL, 1, 'badge-color-2')",
+]
+
+
+@pytest.fixture
+def baseline_app(tmp_path):
+    path = tmp_path / 'baseline.db'
+    with sqlite3.connect(path) as conn:
+        with open(SCHEMA, encoding='utf-8') as schema:
+            conn.executescript(schema.read())
+        for statement in BASELINE_ROWS:
+            conn.execute(statement)
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _rows(sql):
+    return [tuple(row) for row in db.session.execute(text(sql)).fetchall()]
+
+
+def test_baseline_database_migrates_to_head(baseline_app):
+    ensure_schema(baseline_app)
+    with baseline_app.app_context():
+        assert _rows('PRAGMA integrity_check') == [('ok',)]
+        assert _rows('SELECT version FROM schema_version') == [(LATEST_VERSION,)]
+
+        # Порядок участников и групп сохранён в sort_key, индекс — по настоящей колонке
+        members = _rows('SELECT user_id FROM calendar_members WHERE calendar_id = 10 ORDER BY sort_key')
+        assert members == [(3,), (2,)]
+        assert _rows('SELECT id FROM "group" ORDER BY sort_key') == [(6,), (5,)]
+        assert [row[2] for row in _rows("PRAGMA index_info('ix_calendar_members_sort')")] == ['calendar_id', 'sort_key']
+
+        # Длительность, в том числе через полночь
+        assert _rows('SELECT id, duration_minutes, crosses_midnight FROM shift ORDER BY id') == [
+            (1, 540, 0), (2, 600, 1), (4, 540, 0)]
+        assert _rows('SELECT duration_minutes, crosses_midnight FROM shift_template') == [(600, 1)]
+
+        # Дубль дня перенесён, календарь получил сброс в журнале, индекс уникальный
+        assert _rows('SELECT id, user_id, date FROM shift_duplicate') == [(3, 2, '2025-03-03')]
+        assert _rows("SELECT calendar_id, action FROM shift_change") == [(10, 'reset')]
+        assert _rows('SELECT version FROM calendar') == [(1,)]
+        index_list = {row[1]: row[2] for row in _rows("PRAGMA index_list('shift')")}
+        assert index_list['uq_shift_calendar_user_date'] == 1
+
+        # Сводка совпадает с пересчётом по сменам, смена без пользователя — под NO_USER
+        assert _rows('SELECT SUM(shift_count), SUM(minutes) FROM shift_daily_rollup') == _rows(
+            'SELECT COUNT(*), SUM(duration_minutes) FROM shift')
+        assert _rows(f'SELECT date, minutes FROM shift_daily_rollup WHERE user_id = {NO_USER}') == [('2025-03-04', 540)]
+
+
+def test_migrated_database_is_not_migrated_again(baseline_app):
+    ensure_schema(baseline_app)
+    with baseline_app.app_context():
+        assert migrations.migrate() == (LATEST_VERSION, LATEST_VERSION)
+        assert _rows('PRAGMA integrity_check') == [('ok',)]
+
+
+def test_failed_migration_stops_startup(baseline_app, monkeypatch):
+    def broken(conn):
+        conn.execute(text('ALTER TABLE calendar ADD COLUMN half_done INTEGER'))
+        conn.execute(text('UPDATE no_such_table SET version = 1'))
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS + [(LATEST_VERSION + 1, 'сломанная', broken)])
+    monkeypatch.setattr(migrations, 'LATEST_VERSION', LATEST_VERSION + 1)
+    with pytest.raises(OperationalError):
+        ensure_schema(baseline_app)
+    with baseline_app.app_context():
+        # Применённые миграции остаются, номер схемы — последней успешной,
+        # DDL упавшей миграции откатан вместе с ней
+        assert _rows('SELECT version FROM schema_version') == [(LATEST_VERSION,)]
+        assert 'half_done' not in [row[1] for row in _rows("PRAGMA table_info('calendar')")]
+        assert _rows('PRAGMA integrity_check') == [('ok',)]
@@ -0,0 +1,46 @@
+"""Генератор ротации /api/calendar/<id>/rotation: проверка параметров и предпросмотр."""
+import pytest
+
+from conftest import CALENDAR_ID, DAY_TEMPLATE_ID, MEMBER_IDS, NIGHT_TEMPLATE_ID
+from models import db, Shift
+
+
+def _rotation(client, **params):
+    body = {
+        'pattern': [DAY_TEMPLATE_ID, NIGHT_TEMPLATE_ID, None],
+        'members': [{'user_id': MEMBER_IDS[0]}, {'user_id': MEMBER_IDS[1], 'offset': 1}],
+        'start_date': '2025-03-01', 'end_date': '2025-03-31',
+    }
+    body.update(params)
+    return client.post(f'/api/calendar/{CALENDAR_ID}/rotation', json=body)
+
+
+def _preview_dates(response):
+    return sorted({day for days in response.get_json()['preview'].values() for day, _ in days})
+
+
+def test_rotation_creates_shifts(team_calendar, login):
+    response = _rotation(login())
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 42
+    assert db.session.query(Shift).count() == 42
+
+
+@pytest.mark.parametrize('preview_days', ['abc', None, '1.5', [7], {'days': 7}])
+def test_rotation_rejects_bad_preview_days(team_calendar, login, preview_days):
+    response = _rotation(login(), dry_run=True, preview_days=preview_days)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('preview_days,expected_days', [(None, 14), (7, 7), ('3', 3), (0, 1), (-5, 1), (10 ** 9, 31)])
+def test_rotation_preview_days_clamped(team_calendar, login, preview_days, expected_days):
+    params = {'dry_run': True}
+    if preview_days is not None:
+        params['preview_days'] = preview_days
+    response = _rotation(login(), **params)
+    assert response.status_code == 200
+    dates = _preview_dates(response)
+    assert dates[0] == '2025-03-01'
+    assert len(dates) == expected_days
+    assert db.session.query(Shift).count() == 0
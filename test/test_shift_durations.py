@@ -0,0 +1,91 @@
+"""duration_minutes и crosses_midnight заполняются на каждом пути записи смен.
+
+ORM-вставки считают их в set_shift_duration, а Core/bulk-вставки
+(пакет, ротация, копирование) — сами. Тест проходит по всем путям и
+сверяет сохранённые значения с shift_duration и дневной сводкой.
+"""
+from datetime import date, time
+
+from sqlalchemy import func, select
+
+from conftest import CALENDAR_ID, DAY_TEMPLATE_ID, MEMBER_IDS, NIGHT_TEMPLATE_ID, OWNER_ID
+from models import db, Shift, ShiftDailyRollup, bulk_insert_shifts, shift_duration
+
+
+def _stored_shifts():
+    return db.session.execute(
+        select(Shift.date, Shift.start_time, Shift.end_time, Shift.duration_minutes, Shift.crosses_midnight)
+        .where(Shift.calendar_id == CALENDAR_ID)
+        .order_by(Shift.date, Shift.user_id)
+    ).all()
+
+
+def _assert_durations(expected_count):
+    rows = _stored_shifts()
+    assert len(rows) == expected_count
+    for day, start_time, end_time, minutes, crosses_midnight in rows:
+        assert (minutes, bool(crosses_midnight)) == shift_duration(start_time, end_time), day
+    rollup_minutes = db.session.execute(
+        select(func.sum(ShiftDailyRollup.minutes)).where(ShiftDailyRollup.calendar_id == CALENDAR_ID)
+    ).scalar()
+    assert rollup_minutes == sum(row.duration_minutes for row in rows)
+
+
+def test_shift_duration():
+    assert shift_duration(time(8), time(20)) == (720, False)
+    assert shift_duration(time(20), time(8)) == (720, True)
+    assert shift_duration(time(9), time(9)) == (0, False)
+
+
+def test_batch_create_stores_duration(team_calendar, login):
+    client = login()
+    response = client.post('/api/shifts/batch', json={'calendar_id': CALENDAR_ID, 'operations': [
+        {'op': 'create', 'user_id': MEMBER_IDS[0], 'date': '2025-03-03', 'template_id': DAY_TEMPLATE_ID},
+        {'op': 'create', 'user_id': MEMBER_IDS[1], 'date': '2025-03-03', 'template_id': NIGHT_TEMPLATE_ID},
+    ]})
+    assert response.get_json()['success']
+
+    _assert_durations(2)
+    day, night = (db.session.execute(
+        select(Shift.duration_minutes, Shift.crosses_midnight).where(Shift.user_id == user_id)
+    ).one() for user_id in MEMBER_IDS[:2])
+    assert tuple(day) == (540, False)
+    assert tuple(night) == (600, True)
+
+
+def test_every_write_path_stores_duration(team_calendar, login):
+    client = login()
+    # ORM: форма и шаблон
+    client.post(f'/calendar/{CALENDAR_ID}/add-shift', data={
+        'title': 'Вечер', 'start_time': '16:00', 'end_time': '00:30', 'user_id': MEMBER_IDS[0], 'date': '2025-03-01'
+    })
+    client.post('/api/add_shift_from_template', json={
+        'calendar_id': CALENDAR_ID, 'template_id': NIGHT_TEMPLATE_ID, 'user_id': MEMBER_IDS[1], 'date': '2025-03-01'
+    })
+    # Core: пакет, ротация (bulk_insert_shifts), копирование (INSERT ... SELECT)
+    client.post('/api/shifts/batch', json={'calendar_id': CALENDAR_ID, 'operations': [
+        {'op': 'create', 'user_id': MEMBER_IDS[2], 'date': '2025-03-02', 'template_id': NIGHT_TEMPLATE_ID}
+    ]})
+    client.post(f'/api/calendar/{CALENDAR_ID}/rotation', json={
+        'pattern': [DAY_TEMPLATE_ID, NIGHT_TEMPLATE_ID, None],
+        'members': [{'user_id': MEMBER_IDS[3]}, {'user_id': MEMBER_IDS[4], 'offset': 1}],
+        'start_date': '2025-03-01', 'end_date': '2025-03-07'
+    })
+    _assert_durations(3 + 10)
+
+    response = client.post(f'/api/calendar/{CALENDAR_ID}/copy-shifts', json={
+        'source_start': '2025-03-01', 'source_end': '2025-03-07', 'weeks': 1
+    })
+    assert response.get_json()['created'] == 13
+    _assert_durations(26)
+
+
+def test_bulk_insert_shifts_computes_duration(team_calendar):
+    bulk_insert_shifts([{
+        'title': 'Ночь', 'start_time': time(22), 'end_time': time(6), 'calendar_id': CALENDAR_ID,
+        'user_id': OWNER_ID, 'date': date(2025, 3, 1), 'template_id': None, 'show_time': True,
+        'color_class': 'badge-color-5'
+    }])
+    db.session.commit()
+    _assert_durations(1)
+    assert db.session.execute(select(Shift.duration_minutes)).scalar() == 480
@@ -0,0 +1,189 @@
+"""ShiftFrame и свёртки shift_frame.py на NumPy и на чистом Python.
+
+Каждый тест идёт с обоими вариантами (фикстура backend подменяет np
+в модулях); вариант NumPy пропускается, если он не установлен.
+build_analysis на одном наборе смен обязан давать одинаковые разделы.
+"""
+import json
+from datetime import date, time
+
+import pytest
+from sqlalchemy import select
+
+import heatmap
+import shift_frame
+from analytics import build_analysis
+from conftest import CALENDAR_ID, MEMBER_IDS, OWNER_ID
+from models import db, Shift
+from shift_frame import NO_CATEGORY, NO_USER, ShiftFrame, distinct_count, group_sum, period_index
+
+
+def _numpy():
+    return pytest.importorskip('numpy')
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    np = _numpy() if request.param == 'numpy' else None
+    monkeypatch.setattr(shift_frame, 'np', np)
+    monkeypatch.setattr(heatmap, 'np', np)
+    return request.param
+
+
+def _ints(values):
+    return [int(value) for value in values]
+
+
+def _row(shift_id, user_id, day, start, end, minutes, show_time=True, title='День', color='badge-color-2',
+         template='День'):
+    # Кортеж как у shift_rows_statement
+    return (shift_id, user_id, day, start, end, show_time, title, color, minutes, template)
+
+
+ROWS = [
+    _row(1, 1001, date(2025, 2, 28), time(20), time(8), 720, title='Ночь', color='badge-color-5', template='Ночь'),
+    _row(2, 1002, date(2025, 3, 1), time(9), time(18), 540),
+    _row(3, None, date(2025, 3, 1), time(9), time(18), 540),
+    _row(4, 1001, date(2025, 3, 3), time(0), time(0), 0, show_time=False, title='Выходной', template=None),
+    _row(5, 1002, date(2025, 3, 3), time(21), time(7), 600, title='Ночь', color='badge-color-5', template='Ночь'),
+    _row(6, 1003, date(2025, 3, 31), time(22), time(6), 480, title='Ночь', color=None, template=None),
+]
+
+
+def test_group_sum(backend):
+    assert group_sum([]) == {}
+    assert group_sum([], []) == {}
+    assert group_sum([3, 1, 3, 2, 1, 3]) == {3: 3, 1: 2, 2: 1}
+    assert list(group_sum([3, 1, 3, 2])) == [3, 1, 2]  # порядок первого появления
+    assert group_sum([3, 1, 3], [10, 20, 30]) == {3: 40, 1: 20}
+
+
+def test_distinct_count(backend):
+    assert distinct_count([], []) == {}
+    assert distinct_count([5, 5, 5, 6, 6], [1, 1, 2, 1, NO_USER]) == {5: 2, 6: 2}
+
+
+def test_period_index(backend):
+    starts, ends = [10, 20, 30], [14, 24, 34]  # между периодами — дыры
+    assert _ints(period_index([9, 10, 14, 15, 20, 27, 34, 35], starts, ends)) == [-1, 0, 0, -1, 1, -1, 2, -1]
+    assert _ints(period_index([1, 2], [], [])) == [-1, -1]
+    assert _ints(period_index([], starts, ends)) == []
+
+
+def test_empty_frame(backend):
+    frame = ShiftFrame.from_rows([])
+    assert len(frame) == 0
+    for part in (frame.between(date(2025, 3, 1), date(2025, 3, 31)), frame.timed(), frame.with_user(),
+                 frame.ending_after(date(2025, 3, 1))):
+        assert len(part) == 0
+        assert part.tolist('ids') == []
+    assert frame.total('durations') == 0
+    assert group_sum(frame.weekdays()) == {}
+
+
+def test_from_rows_columns(backend):
+    frame = ShiftFrame.from_rows(ROWS)
+    assert frame.tolist('user_ids') == [1001, 1002, NO_USER, 1001, 1002, 1003]
+    assert frame.tolist('start_minutes') == [1200, 540, 540, 0, 1260, 1320]
+    assert frame.tolist('durations') == [720, 540, 540, 0, 600, 480]
+    assert frame.tolist('show_time') == [True, True, True, False, True, True]
+    assert [frame.titles[code] for code in frame.tolist('title_codes')] == [
+        'Ночь', 'День', 'День', 'Выходной', 'Ночь', 'Ночь']
+    assert [frame.colors[code] for code in frame.tolist('color_codes')][-1] is None
+    assert frame.tolist('template_codes')[3] == NO_CATEGORY
+    assert frame.total('durations') == 2880
+
+
+def test_between(backend):
+    frame = ShiftFrame.from_rows(ROWS)
+    assert frame.between(date(2025, 3, 1), date(2025, 3, 31)).tolist('ids') == [2, 3, 4, 5, 6]
+    assert frame.between(date(2025, 3, 3), date(2025, 3, 3)).tolist('ids') == [4, 5]
+    assert frame.between(date(2025, 3, 4), date(2025, 3, 30)).tolist('ids') == []
+    assert frame.between(date(2025, 4, 1), date(2025, 4, 30)).tolist('ids') == []
+    part = frame.between(date(2025, 2, 1), date(2025, 3, 2))
+    assert part.tolist('ids') == [1, 2, 3]
+    assert part.start_times == [time(20), time(9), time(9)]
+
+
+def test_filters_and_overnight_rows(backend):
+    frame = ShiftFrame.from_rows(ROWS)
+    assert frame.timed().tolist('ids') == [1, 2, 3, 5, 6]
+    assert frame.with_user().tolist('ids') == [1, 2, 4, 5, 6]
+    assert frame.timed().with_user().end_times == [time(8), time(18), time(7), time(6)]
+    # Ночная смена накануне задевает 1 марта, дневная 28 февраля — уже нет
+    assert frame.ending_after(date(2025, 3, 1)).tolist('ids') == [1, 2, 3, 4, 5, 6]
+    assert frame.ending_after(date(2025, 3, 2)).tolist('ids') == [4, 5, 6]
+    assert frame.between(date(2025, 2, 28), date(2025, 2, 28)).ending_after(date(2025, 3, 1)).tolist('ids') == [1]
+    assert _ints(frame.day_offsets(date(2025, 3, 1))) == [-1, 0, 0, 2, 2, 30]
+    assert _ints(frame.weekdays()) == [4, 5, 5, 0, 0, 0]
+
+
+ANALYSIS_REQUESTS = [
+    ('month', '2025-03', {}, {}),
+    ('week', '2025-W10', {'duration': 'long'}, {}),
+    ('quarter', '2025-Q1', {'shiftType': ['badge-color-2', 'badge-color-5']}, {}),
+    ('year', '2024', {'users': [MEMBER_IDS[0], OWNER_ID]},
+     {'comparisons': [{'period': 'year', 'month': '2023'}, {'period': 'month', 'month': '2025-06'}]}),
+    ('month', '2024-02', {}, {'comparison': {'period': 'month', 'month': '2024-01'}}),
+]
+
+
+@pytest.mark.parametrize('period,month,filters,extra', ANALYSIS_REQUESTS)
+def test_build_analysis_numpy_matches_python(generated_shifts, monkeypatch, period, month, filters, extra):
+    np = _numpy()
+    results = []
+    for module_np in (np, None):
+        monkeypatch.setattr(shift_frame, 'np', module_np)
+        monkeypatch.setattr(heatmap, 'np', module_np)
+        results.append(build_analysis(
+            [CALENDAR_ID], period, month, filters, OWNER_ID, {CALENDAR_ID: 'creator'},
+            extra.get('comparison'), extra.get('comparisons')
+        ))
+    with_numpy, without_numpy = results
+    assert with_numpy.keys() == without_numpy.keys()
+    for section in with_numpy:
+        assert with_numpy[section] == without_numpy[section], section
+    assert with_numpy['shift_stats']['total_shifts'] > 0
+    json.dumps(with_numpy)  # значения — обычные int/float, не скаляры NumPy
+
+
+@pytest.mark.parametrize('period,month,filters,extra', ANALYSIS_REQUESTS[:2])
+def test_build_analysis_participant_same_on_both_backends(generated_shifts, monkeypatch, period, month, filters,
+                                                          extra):
+    np = _numpy()
+    results = []
+    for module_np in (np, None):
+        monkeypatch.setattr(shift_frame, 'np', module_np)
+        monkeypatch.setattr(heatmap, 'np', module_np)
+        results.append(build_analysis([CALENDAR_ID], period, month, filters, MEMBER_IDS[1],
+                                      {CALENDAR_ID: 'participant'}))
+    assert results[0] == results[1]
+    assert [user['id'] for user in results[0]['team_analysis']['activity_ranking']] == [MEMBER_IDS[1]]
+
+
+def test_build_analysis_matches_direct_sums(generated_shifts, backend):
+    """Разделы месяца против прямого подсчёта по сменам из базы."""
+    data = build_analysis([CALENDAR_ID], 'month', '2025-03', {}, OWNER_ID, {CALENDAR_ID: 'creator'})
+    shifts = db.session.scalars(select(Shift).where(
+        Shift.calendar_id == CALENDAR_ID, Shift.date >= date(2025, 3, 1), Shift.date <= date(2025, 3, 31)
+    )).all()
+    timed = [shift for shift in shifts if shift.show_time]
+
+    assert data['shift_stats']['total_shifts'] == len(timed)
+    assert data['shift_stats']['total_hours'] == round(sum(shift.duration_minutes for shift in timed) / 60, 1)
+    weekday_minutes = [0] * 7
+    for shift in timed:
+        weekday_minutes[shift.date.weekday()] += shift.duration_minutes
+    assert data['weekday_activity']['hours'] == [round(minutes / 60, 1) for minutes in weekday_minutes]
+
+    ranking = {user['id']: (user['total_hours'], user['total_shifts'])
+               for user in data['team_analysis']['activity_ranking']}
+    for user_id in [OWNER_ID] + MEMBER_IDS:
+        own = [shift for shift in timed if shift.user_id == user_id]
+        assert ranking[user_id] == (round(sum(shift.duration_minutes for shift in own) / 60, 1), len(own))
+
+    for day in data['team_analysis']['coverage_data']:
+        day_shifts = [shift for shift in shifts if shift.date.isoformat() == day['full_date'] and shift.user_id]
+        assert day['shifts_count'] == len(day_shifts)
+        assert day['headcount'] == len({shift.user_id for shift in day_shifts})
+    assert sum(slot['count'] for slot in data['time_slots']['templates']) == len(shifts)
@@ -0,0 +1,166 @@
+"""Тренды аналитики против прямого подсчёта по периодам.
+
+Эталон повторяет calculate_trends_data, каким он был до дневной сводки:
+для каждого из 12 периодов отдельный запрос смен (с фильтрами apply_filters
+и ограничением участника своими сменами), часы и смены — по сменам со
+временем, люди — множество user_id. Отличия нынешней аналитики от него
+намеренные и заданы явно:
+
+* shiftType — по color_class самой смены, как во всех разделах аналитики
+  (раньше — join с ShiftTemplate по цвету шаблона, и смены без шаблона
+  выпадали). shift_type_source='template' включает прежнее поведение;
+* люди — без смен без пользователя (раньше None считался человеком);
+  часы и смены их по-прежнему учитывают, как и shift_stats;
+* длительность для фильтра — с учётом смен через полночь (прежний
+  extract('epoch') по времени в SQLite не работал).
+
+Без фильтра длительности build_analysis читает shift_daily_rollup, с
+фильтром — таблицу смен; проверяются оба пути.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import analytics
+from analytics import build_analysis, trend_periods
+from conftest import CALENDAR_ID, MEMBER_IDS, OWNER_ID
+from models import db, Shift, ShiftDailyRollup, ShiftTemplate
+from rollup import NO_USER, rebuild_shift_rollup
+
+DURATIONS = {
+    'short': lambda hours: hours < 4,
+    'medium': lambda hours: 4 <= hours <= 8,
+    'long': lambda hours: hours > 8,
+}
+
+
+def reference_trends(period, month, filters, only_user_id=None, shift_type_source='shift'):
+    """Часы, смены и люди по каждому периоду отдельным запросом, как прежний calculate_trends_data."""
+    result = {'hours': [], 'shifts': [], 'people': []}
+    for _, start_date, end_date in trend_periods(period, month):
+        query = Shift.query.filter(
+            Shift.calendar_id.in_([CALENDAR_ID]), Shift.date >= start_date, Shift.date <= end_date
+        )
+        if only_user_id is not None:
+            query = query.filter(Shift.user_id == only_user_id)
+        if filters.get('users'):
+            query = query.filter(Shift.user_id.in_(filters['users']))
+        if filters.get('shiftType'):
+            if shift_type_source == 'template':
+                query = query.join(ShiftTemplate).filter(ShiftTemplate.color_class.in_(filters['shiftType']))
+            else:
+                query = query.filter(Shift.color_class.in_(filters['shiftType']))
+
+        total_hours, shifts_with_time, unique_users = 0, 0, set()
+        for shift in query.all():
+            start_time = datetime.combine(shift.date, shift.start_time)
+            end_time = datetime.combine(shift.date, shift.end_time)
+            if end_time < start_time:
+                end_time += timedelta(days=1)
+            duration = (end_time - start_time).total_seconds() / 3600
+            if filters.get('duration') and not DURATIONS[filters['duration']](duration):
+                continue
+            if shift.show_time:
+                total_hours += duration
+                shifts_with_time += 1
+            if shift.user_id is not None:
+                unique_users.add(shift.user_id)
+        result['hours'].append(round(total_hours, 1))
+        result['shifts'].append(shifts_with_time)
+        result['people'].append(len(unique_users))
+    return result
+
+
+def _trends(period, month, filters, user_calendar_roles=None, user_id=OWNER_ID):
+    data = build_analysis([CALENDAR_ID], period, month, filters, user_id,
+                          user_calendar_roles or {CALENDAR_ID: 'creator'})
+    trends = data['trends_data']
+    assert trends['hours']['labels'] == [label for label, _, _ in trend_periods(period, month)]
+    return {name: trends[name]['values'] for name in ('hours', 'shifts', 'people')}
+
+
+PERIODS = [('week', '2025-W10'), ('month', '2025-03'), ('quarter', '2025-Q2'), ('year', '2025')]
+FILTERS = [
+    {},
+    {'duration': 'long'},
+    {'duration': 'short'},
+    {'duration': 'medium'},
+    {'users': [MEMBER_IDS[0], MEMBER_IDS[3]]},
+    {'shiftType': ['badge-color-2'], 'duration': 'medium'},
+]
+
+
+@pytest.mark.parametrize('period,month', PERIODS)
+@pytest.mark.parametrize('filters', FILTERS)
+def test_trends_match_per_period_computation(generated_shifts, period, month, filters):
+    assert _trends(period, month, filters) == reference_trends(period, month, filters)
+
+
+@pytest.mark.parametrize('filters', [{}, {'duration': 'long'}])
+def test_participant_trends_only_own_shifts(generated_shifts, filters):
+    user_id = MEMBER_IDS[2]
+    trends = _trends('month', '2025-03', filters, {CALENDAR_ID: 'participant'}, user_id)
+    assert trends == reference_trends('month', '2025-03', filters, only_user_id=user_id)
+    assert max(trends['people']) == 1
+
+
+def test_shift_type_by_template_color_differs_only_for_shifts_without_template(generated_shifts):
+    # Ночные смены всегда из шаблона того же цвета — прежний и нынешний фильтр совпадают
+    night = {'shiftType': ['badge-color-5']}
+    assert _trends('month', '2025-03', night) == reference_trends('month', '2025-03', night, shift_type_source='template')
+    # «Вечер» цвета badge-color-2 — без шаблона: раньше выпадал из фильтра, теперь учитывается
+    day = {'shiftType': ['badge-color-2']}
+    by_template = reference_trends('month', '2025-03', day, shift_type_source='template')
+    assert _trends('month', '2025-03', day) == reference_trends('month', '2025-03', day)
+    assert sum(_trends('month', '2025-03', day)['shifts']) > sum(by_template['shifts'])
+
+
+@pytest.mark.parametrize('filters', [{}, {'shiftType': ['badge-color-2']}, {'duration': 'long'}])
+def test_last_trend_period_matches_shift_stats(generated_shifts, filters):
+    """Последний период трендов — выбранный месяц: часы и смены как в shift_stats, со сменой без пользователя."""
+    data = build_analysis([CALENDAR_ID], 'month', '2025-03', filters, OWNER_ID, {CALENDAR_ID: 'creator'})
+    assert data['trends_data']['hours']['values'][-1] == data['shift_stats']['total_hours']
+    assert data['trends_data']['shifts']['values'][-1] == data['shift_stats']['total_shifts']
+
+
+def test_failed_trends_query_leaves_other_sections(generated_shifts, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('trends unavailable')
+
+    monkeypatch.setattr(analytics, 'trend_rows_statement', broken)
+    data = build_analysis([CALENDAR_ID], 'month', '2025-03', {}, OWNER_ID, {CALENDAR_ID: 'creator'})
+    assert data['trends_data']['hours'] == {'labels': [], 'values': []}
+    assert data['shift_stats']['total_shifts'] > 0
+
+
+def test_trends_have_data_in_every_generated_period(generated_shifts):
+    # Набор покрывает все 12 месяцев и недель, иначе сравнение ничего не доказывает
+    for period, month in PERIODS[:2]:
+        assert all(_trends(period, month, {})['shifts'])
+
+
+def _rollup_rows():
+    return sorted(tuple(row) for row in db.session.execute(select(
+        ShiftDailyRollup.user_id, ShiftDailyRollup.date, ShiftDailyRollup.color_class,
+        ShiftDailyRollup.shift_count, ShiftDailyRollup.timed_shift_count, ShiftDailyRollup.minutes
+    )))
+
+
+def test_rollup_tracks_unassigned_shifts(generated_shifts):
+    """Триггеры ведут строку NO_USER так же, как её собирает rebuild_shift_rollup."""
+    shift = db.session.scalars(select(Shift).where(Shift.user_id.is_(None))).one()
+    assert [row for row in _rollup_rows() if row[0] == NO_USER] == [
+        (NO_USER, shift.date, 'badge-color-2', 1, 1, 540)]
+
+    # День участника освобождается, чтобы смену можно было назначить ему и снять обратно
+    db.session.execute(Shift.__table__.delete().where(Shift.user_id == MEMBER_IDS[0], Shift.date == shift.date))
+    for user_id in (MEMBER_IDS[0], None):
+        shift.user_id = user_id
+        db.session.flush()
+        triggered = _rollup_rows()
+        rebuild_shift_rollup(CALENDAR_ID)
+        assert triggered == _rollup_rows()
+    db.session.delete(shift)
+    db.session.flush()
+    assert NO_USER not in {row[0] for row in _rollup_rows()}